@@ -0,0 +1,94 @@
+"""
+Measure the CPU spent turning a theme list into a response body.
+
+Compares the previous path (validate each document into Theme, then let FastAPI
+validate the result against response_model and encode it with JSONResponse) with
+the fast path (from_store + json_response). Uses synthetic themes, so it needs
+no Firestore or API keys:
+
+    python bench_serialization.py                      # 50 themes x 12 posts
+    python bench_serialization.py --themes 100 --posts 24 --rounds 50
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from typing import Dict, List
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from models.theme import Theme
+from services.serialization import from_store_all, json_response
+
+def make_theme(posts_count: int) -> Dict:
+    """A stored theme document with its posts attached, as get_user_themes sees it"""
+    theme_id = str(uuid.uuid4())
+    return {
+        'id': theme_id,
+        'user_id': 'user-1',
+        'brand_id': 'brand-1',
+        'name': 'Autumn Harvest',
+        'posts_count': posts_count,
+        'mood': 'warm, cozy',
+        'colors': ['#C0672F', '#F2D6A2', '#5A3E2B'],
+        'imagery': 'rustic tables, seasonal produce, soft morning light',
+        'tone': 'friendly',
+        'caption_length': 'medium',
+        'use_emojis': True,
+        'use_hashtags': True,
+        'generated_posts': posts_count,
+        'selected_posts': 2,
+        'cover_image_url': f'https://storage.googleapis.com/bucket/{theme_id}/0.png',
+        'created_at': '2026-10-01T09:00:00',
+        'updated_at': '2026-10-02T10:30:00',
+        'posts': [
+            {
+                'id': str(uuid.uuid4()),
+                'theme_id': theme_id,
+                'image_url': f'https://storage.googleapis.com/bucket/{theme_id}/{i}.png',
+                'thumbnail_url': f'https://storage.googleapis.com/bucket/{theme_id}/{i}_thumbnail.webp',
+                'medium_url': f'https://storage.googleapis.com/bucket/{theme_id}/{i}_medium.webp',
+                'caption': '가을 햇살 아래 갓 구운 빵과 따뜻한 커피 한 잔으로 하루를 시작해 보세요. ' * 3,
+                'hashtags': ['#autumn', '#bakery', '#coffee', '#morning', '#cozy'],
+                'post_type': 'product',
+                'selected': i < 2,
+                'scheduled_time': None,
+                'status': 'draft'
+            }
+            for i in range(posts_count)
+        ]
+    }
+
+async def previous_path(field, docs: List[Dict]) -> bytes:
+    content = [Theme(**theme_data) for theme_data in docs]
+    body = await serialize_response(field=field, response_content=content)
+    return JSONResponse(body).body
+
+async def fast_path(docs: List[Dict]) -> bytes:
+    return json_response(from_store_all(Theme, docs)).body
+
+async def measure(label: str, run, rounds: int) -> float:
+    await run()  # warm up (validator and field plan caches)
+    start = time.process_time()
+    for _ in range(rounds):
+        body = await run()
+    per_request = (time.process_time() - start) / rounds * 1000
+    print(f"{label:<14} {per_request:8.2f} ms CPU/request   {len(body) / 1024:8.1f} KB")
+    return per_request
+
+async def main(themes: int, posts: int, rounds: int):
+    docs = [make_theme(posts) for _ in range(themes)]
+    field = create_model_field(name='Response_get_user_themes', type_=List[Theme], mode='serialization')
+
+    print(f"{themes} themes x {posts} posts, {rounds} rounds")
+    before = await measure('previous path', lambda: previous_path(field, docs), rounds)
+    after = await measure('fast path', lambda: fast_path(docs), rounds)
+    print(f"saved          {before - after:8.2f} ms CPU/request ({(1 - after / before) * 100:.0f}%)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark theme list serialization')
+    parser.add_argument('--themes', type=int, default=50)
+    parser.add_argument('--posts', type=int, default=12)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.themes, args.posts, args.rounds))
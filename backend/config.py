@@ -5,6 +5,7 @@ class Settings(BaseSettings):
     # App settings
     app_name: str = "TacitSNS API"
     debug: bool = True
+    admin_token: str = ""  # bearer token for /stats, /metrics and /debug/traces ("" = endpoints disabled)
 
     # OpenAI settings
     openai_api_key: str
@@ -12,9 +13,99 @@ class Settings(BaseSettings):
     # Gemini settings
     gemini_api_key: str
 
+    # Gemini HTTP client settings (shared connection pool)
+    gemini_http2: bool = False
+    gemini_max_connections: int = 20
+    gemini_max_keepalive_connections: int = 10
+    gemini_keepalive_expiry: float = 30.0
+    gemini_connect_timeout: float = 10.0
+    gemini_image_timeout: float = 60.0
+    gemini_caption_timeout: float = 30.0
+
     # Firebase settings
     firebase_credentials_path: str = "firebase-credentials.json"
     firebase_storage_bucket: str
+    storage_upload_workers: int = 8
+
+    # Image derivatives (WebP thumbnail and medium size, rendered at upload time)
+    image_derivatives: bool = True
+    thumbnail_size: int = 320
+    medium_image_size: int = 1080
+    webp_quality: int = 80
+    derivative_workers: int = 2
+
+    # Upload spool (images whose Storage upload failed, served locally until a retry succeeds)
+    api_base_url: str = "http://localhost:8000"  # public URL of this API, used in temporary image URLs
+    upload_spool_dir: str = "upload_spool"
+    upload_retry_interval: float = 5.0
+    upload_retry_base_delay: float = 10.0
+    upload_retry_max_delay: float = 600.0
+    upload_spool_retention_seconds: int = 7 * 24 * 3600  # keep redirects to uploaded images this long
+
+    # Provider rate limits (token bucket requests/minute + adaptive concurrency ceiling)
+    gemini_image_rpm: int = 60
+    gemini_image_max_concurrency: int = 8
+    gemini_text_rpm: int = 600
+    gemini_text_max_concurrency: int = 16
+    openai_rpm: int = 500
+    openai_max_concurrency: int = 8
+    rate_limit_cooldown_seconds: float = 5.0
+
+    # Image generation retries and hedging
+    image_retry_attempts: int = 3
+    image_attempt_timeout: float = 45.0
+    image_total_budget: float = 120.0
+    image_hedging: bool = True
+    retry_base_delay: float = 0.5
+    retry_max_delay: float = 8.0
+    hedge_quantile: float = 0.95
+    hedge_min_samples: int = 20
+    hedge_budget_ratio: float = 0.1  # at most 10% extra image requests
+
+    # Generated image cache
+    image_cache_ttl_seconds: int = 7 * 24 * 3600
+    image_cache_max_entries: int = 512
+    image_cache_max_bytes: int = 256 * 1024 * 1024
+    image_cache_persistent: bool = False
+
+    # Caption pool cache
+    caption_pool_size: int = 5
+    caption_pool_max_uses: int = 3
+    caption_pool_ttl_seconds: int = 3600
+    caption_pool_max_keys: int = 256
+
+    # Document cache (brands/themes) and ownership index
+    document_cache_ttl_seconds: int = 300
+    document_cache_max_entries: int = 1024
+    owner_index_ttl_seconds: int = 3600
+    owner_index_max_entries: int = 8192
+
+    # Theme parameter cache (OpenAI)
+    theme_params_cache_ttl_seconds: int = 24 * 3600
+    theme_params_cache_max_entries: int = 256
+
+    # Generation job queue (SQLite file shared by the API and worker processes)
+    job_queue_path: str = "jobs.db"
+    job_workers: int = 2  # 0 = this process only submits jobs (run worker.py separately)
+    job_poll_interval: float = 0.5
+    job_lease_seconds: float = 60.0
+    job_max_attempts: int = 3
+
+    # SSE client disconnects (a job nobody follows any more is cancelled after the grace period)
+    stream_disconnect_poll_interval: float = 1.0
+    stream_disconnect_grace_seconds: float = 5.0  # leaves time for an EventSource reconnect to resume
+
+    # Tracing (spans kept in memory for /debug/traces and appended to trace_file; "" disables the file)
+    trace_file: str = "traces.jsonl"
+    trace_recent_max: int = 200
+
+    # List pagination (brands/themes)
+    default_page_size: int = 20
+    max_page_size: int = 100
+
+    # Post generation settings
+    post_generation_concurrency: int = 4
+    max_post_generation_concurrency: int = 12
 
     class Config:
         env_file = ".env"
@@ -1,3 +1,4 @@
 from .auth import get_current_user_id
+from .admin import require_admin
 
-__all__ = ['get_current_user_id']
+__all__ = ['get_current_user_id', 'require_admin']
@@ -0,0 +1,25 @@
+import secrets
+from fastapi import Header, HTTPException, status
+from config import get_settings
+
+settings = get_settings()
+
+async def require_admin(authorization: str = Header(None)) -> None:
+    """
+    Guard operational endpoints (/stats, /metrics, /debug/traces).
+
+    With ADMIN_TOKEN set, requests must send "Authorization: Bearer <ADMIN_TOKEN>"
+    (which Prometheus can send from its scrape config). Without it, the endpoints
+    do not exist: they expose other users' request paths and IDs, so they are never
+    open by default.
+    """
+    if not settings.admin_token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+
+    scheme, _, token = (authorization or '').partition(' ')
+    if scheme.lower() != 'bearer' or not secrets.compare_digest(token, settings.admin_token):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Admin token required",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
@@ -1,5 +1,5 @@
 import firebase_admin
-from firebase_admin import credentials, firestore, storage, auth
+from firebase_admin import credentials, firestore, firestore_async, storage, auth
 from config import get_settings
 import os
 
@@ -34,6 +34,11 @@ def get_firestore_client():
     # Get client for default database
     return firestore.client()
 
+# Async Firestore client
+def get_async_firestore_client():
+    """Get async Firestore client instance (non-blocking, for use inside async handlers)"""
+    return firestore_async.client()
+
 # Storage client
 def get_storage_bucket():
     """Get Firebase Storage bucket instance"""
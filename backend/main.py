@@ -1,18 +1,55 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from middleware import CompressionMiddleware, MetricsMiddleware, TracingMiddleware
+from dependencies import require_admin
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import os
+from typing import Optional
 
 # Load environment variables
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared clients on startup and close them on shutdown"""
+    from services.gemini_service import gemini_generator
+    from services.storage_service import storage_service
+    from services.job_queue import job_queue
+    from services.upload_spool import upload_spool
+    from services.tracing import tracer
+
+    await gemini_generator.start()
+    await job_queue.start()
+    await upload_spool.start()
+    try:
+        yield
+    finally:
+        await upload_spool.stop()
+        await job_queue.stop()
+        await gemini_generator.close()
+        storage_service.shutdown()
+        tracer.shutdown()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="TacitSNS API",
     description="Backend API for TacitSNS",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
+# Gzip JSON responses larger than 1 KB (SSE streams are left uncompressed)
+app.add_middleware(CompressionMiddleware, minimum_size=1000)
+
+# Root trace span per request (inside MetricsMiddleware, which resolves the route it is named after)
+app.add_middleware(TracingMiddleware)
+
+# Label metrics with the route each request is for (outermost but CORS, so it times the whole request)
+app.add_middleware(MetricsMiddleware)
+
 # CORS middleware - configure this based on your frontend URL
 app.add_middleware(
     CORSMiddleware,
@@ -24,10 +61,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # Import routers
-from routers import llm, example, auth, brands, themes
+from routers import llm, example, auth, brands, themes, posts, jobs, uploads
 
 @app.get("/")
 async def root():
@@ -37,12 +75,53 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/stats", dependencies=[Depends(require_admin)], include_in_schema=False)
+async def provider_stats():
+    """Provider rate limiter state, image retry/hedging counters, request coalescing, the upload spool and jobs"""
+    from services.gemini_service import gemini_generator
+    from services.openai_service import openai_generator
+    from services.rate_limiter import rate_limiters
+    from services.upload_spool import upload_spool
+    from services.job_queue import job_queue
+
+    return {
+        "rate_limiters": rate_limiters.stats(),
+        "image_generation": gemini_generator.image_caller.stats(),
+        "single_flight": {
+            flights.name: flights.stats()
+            for flights in (gemini_generator.image_flights, openai_generator.flights)
+        },
+        "upload_spool": upload_spool.stats(),
+        "jobs": job_queue.stats()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_admin)], include_in_schema=False)
+async def prometheus_metrics():
+    """Latency histograms, throughput counters and in-flight gauges in the Prometheus text format"""
+    from services.metrics import metrics
+
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/traces", dependencies=[Depends(require_admin)], include_in_schema=False)
+async def slowest_traces(limit: int = Query(10, ge=1, le=100), name: Optional[str] = None):
+    """
+    The slowest recent traces (requests and generation jobs) with all their spans
+
+    Filter by root span name, e.g. `job.posts` or `GET /api/themes/{theme_id}/generate-posts-stream`.
+    """
+    from services.tracing import tracer
+
+    return tracer.slowest(limit, name)
+
 # Register routers
 app.include_router(llm.router, prefix="/api/llm", tags=["llm"])
 app.include_router(example.router, prefix="/api/example", tags=["example"])
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(brands.router, prefix="/api/brands", tags=["brands"])
 app.include_router(themes.router, prefix="/api/themes", tags=["themes"])
+app.include_router(posts.router, prefix="/api/posts", tags=["posts"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
+app.include_router(uploads.router, prefix="/api/uploads", tags=["uploads"])
 
 if __name__ == "__main__":
     import uvicorn
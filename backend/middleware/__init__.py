@@ -0,0 +1,6 @@
+# Middleware module
+from .compression import CompressionMiddleware
+from .metrics import MetricsMiddleware
+from .tracing import TracingMiddleware
+
+__all__ = ['CompressionMiddleware', 'MetricsMiddleware', 'TracingMiddleware']
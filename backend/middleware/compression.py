@@ -0,0 +1,23 @@
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+class CompressionMiddleware:
+    """
+    Gzip responses the client accepts compressed, except Server-Sent Event streams
+
+    Gzip buffers its output, which would hold SSE events back until enough data has
+    accumulated, so requests that accept text/event-stream are passed through as-is.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1000, compresslevel: int = 6):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=compresslevel)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            accept = dict(scope["headers"]).get(b"accept", b"")
+            if b"text/event-stream" not in accept:
+                await self.gzip(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
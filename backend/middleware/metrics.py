@@ -0,0 +1,51 @@
+import time
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from services.metrics import current_endpoint, http_request_seconds
+
+
+class MetricsMiddleware:
+    """
+    Label everything a request does with its route and record the request's duration
+
+    The route's path template (e.g. /api/themes/{theme_id}) is used rather than the
+    raw path, so IDs do not create a label value per document.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = self._route_path(scope)
+        token = current_endpoint.set(endpoint)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_request_seconds.observe(
+                time.perf_counter() - start,
+                endpoint=endpoint,
+                method=scope["method"],
+                status=str(status)
+            )
+            current_endpoint.reset(token)
+
+    def _route_path(self, scope: Scope) -> str:
+        app = scope.get("app")
+        for route in getattr(getattr(app, "router", None), "routes", []):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", scope["path"])
+        return "unmatched"
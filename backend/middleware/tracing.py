@@ -0,0 +1,30 @@
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from services.metrics import current_endpoint
+from services.tracing import tracer
+
+# Endpoints that would only crowd out the traces worth looking at
+UNTRACED_PATHS = ('/metrics', '/health', '/debug/traces')
+
+
+class TracingMiddleware:
+    """
+    Open a root span per HTTP request; spans of the work it does (and the tasks it starts) nest under it
+
+    Must run inside MetricsMiddleware, which resolves the route the span is named after.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in UNTRACED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        with tracer.span(f"{scope['method']} {current_endpoint.get()}", root=True, path=scope["path"]) as span:
+            async def send_with_status(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    span.set(status_code=message["status"])
+                await send(message)
+
+            await self.app(scope, receive, send_with_status)
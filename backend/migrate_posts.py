@@ -0,0 +1,105 @@
+"""
+Move embedded theme posts into the posts subcollection.
+
+Themes created before posts became individual documents keep them in a `posts`
+array on the theme. For each such theme this writes every post to
+themes/{theme_id}/posts, stores the post counts and cover image on the theme and
+then removes the array. Themes are also migrated on their next write, so running
+this is safe at any time and can be repeated:
+
+    python migrate_posts.py              # migrate every theme
+    python migrate_posts.py --dry-run    # only report what would be migrated
+    python migrate_posts.py --theme-id <id>
+
+Themes and brands missing the field their lists are ordered by (`created_at`,
+`created_date`) get it as well, since paginated queries leave such documents out.
+
+Documents are read and migrated one page at a time (--page-size), so memory use
+does not grow with the number of themes.
+"""
+import argparse
+import asyncio
+from services.firestore_service import firestore_service
+from services.post_service import post_service
+
+# Stored on documents that predate their list's ordering field (sorts them oldest)
+EPOCH = '1970-01-01T00:00:00'
+
+async def backfill_order_field(collection: str, doc_id: str, data: dict, field: str, dry_run: bool) -> bool:
+    """Give a document the field its list is ordered by; returns whether it was missing"""
+    if data.get(field):
+        return False
+    value = data.get('updated_at') or EPOCH
+    if dry_run:
+        print(f"Would set {field} of {collection}/{doc_id} to {value}")
+        return True
+    await firestore_service.update_document(collection, doc_id, {field: value})
+    print(f"✅ Set {field} of {collection}/{doc_id} to {value}")
+    return True
+
+async def migrate_theme(theme_id: str, theme_data: dict, dry_run: bool) -> bool:
+    """Migrate one theme; returns whether anything needed migrating"""
+    changed = await backfill_order_field('themes', theme_id, theme_data, 'created_at', dry_run)
+    if 'posts' not in theme_data:
+        return changed
+
+    posts = [post for post in theme_data['posts'] or [] if post]
+    if dry_run:
+        print(f"Would migrate theme {theme_id}: {len(posts)} posts")
+        return True
+
+    await post_service.store_theme_posts(theme_id, theme_data['user_id'], posts)
+    print(f"✅ Migrated theme {theme_id}: {len(posts)} posts")
+    return True
+
+async def documents(collection: str, doc_id: str = None, page_size: int = 100):
+    """Yield (id, data) of one document, or of every document reading page_size per query"""
+    if doc_id:
+        data = await firestore_service.get_document(collection, doc_id)
+        if data:
+            yield doc_id, data
+        return
+
+    query = firestore_service.db.collection(collection).order_by('__name__').limit(page_size)
+    last = None
+    while True:
+        page = query.start_after(last) if last is not None else query
+        docs = [doc async for doc in page.stream()]
+        for doc in docs:
+            yield doc.id, doc.to_dict()
+        if len(docs) < page_size:
+            return
+        last = docs[-1]
+
+async def main(theme_id: str = None, dry_run: bool = False, page_size: int = 100):
+    migrated = failed = total = 0
+
+    async for doc_id, theme_data in documents('themes', theme_id, page_size):
+        total += 1
+        try:
+            if await migrate_theme(doc_id, theme_data, dry_run):
+                migrated += 1
+        except Exception as e:
+            failed += 1
+            print(f"❌ Failed to migrate theme {doc_id}: {e}")
+
+    verb = "would be migrated" if dry_run else "migrated"
+    print(f"{migrated} of {total} themes {verb}, {failed} failed")
+
+    if theme_id:
+        return
+    backfilled = 0
+    async for doc_id, brand_data in documents('brands', page_size=page_size):
+        try:
+            backfilled += await backfill_order_field('brands', doc_id, brand_data, 'created_date', dry_run)
+        except Exception as e:
+            print(f"❌ Failed to migrate brand {doc_id}: {e}")
+    print(f"{backfilled} brands {verb}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move embedded theme posts into the posts subcollection")
+    parser.add_argument("--theme-id", help="Only migrate this theme")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be migrated without writing")
+    parser.add_argument("--page-size", type=int, default=100, help="Documents read per query")
+    args = parser.parse_args()
+    asyncio.run(main(args.theme_id, args.dry_run, args.page_size))
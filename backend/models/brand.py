@@ -39,3 +39,13 @@ class Brand(BrandBase):
 
     class Config:
         from_attributes = True
+
+class BrandSummary(BaseModel):
+    """Brand as shown in lists, without reference images or descriptive text"""
+    id: str
+    user_id: str
+    name: str
+    category: str
+    logo_image: Optional[str] = None
+    created_date: str
+    updated_at: Optional[str] = None
@@ -0,0 +1,31 @@
+from pydantic import BaseModel
+from typing import Optional, List, Dict, Any
+
+class JobCreate(BaseModel):
+    """Model for submitting a generation job"""
+    kind: str  # theme_options, posts, regenerated_images
+    params: Dict[str, Any] = {}
+
+class Job(BaseModel):
+    """Generation job status"""
+    id: str
+    kind: str
+    user_id: str
+    params: Dict[str, Any]
+    status: str  # queued, running, cancelling, complete, error, cancelled
+    attempts: int
+    event_count: int
+    error: Optional[str] = None
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+class JobEvent(BaseModel):
+    """One progress event produced by a job"""
+    seq: int
+    data: Dict[str, Any]
+
+class JobEvents(BaseModel):
+    """A job's status plus the events after the requested sequence number"""
+    job: Job
+    events: List[JobEvent]
@@ -7,6 +7,8 @@ class PostData(BaseModel):
     id: str
     theme_id: str
     image_url: str
+    thumbnail_url: Optional[str] = None
+    medium_url: Optional[str] = None
     caption: str
     hashtags: List[str]
     post_type: str
@@ -14,6 +16,17 @@ class PostData(BaseModel):
     scheduled_time: Optional[str] = None
     status: Optional[str] = 'draft'  # draft, scheduled, published
 
+class PostUpdate(BaseModel):
+    """Model for updating a single post"""
+    image_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    medium_url: Optional[str] = None
+    caption: Optional[str] = None
+    hashtags: Optional[List[str]] = None
+    selected: Optional[bool] = None
+    scheduled_time: Optional[str] = None
+    status: Optional[str] = None
+
 class ThemeBase(BaseModel):
     """Base theme model"""
     brand_id: str
@@ -54,3 +67,20 @@ class Theme(ThemeBase):
 
     class Config:
         from_attributes = True
+
+class ThemeSummary(BaseModel):
+    """Theme as shown in lists: counts and a cover image instead of the posts"""
+    id: str
+    brand_id: str
+    user_id: str
+    name: str
+    posts_count: int
+    mood: str
+    colors: List[str]
+    tone: str
+    generated_posts: int = 0
+    selected_posts: int = 0
+    cover_image_url: Optional[str] = None
+    cover_thumbnail_url: Optional[str] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
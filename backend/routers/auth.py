@@ -1,12 +1,11 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from firebase_config import get_firestore_client
+from services.firestore_service import firestore_service
 from dependencies.auth import get_current_user_id
 from datetime import datetime
 import uuid
 
 router = APIRouter()
-db = get_firestore_client()
 
 class UsernameLogin(BaseModel):
     """Simple username login for HCI study"""
@@ -35,12 +34,10 @@ async def login_with_username(login_data: UsernameLogin):
     user_id = f"user_{username.lower().replace(' ', '_')}"
 
     # Check if user exists in Firestore
-    user_ref = db.collection('users').document(user_id)
-    user_doc = user_ref.get()
+    user_data = await firestore_service.get_document('users', user_id)
 
-    if user_doc.exists:
+    if user_data is not None:
         # User exists, return their profile
-        user_data = user_doc.to_dict()
         return UserProfile(**user_data)
     else:
         # Create new user
@@ -49,17 +46,14 @@ async def login_with_username(login_data: UsernameLogin):
             "username": username,
             "created_at": datetime.utcnow().isoformat()
         }
-        user_ref.set(user_profile)
+        await firestore_service.set_document('users', user_id, user_profile)
         return UserProfile(**user_profile)
 
 @router.get("/me", response_model=UserProfile)
 async def get_current_user_profile(user_id: str = Depends(get_current_user_id)):
     """Get current user's profile (protected route example)"""
-    user_ref = db.collection('users').document(user_id)
-    user_doc = user_ref.get()
+    user_data = await firestore_service.get_document('users', user_id)
 
-    if not user_doc.exists:
+    if user_data is None:
         raise HTTPException(status_code=404, detail="User not found")
-
-    user_data = user_doc.to_dict()
     return UserProfile(**user_data)
@@ -1,13 +1,19 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
-from firebase_config import get_firestore_client
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response
+from typing import Dict, List, Optional
+from config import get_settings
+from services.firestore_service import firestore_service
+from services.http_cache import conditional, document_version, make_etag
+from services.serialization import from_store, from_store_all, json_response
+from services.openai_service import openai_generator, BRAND_PROMPT_FIELDS
+from services.theme_summary import BRAND_SUMMARY_FIELDS
 from dependencies.auth import get_current_user_id
-from models.brand import Brand, BrandCreate, BrandUpdate
+from models.brand import Brand, BrandCreate, BrandSummary, BrandUpdate
 from datetime import datetime
 import uuid
 
+settings = get_settings()
+
 router = APIRouter()
-db = get_firestore_client()
 
 @router.post("/", response_model=Brand)
 async def create_brand(brand_data: BrandCreate, user_id: str = Depends(get_current_user_id)):
@@ -23,50 +29,113 @@ async def create_brand(brand_data: BrandCreate, user_id: str = Depends(get_curre
     })
 
     # Save to Firestore
-    db.collection('brands').document(brand_id).set(brand_dict)
+    await firestore_service.set_document('brands', brand_id, brand_dict)
 
     return Brand(**brand_dict)
 
-@router.get("/", response_model=List[Brand])
-async def get_user_brands(user_id: str = Depends(get_current_user_id)):
-    """Get all brands for the authenticated user"""
-    brands_ref = db.collection('brands').where('user_id', '==', user_id).stream()
-
-    brands = []
-    for doc in brands_ref:
-        brand_data = doc.to_dict()
-        brands.append(Brand(**brand_data))
+async def query_brands(
+    user_id: str,
+    limit: Optional[int],
+    cursor: Optional[str],
+    order: str,
+    response: Response,
+    fields: Optional[List[str]] = None
+) -> List[Dict]:
+    """Fetch one page of the user's brands, ordered by created_date, and set X-Next-Cursor"""
+    try:
+        brands_docs, next_cursor = await firestore_service.query_page(
+            'brands',
+            [('user_id', '==', user_id)],
+            order_by='created_date',
+            limit=limit,
+            cursor=cursor,
+            descending=order == 'desc',
+            fields=fields,
+            id_field='id'
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return brands_docs
 
-    return brands
+@router.get("/", response_model=List[Brand])
+async def get_user_brands(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=settings.max_page_size),
+    cursor: Optional[str] = None,
+    order: str = Query('asc', pattern='^(asc|desc)$'),
+    if_none_match: Optional[str] = Header(None),
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    Get the authenticated user's brands, oldest first by default
+
+    Without a limit every brand is returned; with one, the cursor of the next page
+    is sent in the X-Next-Cursor header. The ETag covers each brand's updated_at.
+    """
+    brands_docs = await query_brands(user_id, limit, cursor, order, response)
+
+    etag = make_etag('brands', user_id, limit, cursor, order, [
+        (brand_data['id'], document_version(brand_data)) for brand_data in brands_docs
+    ])
+    not_modified = conditional(response, if_none_match, etag)
+    if not_modified:
+        return not_modified
+
+    return json_response(from_store_all(Brand, brands_docs), response)
+
+@router.get("/summary", response_model=List[BrandSummary])
+async def get_user_brand_summaries(
+    response: Response,
+    limit: int = Query(settings.default_page_size, ge=1, le=settings.max_page_size),
+    cursor: Optional[str] = None,
+    order: str = Query('asc', pattern='^(asc|desc)$'),
+    if_none_match: Optional[str] = Header(None),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Get one page of the authenticated user's brands with only the fields shown in lists"""
+    brands_docs = await query_brands(user_id, limit, cursor, order, response, BRAND_SUMMARY_FIELDS)
+
+    etag = make_etag('brand-summaries', user_id, limit, cursor, order, brands_docs)
+    not_modified = conditional(response, if_none_match, etag)
+    if not_modified:
+        return not_modified
+
+    return json_response(from_store_all(BrandSummary, brands_docs), response)
 
 @router.get("/{brand_id}", response_model=Brand)
-async def get_brand(brand_id: str, user_id: str = Depends(get_current_user_id)):
-    """Get a specific brand by ID"""
-    brand_ref = db.collection('brands').document(brand_id)
-    brand_doc = brand_ref.get()
-
-    if not brand_doc.exists:
+async def get_brand(
+    brand_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Get a specific brand by ID (304 if the client's ETag is current)"""
+    brand_data = await firestore_service.get_document('brands', brand_id)
+
+    if brand_data is None:
         raise HTTPException(status_code=404, detail="Brand not found")
 
-    brand_data = brand_doc.to_dict()
-
     # Verify ownership
     if brand_data.get('user_id') != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to access this brand")
 
-    return Brand(**brand_data)
+    not_modified = conditional(response, if_none_match, make_etag('brand', brand_id, document_version(brand_data)))
+    if not_modified:
+        return not_modified
+
+    return json_response(from_store(Brand, brand_data), response)
 
 @router.put("/{brand_id}", response_model=Brand)
 async def update_brand(brand_id: str, brand_update: BrandUpdate, user_id: str = Depends(get_current_user_id)):
     """Update a brand"""
-    brand_ref = db.collection('brands').document(brand_id)
-    brand_doc = brand_ref.get()
+    brand_data = await firestore_service.get_document('brands', brand_id)
 
-    if not brand_doc.exists:
+    if brand_data is None:
         raise HTTPException(status_code=404, detail="Brand not found")
 
-    brand_data = brand_doc.to_dict()
-
     # Verify ownership
     if brand_data.get('user_id') != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to update this brand")
@@ -75,27 +144,29 @@ async def update_brand(brand_id: str, brand_update: BrandUpdate, user_id: str =
     update_data = brand_update.model_dump(exclude_unset=True)
     update_data['updated_at'] = datetime.utcnow().isoformat()
 
-    brand_ref.update(update_data)
+    await firestore_service.update_document('brands', brand_id, update_data)
+
+    # Cached theme suggestions are stale once any field used in the prompt changes
+    if any(field in update_data and update_data[field] != brand_data.get(field) for field in BRAND_PROMPT_FIELDS):
+        openai_generator.invalidate_brand(brand_id)
 
-    # Get updated brand
-    updated_doc = brand_ref.get()
-    return Brand(**updated_doc.to_dict())
+    # Merge locally instead of reading the brand back
+    updated_data = {**brand_data, **update_data}
+    return Brand(**updated_data)
 
 @router.delete("/{brand_id}")
 async def delete_brand(brand_id: str, user_id: str = Depends(get_current_user_id)):
     """Delete a brand"""
-    brand_ref = db.collection('brands').document(brand_id)
-    brand_doc = brand_ref.get()
+    owner_id = await firestore_service.get_owner('brands', brand_id)
 
-    if not brand_doc.exists:
+    if owner_id is None:
         raise HTTPException(status_code=404, detail="Brand not found")
 
-    brand_data = brand_doc.to_dict()
-
     # Verify ownership
-    if brand_data.get('user_id') != user_id:
+    if owner_id != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this brand")
 
-    brand_ref.delete()
+    await firestore_service.delete_document('brands', brand_id)
+    openai_generator.invalidate_brand(brand_id)
 
     return {"message": "Brand deleted successfully"}
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from firebase_config import get_firestore_client, get_storage_bucket
+from services.firestore_service import firestore_service
 from datetime import datetime
 
 router = APIRouter()
@@ -17,15 +17,12 @@ async def log_user_activity(activity: UserActivity):
     Example endpoint: Log user activity to Firestore
     """
     try:
-        db = get_firestore_client()
-
         # Add timestamp if not provided
         if not activity.timestamp:
             activity.timestamp = datetime.utcnow().isoformat()
 
         # Store in Firestore
-        doc_ref = db.collection('user_activities').document()
-        doc_ref.set({
+        activity_id = await firestore_service.add_document('user_activities', {
             'user_id': activity.user_id,
             'action': activity.action,
             'timestamp': activity.timestamp
@@ -33,7 +30,7 @@ async def log_user_activity(activity: UserActivity):
 
         return {
             "message": "Activity logged successfully",
-            "activity_id": doc_ref.id
+            "activity_id": activity_id
         }
 
     except Exception as e:
@@ -45,18 +42,13 @@ async def get_user_activities(user_id: str, limit: int = 10):
     Example endpoint: Get user activities from Firestore
     """
     try:
-        db = get_firestore_client()
-
         # Query Firestore
-        activities_ref = db.collection('user_activities')
-        query = activities_ref.where('user_id', '==', user_id).limit(limit)
-
-        # Get results
-        activities = []
-        for doc in query.stream():
-            activity_data = doc.to_dict()
-            activity_data['id'] = doc.id
-            activities.append(activity_data)
+        activities = await firestore_service.query_documents(
+            'user_activities',
+            [('user_id', '==', user_id)],
+            limit=limit,
+            id_field='id'
+        )
 
         return {
             "user_id": user_id,
@@ -0,0 +1,57 @@
+from fastapi import APIRouter, HTTPException, Depends
+from dependencies.auth import get_current_user_id
+from models.job import Job, JobCreate, JobEvent, JobEvents
+from services import generation_jobs  # registers the generation job handlers
+from services.job_queue import job_queue, JobValidationError
+
+router = APIRouter()
+
+async def get_owned_job(job_id: str, user_id: str):
+    """Load a job, checking that it belongs to the user"""
+    job = await job_queue.get(job_id)
+
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    # Verify ownership
+    if job.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this job")
+
+    return job
+
+@router.post("/", response_model=Job)
+async def submit_job(job_data: JobCreate, user_id: str = Depends(get_current_user_id)):
+    """
+    Queue a generation job.
+    Kinds: `theme_options` (brand_id), `posts` (theme_id) and `regenerated_images`,
+    with the same parameters as the matching stream endpoints.
+    """
+    try:
+        job = await job_queue.submit(job_data.kind, user_id, job_data.params)
+    except JobValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return Job(**job.to_dict())
+
+@router.get("/{job_id}", response_model=Job)
+async def get_job(job_id: str, user_id: str = Depends(get_current_user_id)):
+    """Get a job's status"""
+    job = await get_owned_job(job_id, user_id)
+    return Job(**job.to_dict())
+
+@router.get("/{job_id}/events", response_model=JobEvents)
+async def get_job_events(job_id: str, after: int = 0, user_id: str = Depends(get_current_user_id)):
+    """Poll a job: its status plus every event after sequence number `after`"""
+    job = await get_owned_job(job_id, user_id)
+    events = await job_queue.events(job_id, after)
+    return JobEvents(
+        job=Job(**job.to_dict()),
+        events=[JobEvent(seq=seq, data=data) for seq, data in events]
+    )
+
+@router.post("/{job_id}/cancel", response_model=Job)
+async def cancel_job(job_id: str, user_id: str = Depends(get_current_user_id)):
+    """Cancel a queued or running job"""
+    await get_owned_job(job_id, user_id)
+    job = await job_queue.cancel(job_id)
+    return Job(**job.to_dict())
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends, Query
+from typing import List, Optional
+from config import get_settings
+from dependencies.auth import get_current_user_id
+from models.theme import PostData
+from services.post_service import post_service
+from services.serialization import from_store_all, json_response
+
+settings = get_settings()
+
+router = APIRouter()
+
+@router.get("/", response_model=List[PostData])
+async def get_user_posts(
+    status: Optional[str] = None,
+    scheduled_from: Optional[str] = None,
+    scheduled_to: Optional[str] = None,
+    limit: int = Query(settings.default_page_size, ge=1, le=settings.max_page_size),
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    Get the authenticated user's posts across all themes
+
+    Filter by status and/or a scheduled_time range (ISO timestamps, from inclusive,
+    to exclusive); with a range, posts come back in schedule order. Posts of themes
+    that have not been migrated to the posts collection are not included.
+    """
+    posts = await post_service.query_posts(user_id, status, scheduled_from, scheduled_to, limit)
+    return json_response(from_store_all(PostData, posts))
@@ -1,32 +1,89 @@
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import StreamingResponse
-from typing import List
-from firebase_config import get_firestore_client
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response
+from typing import Callable, Dict, List, Optional
+from config import get_settings
 from dependencies.auth import get_current_user_id
-from models.theme import Theme, ThemeCreate, ThemeUpdate
-from services.gemini_service import gemini_generator
-from services.openai_service import OpenAIThemeGenerator
+from models.theme import PostData, PostUpdate, Theme, ThemeCreate, ThemeSummary, ThemeUpdate
+from services.firestore_service import firestore_service
+from services.http_cache import conditional, document_version, make_etag
+from services.serialization import from_store, from_store_all, json_response
+from services.post_service import post_service
+from services.theme_summary import THEME_SUMMARY_FIELDS, post_summary
+from services import generation_jobs  # registers the generation job handlers
+from services.job_queue import job_queue
+from services.metrics import sse_complete_seconds, sse_first_event_seconds, sse_streams_open
+from services.tracing import tracer
+from services.sse import format_sse, sse_response
 from datetime import datetime
+import time
 import uuid
-import json
-import asyncio
+
+settings = get_settings()
 
 router = APIRouter()
-db = get_firestore_client()
-openai_generator = OpenAIThemeGenerator()
+
+async def job_event_stream(
+    request: Request,
+    kind: str,
+    user_id: str,
+    params: Dict,
+    last_event_id: Optional[str] = None,
+    on_finish: Optional[Callable[[], None]] = None
+):
+    """
+    Submit a generation job (or resume one from Last-Event-ID) and stream its events as SSE
+
+    Event IDs have the form "{job_id}:{seq}", so the browser's automatic reconnect
+    continues after the last event it received. A Last-Event-ID is only honoured for
+    the user's job of the same kind and params (a reconnect repeats the same URL);
+    otherwise a new job is submitted. If the client disconnects and does not
+    reconnect within the grace period, the job is cancelled.
+    """
+    started = time.perf_counter()
+    job, after = None, 0
+    if last_event_id:
+        job_id, _, seq = last_event_id.rpartition(':')
+        job = await job_queue.get(job_id)
+        if job is not None and job.user_id == user_id and job.kind == kind and job.params == params:
+            after = int(seq) if seq.isdigit() else 0
+            print(f"✅ Resuming {kind} job {job_id} after event {after}")
+        else:
+            job = None
+
+    if job is None:
+        job = await job_queue.submit(kind, user_id, params)
+    if tracer.current_span is not None:
+        # The job runs as its own trace; link this request to it
+        tracer.current_span.set(job_id=job.id, resumed_after=after)
+
+    async def event_generator():
+        follower = job_queue.attach(job.id)
+        disconnected, first_event, payload = True, True, {}
+        try:
+            with sse_streams_open.track(), sse_complete_seconds.time() as labels:
+                async for seq, payload in job_queue.subscribe(job.id, after):
+                    if first_event:
+                        sse_first_event_seconds.observe(time.perf_counter() - started)
+                        first_event = False
+                    yield format_sse(payload, f"{job.id}:{seq}")
+                disconnected = False
+                if payload.get('type') == 'error' or 'error' in payload:
+                    labels['outcome'] = 'error'
+            if on_finish is not None:
+                on_finish()
+        finally:
+            job_queue.detach(job.id, follower, disconnected)
+
+    return sse_response(event_generator(), request)
 
 @router.post("/", response_model=Theme)
 async def create_theme(theme_data: ThemeCreate, user_id: str = Depends(get_current_user_id)):
     """Create a new theme for a brand"""
     # Verify brand ownership
-    brand_ref = db.collection('brands').document(theme_data.brand_id)
-    brand_doc = brand_ref.get()
+    brand_owner_id = await firestore_service.get_owner('brands', theme_data.brand_id)
 
-    if not brand_doc.exists:
+    if brand_owner_id is None:
         raise HTTPException(status_code=404, detail="Brand not found")
-
-    brand = brand_doc.to_dict()
-    if brand.get('user_id') != user_id:
+    if brand_owner_id != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to create theme for this brand")
 
     theme_id = str(uuid.uuid4())
@@ -38,154 +95,181 @@ async def create_theme(theme_data: ThemeCreate, user_id: str = Depends(get_curre
         "created_at": datetime.utcnow().isoformat(),
         "updated_at": datetime.utcnow().isoformat()
     })
+    posts = theme_dict.pop('posts')
+    theme_dict.update(post_summary(posts))
 
-    # Save to Firestore
-    db.collection('themes').document(theme_id).set(theme_dict)
+    # Save to Firestore (posts go to the theme's posts subcollection)
+    await firestore_service.set_document('themes', theme_id, theme_dict)
+    if posts:
+        await post_service.store_theme_posts(theme_id, user_id, posts, stored=[])
 
-    return Theme(**theme_dict)
+    return Theme(**theme_dict, posts=posts)
 
-@router.get("/", response_model=List[Theme])
-async def get_user_themes(brand_id: str = None, user_id: str = Depends(get_current_user_id)):
-    """Get all themes for the authenticated user, optionally filtered by brand"""
-    themes_ref = db.collection('themes').where('user_id', '==', user_id)
+async def query_themes(
+    user_id: str,
+    brand_id: Optional[str],
+    limit: Optional[int],
+    cursor: Optional[str],
+    order: str,
+    response: Response,
+    fields: Optional[List[str]] = None
+) -> List[Dict]:
+    """Fetch one page of the user's themes, newest first by default, and set X-Next-Cursor"""
+    filters = [('user_id', '==', user_id)]
 
     if brand_id:
-        themes_ref = themes_ref.where('brand_id', '==', brand_id)
+        filters.append(('brand_id', '==', brand_id))
 
-    themes_docs = themes_ref.stream()
+    try:
+        themes_docs, next_cursor = await firestore_service.query_page(
+            'themes',
+            filters,
+            order_by='created_at',
+            limit=limit,
+            cursor=cursor,
+            descending=order == 'desc',
+            fields=fields,
+            id_field='id'
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    themes = []
-    for doc in themes_docs:
-        theme_data = doc.to_dict()
-        themes.append(Theme(**theme_data))
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return themes_docs
 
-    return themes
+@router.get("/", response_model=List[Theme])
+async def get_user_themes(
+    response: Response,
+    brand_id: str = None,
+    limit: Optional[int] = Query(None, ge=1, le=settings.max_page_size),
+    cursor: Optional[str] = None,
+    order: str = Query('desc', pattern='^(asc|desc)$'),
+    if_none_match: Optional[str] = Header(None),
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    Get the authenticated user's themes with their posts, optionally filtered by brand
 
-@router.get("/auto-generate-stream")
-async def auto_generate_theme_stream(brand_id: str, user_id: str):
+    Ordered by created_at. Without a limit every theme is returned; with one, the
+    cursor of the next page is sent in the X-Next-Cursor header. The ETag covers each
+    theme's updated_at (bumped by post writes too), so an unchanged list is answered
+    with 304 before any posts are read.
     """
-    Auto-generate a complete theme with AI-generated parameters and images.
-    Streams: theme parameters first, then images one by one.
+    themes_docs = await query_themes(user_id, brand_id, limit, cursor, order, response)
+
+    etag = make_etag('themes', user_id, brand_id, limit, cursor, order, [
+        (theme_data['id'], document_version(theme_data)) for theme_data in themes_docs
+    ])
+    not_modified = conditional(response, if_none_match, etag)
+    if not_modified:
+        return not_modified
+
+    await post_service.attach_posts_all(themes_docs)
+    return json_response(from_store_all(Theme, themes_docs), response)
+
+@router.get("/summary", response_model=List[ThemeSummary])
+async def get_user_theme_summaries(
+    response: Response,
+    brand_id: str = None,
+    limit: int = Query(settings.default_page_size, ge=1, le=settings.max_page_size),
+    cursor: Optional[str] = None,
+    order: str = Query('desc', pattern='^(asc|desc)$'),
+    if_none_match: Optional[str] = Header(None),
+    user_id: str = Depends(get_current_user_id)
+):
     """
+    Get one page of the authenticated user's themes without their posts
 
-    async def event_generator():
-        try:
-            # 1. Get brand data
-            brand_ref = db.collection('brands').document(brand_id)
-            brand_doc = brand_ref.get()
-
-            if not brand_doc.exists:
-                yield f"data: {json.dumps({'error': 'Brand not found'})}\n\n"
-                return
-
-            brand_data = brand_doc.to_dict()
-
-            # Verify ownership
-            if brand_data.get('user_id') != user_id:
-                yield f"data: {json.dumps({'error': 'Not authorized'})}\n\n"
-                return
-
-            # 2. Generate 5 theme parameter sets using OpenAI
-            print("Generating 5 theme options with OpenAI...")
-            all_theme_params = await openai_generator.generate_theme_parameters(brand_data, count=5)
-
-            brand_name = brand_data.get('name', 'your brand')
-
-            # 3. Generate one image for each theme and stream theme+image pairs
-            for i, theme_params in enumerate(all_theme_params):
-                print(f"Generating theme option {i + 1}/5: {theme_params['name']}...")
-
-                # Generate image prompt for this theme
-                image_prompt = gemini_generator.generate_image_prompt(
-                    mood=theme_params['mood'],
-                    colors=theme_params['colors'],
-                    imagery=theme_params['imagery'],
-                    brand_name=brand_name
-                )
-
-                # Generate one representative image
-                try:
-                    base64_image = await gemini_generator.generate_image(image_prompt)
-
-                    # Upload to Firebase Storage
-                    from services.storage_service import storage_service
-                    temp_id = str(uuid.uuid4())
-                    image_filename = f"theme_option_{temp_id}.png"
-                    image_url = storage_service.upload_base64_image(
-                        base64_data=base64_image,
-                        folder="theme_options",
-                        filename=image_filename
-                    )
-                except Exception as e:
-                    print(f"Error generating image for theme {i + 1}: {e}")
-                    image_url = f"https://images.unsplash.com/photo-{1600000000000 + i}?w=1080"
-
-                # Stream this theme option to frontend
-                theme_option = {
-                    'type': 'theme_option',
-                    'index': i + 1,
-                    'total': 5,
-                    'theme': {
-                        'name': theme_params['name'],
-                        'mood': theme_params['mood'],
-                        'colors': theme_params['colors'],
-                        'imagery': theme_params['imagery'],
-                        'tone': theme_params['tone'],
-                        'caption_length': theme_params['caption_length'],
-                        'use_emojis': theme_params['use_emojis'],
-                        'use_hashtags': theme_params['use_hashtags'],
-                        'image_url': image_url
-                    }
-                }
-                yield f"data: {json.dumps(theme_option)}\n\n"
-
-            # 4. Send completion message (no theme saved yet - user needs to select one)
-            yield f"data: {json.dumps({'type': 'complete', 'total_options': 5})}\n\n"
-
-        except Exception as e:
-            print(f"Error in auto-generate stream: {e}")
-            import traceback
-            traceback.print_exc()
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
-
-    return StreamingResponse(
-        event_generator(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",
-            "Connection": "keep-alive",
+    Only the summary fields are fetched from Firestore; post counts and the cover
+    image come from fields stored whenever a theme's posts change. The next page's
+    cursor is sent in the X-Next-Cursor header.
+    """
+    themes_docs = await query_themes(user_id, brand_id, limit, cursor, order, response, THEME_SUMMARY_FIELDS)
+
+    # Themes that still embed their posts have no summary fields yet: compute them from one
+    # batched read without writing (migrate_posts.py stores them)
+    legacy_ids = [theme_data['id'] for theme_data in themes_docs if 'generated_posts' not in theme_data]
+    if legacy_ids:
+        full_docs = await firestore_service.get_documents([('themes', theme_id) for theme_id in legacy_ids])
+        summaries = {
+            theme_id: post_summary(full_data.get('posts') or [])
+            for theme_id, full_data in zip(legacy_ids, full_docs) if full_data is not None
         }
+        for theme_data in themes_docs:
+            theme_data.update(summaries.get(theme_data['id'], {}))
+
+    etag = make_etag('theme-summaries', user_id, brand_id, limit, cursor, order, themes_docs)
+    not_modified = conditional(response, if_none_match, etag)
+    if not_modified:
+        return not_modified
+
+    return json_response(from_store_all(ThemeSummary, themes_docs), response)
+
+@router.get("/auto-generate-stream")
+async def auto_generate_theme_stream(
+    request: Request,
+    brand_id: str,
+    user_id: str,
+    fresh: bool = False,
+    reshuffle: bool = False,
+    last_event_id: Optional[str] = Header(None)
+):
+    """
+    Auto-generate a complete theme with AI-generated parameters and images.
+    Theme parameters are streamed from OpenAI and each option is sent as soon as its image is ready.
+    Pass `reshuffle=true` for new theme parameters instead of the cached set,
+    and `fresh=true` to bypass the image cache.
+    Generation runs as a background job; this stream follows its progress. Every event
+    has an ID, and a reconnect sending Last-Event-ID resumes the same job.
+    """
+    return await job_event_stream(
+        request,
+        'theme_options',
+        user_id,
+        {'brand_id': brand_id, 'fresh': fresh, 'reshuffle': reshuffle},
+        last_event_id
     )
 
 @router.get("/{theme_id}", response_model=Theme)
-async def get_theme(theme_id: str, user_id: str = Depends(get_current_user_id)):
-    """Get a specific theme by ID"""
-    theme_ref = db.collection('themes').document(theme_id)
-    theme_doc = theme_ref.get()
-
-    if not theme_doc.exists:
+async def get_theme(
+    theme_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Get a specific theme by ID (304 if the client's ETag is current)"""
+    theme_data = await firestore_service.get_document('themes', theme_id)
+    if theme_data is not None:
+        # The cached copy misses writes made by other processes (e.g. worker.py); check it
+        # against the stored updated_at, read on its own
+        stored = await firestore_service.get_fields('themes', theme_id, ['updated_at'])
+        if stored is None or stored.get('updated_at') != theme_data.get('updated_at'):
+            firestore_service.invalidate('themes', theme_id)
+            theme_data = await firestore_service.get_document('themes', theme_id)
+
+    if theme_data is None:
         raise HTTPException(status_code=404, detail="Theme not found")
 
-    theme_data = theme_doc.to_dict()
-
     # Verify ownership
     if theme_data.get('user_id') != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to access this theme")
 
-    return Theme(**theme_data)
+    not_modified = conditional(response, if_none_match, make_etag('theme', theme_id, document_version(theme_data)))
+    if not_modified:
+        return not_modified
+
+    await post_service.attach_posts(theme_data)
+    return json_response(from_store(Theme, theme_data), response)
 
 @router.put("/{theme_id}", response_model=Theme)
 async def update_theme(theme_id: str, theme_update: ThemeUpdate, user_id: str = Depends(get_current_user_id)):
     """Update a theme"""
-    theme_ref = db.collection('themes').document(theme_id)
-    theme_doc = theme_ref.get()
+    theme_data = await firestore_service.get_document('themes', theme_id)
 
-    if not theme_doc.exists:
+    if theme_data is None:
         raise HTTPException(status_code=404, detail="Theme not found")
 
-    theme_data = theme_doc.to_dict()
-
     # Verify ownership
     if theme_data.get('user_id') != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to update this theme")
@@ -193,34 +277,91 @@ async def update_theme(theme_id: str, theme_update: ThemeUpdate, user_id: str =
     # Update fields
     update_data = theme_update.model_dump(exclude_unset=True)
     update_data['updated_at'] = datetime.utcnow().isoformat()
-
-    theme_ref.update(update_data)
-
-    # Get updated theme
-    updated_doc = theme_ref.get()
-    return Theme(**updated_doc.to_dict())
+    posts = update_data.pop('posts', None)
+
+    if posts is not None:
+        # Shaped like the request's posts, so only posts the client changed are written
+        stored = None if 'posts' in theme_data else from_store_all(PostData, await post_service.list_posts(theme_id))
+        update_data = await post_service.store_theme_posts(theme_id, user_id, posts, update_data, stored=stored)
+        theme_data.pop('posts', None)
+    else:
+        await firestore_service.update_document('themes', theme_id, update_data)
+
+    # Merge locally instead of reading the theme back
+    updated_data = {**theme_data, **update_data}
+    if posts is not None:
+        updated_data['posts'] = posts
+    else:
+        await post_service.attach_posts(updated_data)
+    return Theme(**updated_data)
 
 @router.delete("/{theme_id}")
 async def delete_theme(theme_id: str, user_id: str = Depends(get_current_user_id)):
     """Delete a theme"""
-    theme_ref = db.collection('themes').document(theme_id)
-    theme_doc = theme_ref.get()
+    owner_id = await firestore_service.get_owner('themes', theme_id)
 
-    if not theme_doc.exists:
+    if owner_id is None:
         raise HTTPException(status_code=404, detail="Theme not found")
 
-    theme_data = theme_doc.to_dict()
-
     # Verify ownership
-    if theme_data.get('user_id') != user_id:
+    if owner_id != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this theme")
 
-    theme_ref.delete()
+    await post_service.delete_posts(theme_id)
+    await firestore_service.delete_document('themes', theme_id)
 
     return {"message": "Theme deleted successfully"}
 
+async def verify_theme_owner(theme_id: str, user_id: str) -> None:
+    """Raise 404/403 unless the theme exists and belongs to the user"""
+    owner_id = await firestore_service.get_owner('themes', theme_id)
+
+    if owner_id is None:
+        raise HTTPException(status_code=404, detail="Theme not found")
+    if owner_id != user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this theme")
+
+@router.get("/{theme_id}/posts", response_model=List[PostData])
+async def get_theme_posts(theme_id: str, status: Optional[str] = None, user_id: str = Depends(get_current_user_id)):
+    """Get a theme's posts in order, optionally filtered by status"""
+    await verify_theme_owner(theme_id, user_id)
+
+    theme_data = await firestore_service.get_document('themes', theme_id)
+    if theme_data is not None and 'posts' in theme_data:
+        # Not migrated yet: posts are still embedded in the theme
+        posts = [post for post in theme_data['posts'] if status is None or post.get('status') == status]
+    else:
+        posts = await post_service.list_posts(theme_id, status)
+    return json_response(from_store_all(PostData, posts))
+
+@router.patch("/{theme_id}/posts/{post_id}", response_model=PostData)
+async def update_theme_post(
+    theme_id: str,
+    post_id: str,
+    post_update: PostUpdate,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Update one post (only that post's document is written)"""
+    await verify_theme_owner(theme_id, user_id)
+
+    theme_data = await firestore_service.get_document('themes', theme_id)
+    if theme_data is not None and 'posts' in theme_data:
+        # Move the embedded posts out of the theme before editing one of them
+        await post_service.store_theme_posts(theme_id, user_id, theme_data['posts'])
+
+    post_data = await post_service.get_post(theme_id, post_id)
+    if post_data is None:
+        raise HTTPException(status_code=404, detail="Post not found")
+
+    update_data = post_update.model_dump(exclude_unset=True)
+    if update_data:
+        await post_service.update_post(theme_id, post_id, update_data)
+
+    return PostData(**{**post_data, **update_data})
+
 @router.get("/regenerate-images-stream")
 async def regenerate_images_stream(
+    request: Request,
     brand_id: str,
     user_id: str,
     name: str,
@@ -230,300 +371,97 @@ async def regenerate_images_stream(
     tone: str,
     caption_length: str,
     use_emojis: str,  # "true" or "false"
-    use_hashtags: str  # "true" or "false"
+    use_hashtags: str,  # "true" or "false"
+    fresh: bool = False,
+    last_event_id: Optional[str] = Header(None)
 ):
     """
     Regenerate 5 image variations based on user's current theme parameters.
     Streams images as they're generated.
+    Pass `fresh=true` to bypass the image cache and get new variations.
+    Generation runs as a background job; this stream follows its progress.
     """
-
-    async def event_generator():
-        try:
-            # Parse parameters
-            import json as json_lib
-            colors_list = json_lib.loads(colors)
-            use_emojis_bool = use_emojis.lower() == 'true'
-            use_hashtags_bool = use_hashtags.lower() == 'true'
-
-            # Get brand data
-            brand_ref = db.collection('brands').document(brand_id)
-            brand_doc = brand_ref.get()
-
-            if not brand_doc.exists:
-                yield f"data: {json.dumps({'error': 'Brand not found'})}\n\n"
-                return
-
-            brand_data = brand_doc.to_dict()
-
-            # Verify ownership
-            if brand_data.get('user_id') != user_id:
-                yield f"data: {json.dumps({'error': 'Not authorized'})}\n\n"
-                return
-
-            brand_name = brand_data.get('name', 'your brand')
-
-            # Generate 5 image variations with the provided parameters
-            for i in range(5):
-                print(f"Regenerating image {i + 1}/5 with custom parameters...")
-
-                # Generate image prompt
-                image_prompt = gemini_generator.generate_image_prompt(
-                    mood=mood,
-                    colors=colors_list,
-                    imagery=imagery,
-                    brand_name=brand_name
-                )
-
-                # Generate image
-                try:
-                    variation_prompt = f"{image_prompt}\n\nVariation {i + 1}: Create a unique composition."
-                    base64_image = await gemini_generator.generate_image(variation_prompt)
-
-                    # Upload to Firebase Storage
-                    from services.storage_service import storage_service
-                    temp_id = str(uuid.uuid4())
-                    image_filename = f"regenerated_{temp_id}.png"
-                    image_url = storage_service.upload_base64_image(
-                        base64_data=base64_image,
-                        folder="theme_options",
-                        filename=image_filename
-                    )
-                except Exception as e:
-                    print(f"Error generating image {i + 1}: {e}")
-                    image_url = f"https://images.unsplash.com/photo-{1600000000000 + i}?w=1080"
-
-                # Stream this theme option to frontend
-                theme_option = {
-                    'type': 'theme_option',
-                    'index': i + 1,
-                    'total': 5,
-                    'theme': {
-                        'name': name,
-                        'mood': mood,
-                        'colors': colors_list,
-                        'imagery': imagery,
-                        'tone': tone,
-                        'caption_length': caption_length,
-                        'use_emojis': use_emojis_bool,
-                        'use_hashtags': use_hashtags_bool,
-                        'image_url': image_url
-                    }
-                }
-                yield f"data: {json.dumps(theme_option)}\n\n"
-
-            # Send completion message
-            yield f"data: {json.dumps({'type': 'complete', 'total_options': 5})}\n\n"
-
-        except Exception as e:
-            print(f"Error in regenerate stream: {e}")
-            import traceback
-            traceback.print_exc()
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
-
-    return StreamingResponse(
-        event_generator(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",
-            "Connection": "keep-alive",
-        }
+    return await job_event_stream(
+        request,
+        'regenerated_images',
+        user_id,
+        {
+            'brand_id': brand_id,
+            'name': name,
+            'mood': mood,
+            'colors': colors,
+            'imagery': imagery,
+            'tone': tone,
+            'caption_length': caption_length,
+            'use_emojis': use_emojis,
+            'use_hashtags': use_hashtags,
+            'fresh': fresh
+        },
+        last_event_id
     )
 
 @router.get("/{theme_id}/generate-posts-stream")
-async def generate_posts_stream(theme_id: str, user_id: str):
-    """Stream posts as they're generated using Server-Sent Events"""
+async def generate_posts_stream(
+    request: Request,
+    theme_id: str,
+    user_id: str,
+    brand_id: Optional[str] = None,
+    concurrency: Optional[int] = None,
+    fresh: bool = False,
+    last_event_id: Optional[str] = Header(None)
+):
+    """
+    Stream posts as they're generated using Server-Sent Events.
+    Posts are generated concurrently (up to `concurrency` at once) and streamed
+    in completion order; each event carries the post's index in the theme.
+    Passing `brand_id` lets the theme and brand be read in a single round-trip.
+    Pass `fresh=true` to bypass the image cache.
+    Generation runs as a background job; this stream follows its progress. Every event
+    has an ID, and a reconnect sending Last-Event-ID resumes the same job.
+    """
+    params = {'theme_id': theme_id, 'brand_id': brand_id, 'concurrency': concurrency, 'fresh': fresh}
 
-    async def event_generator():
-        try:
-            # Get the theme
-            theme_ref = db.collection('themes').document(theme_id)
-            theme_doc = theme_ref.get()
-
-            if not theme_doc.exists:
-                yield f"data: {json.dumps({'error': 'Theme not found'})}\n\n"
-                return
-
-            theme_data = theme_doc.to_dict()
-
-            # Verify ownership
-            if theme_data.get('user_id') != user_id:
-                yield f"data: {json.dumps({'error': 'Not authorized'})}\n\n"
-                return
-
-            # Get brand information
-            brand_id = theme_data.get('brand_id')
-            brand_ref = db.collection('brands').document(brand_id)
-            brand_doc = brand_ref.get()
-
-            brand_name = "your brand"
-            if brand_doc.exists:
-                brand_data = brand_doc.to_dict()
-                brand_name = brand_data.get('name', 'your brand')
-
-            # Extract theme parameters
-            theme_name = theme_data.get('name', 'Untitled Theme')
-            posts_count = theme_data.get('posts_count', 5)
-            mood = theme_data.get('mood', 'Professional')
-            colors = theme_data.get('colors', ['#4F46E5', '#EC4899', '#F59E0B', '#10B981'])
-            imagery = theme_data.get('imagery', 'Product-focused')
-            tone = theme_data.get('tone', 'Professional')
-            caption_length = theme_data.get('caption_length', 'medium')
-            use_emojis = theme_data.get('use_emojis', False)
-            use_hashtags = theme_data.get('use_hashtags', True)
-
-            # Generate base image prompt
-            base_image_prompt = gemini_generator.generate_image_prompt(
-                mood=mood,
-                colors=colors,
-                imagery=imagery,
-                brand_name=brand_name
-            )
-
-            all_posts = []
-
-            # Generate posts one by one and stream them
-            for i in range(posts_count):
-                print(f"Streaming post {i + 1}/{posts_count}...")
-
-                # Generate caption
-                caption_data = await gemini_generator.generate_caption(
-                    theme_name=theme_name,
-                    mood=mood,
-                    tone=tone,
-                    caption_length=caption_length,
-                    use_emojis=use_emojis,
-                    use_hashtags=use_hashtags,
-                    brand_name=brand_name
-                )
-
-                # Generate image
-                try:
-                    variation_prompt = f"{base_image_prompt}\n\nVariation {i + 1}: Create a unique composition."
-                    base64_image = await gemini_generator.generate_image(variation_prompt)
-
-                    # Upload to Firebase Storage
-                    from services.storage_service import storage_service
-                    image_filename = f"{theme_id}_{uuid.uuid4()}.png"
-                    image_url = storage_service.upload_base64_image(
-                        base64_data=base64_image,
-                        folder="generated_images",
-                        filename=image_filename
-                    )
-                except Exception as e:
-                    print(f"Error generating image {i + 1}: {e}")
-                    image_url = f"https://images.unsplash.com/photo-{1600000000000 + i}?w=1080"
-
-                # Create post object
-                post = {
-                    'id': str(uuid.uuid4()),
-                    'theme_id': theme_id,
-                    'image_url': image_url,
-                    'caption': caption_data['caption'],
-                    'hashtags': caption_data['hashtags'],
-                    'post_type': ['Functional', 'Brand resonance', 'Emotional', 'Educational',
-                                  'Experiential', 'Current events', 'Personal', 'Employee',
-                                  'Community', 'Customer story', 'Cause', 'Sales'][i % 12],
-                    'selected': False,
-                    'scheduled_time': None,
-                    'status': 'draft'
-                }
-
-                all_posts.append(post)
-
-                # Send the post to frontend immediately
-                yield f"data: {json.dumps({'type': 'post', 'post': post, 'index': i + 1, 'total': posts_count})}\n\n"
-
-            # Update theme in Firestore with all posts
-            theme_data['posts'] = all_posts
-            theme_data['updated_at'] = datetime.utcnow().isoformat()
-            theme_ref.update({
-                'posts': all_posts,
-                'updated_at': theme_data['updated_at']
-            })
-
-            # Send completion message
-            yield f"data: {json.dumps({'type': 'complete', 'total_posts': len(all_posts)})}\n\n"
-
-        except Exception as e:
-            print(f"Error in stream: {e}")
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
-
-    return StreamingResponse(
-        event_generator(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",
-            "Connection": "keep-alive",
-        }
-    )
+    def on_finish():
+        # The job may have run in another process, so re-read the theme next time
+        firestore_service.invalidate('themes', theme_id)
+
+    return await job_event_stream(request, 'posts', user_id, params, last_event_id, on_finish)
 
 @router.post("/{theme_id}/generate-posts", response_model=Theme)
-async def generate_posts(theme_id: str, user_id: str = Depends(get_current_user_id)):
-    """Generate posts for a theme using Gemini AI"""
-    # Get the theme
-    theme_ref = db.collection('themes').document(theme_id)
-    theme_doc = theme_ref.get()
+async def generate_posts(
+    theme_id: str,
+    brand_id: Optional[str] = None,
+    concurrency: Optional[int] = None,
+    fresh: bool = False,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Generate posts for a theme using Gemini AI (queued as a job; waits for it to finish)"""
+    theme_data = await firestore_service.get_document('themes', theme_id)
 
-    if not theme_doc.exists:
+    if theme_data is None:
         raise HTTPException(status_code=404, detail="Theme not found")
 
-    theme_data = theme_doc.to_dict()
-
     # Verify ownership
     if theme_data.get('user_id') != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to generate posts for this theme")
 
-    # Get brand information for context
-    brand_id = theme_data.get('brand_id')
-    brand_ref = db.collection('brands').document(brand_id)
-    brand_doc = brand_ref.get()
-
-    brand_name = "your brand"
-    if brand_doc.exists:
-        brand_data = brand_doc.to_dict()
-        brand_name = brand_data.get('name', 'your brand')
-
-    # Extract theme parameters for post generation
-    theme_name = theme_data.get('name', 'Untitled Theme')
-    posts_count = theme_data.get('posts_count', 5)
-    mood = theme_data.get('mood', 'Professional')
-    colors = theme_data.get('colors', ['#4F46E5', '#EC4899', '#F59E0B', '#10B981'])
-    imagery = theme_data.get('imagery', 'Product-focused')
-    tone = theme_data.get('tone', 'Professional')
-    caption_length = theme_data.get('caption_length', 'medium')
-    use_emojis = theme_data.get('use_emojis', False)
-    use_hashtags = theme_data.get('use_hashtags', True)
-
-    # Generate posts using Gemini
-    try:
-        generated_posts = await gemini_generator.generate_posts(
-            theme_id=theme_id,
-            theme_name=theme_name,
-            posts_count=posts_count,
-            mood=mood,
-            colors=colors,
-            imagery=imagery,
-            tone=tone,
-            caption_length=caption_length,
-            use_emojis=use_emojis,
-            use_hashtags=use_hashtags,
-            brand_name=brand_name
-        )
-
-        # Update theme with generated posts
-        theme_data['posts'] = generated_posts
-        theme_data['updated_at'] = datetime.utcnow().isoformat()
-
-        # Save to Firestore
-        theme_ref.update({
-            'posts': generated_posts,
-            'updated_at': theme_data['updated_at']
-        })
-
-        return Theme(**theme_data)
+    job = await job_queue.submit('posts', user_id, {
+        'theme_id': theme_id,
+        'brand_id': brand_id,
+        'concurrency': concurrency,
+        'fresh': fresh
+    })
 
-    except Exception as e:
-        print(f"Error generating posts: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to generate posts: {str(e)}")
+    # Collect the posts in theme order as the job produces them
+    posts = []
+    async for _, event in job_queue.subscribe(job.id):
+        if event.get('type') == 'post':
+            posts.append((event['index'], event['post']))
+        elif event.get('type') == 'error' or 'error' in event:
+            message = event.get('message') or event.get('error')
+            print(f"Error generating posts: {message}")
+            raise HTTPException(status_code=500, detail=f"Failed to generate posts: {message}")
+
+    firestore_service.invalidate('themes', theme_id)
+    theme_data['posts'] = [post for _, post in sorted(posts, key=lambda item: item[0])]
+    return Theme(**theme_data)
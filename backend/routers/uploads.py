@@ -0,0 +1,31 @@
+import os
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse, RedirectResponse
+from services.upload_spool import upload_spool
+
+router = APIRouter()
+
+@router.get("/{spool_id}")
+async def get_spooled_image(spool_id: str):
+    """
+    Serve an image whose Storage upload is still pending
+
+    Once the background retrier has uploaded it, this redirects to the Storage URL.
+    """
+    record = upload_spool.read_record(spool_id)
+
+    if record is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    if record['status'] == 'pending' and not os.path.exists(upload_spool.image_path(spool_id)):
+        # Uploaded between the two reads
+        record = upload_spool.read_record(spool_id) or record
+
+    if record['status'] == 'uploaded':
+        return RedirectResponse(record['url'], status_code=301)
+
+    return FileResponse(
+        upload_spool.image_path(spool_id),
+        media_type=record['mime_type'],
+        headers={"Cache-Control": "no-cache"}
+    )
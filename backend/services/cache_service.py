@@ -0,0 +1,175 @@
+import hashlib
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Hashable, Optional
+from config import get_settings
+from services.firestore_service import firestore_service
+from services.image_data import GeneratedImage, UploadedImage
+from services.ttl_cache import TTLCache
+
+settings = get_settings()
+
+
+@dataclass
+class CachedImage:
+    """A cached generation result: the uploaded Storage URLs and/or the image bytes"""
+    uploaded: Optional[UploadedImage] = None
+    image: Optional[GeneratedImage] = None
+
+
+class ImageCache:
+    """
+    Content-addressed cache of generated images, keyed on a normalized prompt hash and model
+
+    A local in-process tier holds URLs and image bytes (TTL + size-bounded LRU).
+    An optional persistent tier in Firestore holds uploaded URLs only, so they
+    survive restarts and are shared between workers.
+    """
+
+    collection = 'image_cache'
+
+    def __init__(self):
+        self.local = TTLCache(
+            max_entries=settings.image_cache_max_entries,
+            ttl_seconds=settings.image_cache_ttl_seconds,
+            max_size=settings.image_cache_max_bytes,
+            sizeof=lambda entry: len(entry.image.data) if entry.image else 0
+        )
+
+    @staticmethod
+    def make_key(prompt: str, model: str) -> str:
+        """Hash a prompt (case- and whitespace-normalized) together with the model name"""
+        normalized = re.sub(r'\s+', ' ', prompt).strip().casefold()
+        return hashlib.sha256(f"{model}\n{normalized}".encode('utf-8')).hexdigest()
+
+    async def get(self, key: str) -> Optional[CachedImage]:
+        """Look up a key in the local tier, then the persistent tier"""
+        entry = self.local.get(key)
+        if entry is not None:
+            return entry
+
+        if not settings.image_cache_persistent:
+            return None
+        try:
+            data = await firestore_service.get_document(self.collection, key)
+        except Exception as e:
+            print(f"⚠️ Image cache lookup failed: {e}")
+            return None
+        if data is None or data.get('expires_at', 0) <= time.time():
+            return None
+
+        entry = CachedImage(uploaded=UploadedImage(
+            url=data['url'],
+            thumbnail_url=data.get('thumbnail_url'),
+            medium_url=data.get('medium_url')
+        ))
+        self.local.set(key, entry)
+        return entry
+
+    def put_image(self, key: str, image: GeneratedImage) -> None:
+        """Remember generated image bytes (local tier only)"""
+        entry = self.local.peek(key) or CachedImage()
+        self.local.set(key, CachedImage(uploaded=entry.uploaded, image=image))
+
+    async def put_url(self, key: str, uploaded: UploadedImage, model: str) -> None:
+        """Remember the Storage URLs an image was uploaded to (the bytes are no longer needed)"""
+        self.local.set(key, CachedImage(uploaded=uploaded))
+
+        if not settings.image_cache_persistent:
+            return
+        try:
+            await firestore_service.set_document(self.collection, key, {
+                'url': uploaded.url,
+                **uploaded.derivative_urls(),
+                'model': model,
+                'expires_at': time.time() + settings.image_cache_ttl_seconds
+            })
+        except Exception as e:
+            print(f"⚠️ Failed to persist image cache entry: {e}")
+
+
+@dataclass
+class PooledCaption:
+    """A caption held in a pool, with its expiry and how often it has been served"""
+    caption: Dict
+    expires_at: float
+    uses: int = 0
+
+
+class CaptionPool:
+    """
+    Bounded pools of distinct captions, one pool per caption-parameter key
+
+    Captions are served round-robin. Each one is retired after it has been served
+    `max_uses` times or once its TTL passes; the caller tops pools back up in the
+    background so repeat requests never wait on the network.
+    """
+
+    def __init__(self):
+        self.pool_size = settings.caption_pool_size
+        self.max_uses = settings.caption_pool_max_uses
+        self.ttl_seconds = settings.caption_pool_ttl_seconds
+        self._pools = TTLCache(
+            max_entries=settings.caption_pool_max_keys,
+            ttl_seconds=settings.caption_pool_ttl_seconds
+        )
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.retired = 0
+
+    def take(self, key: Hashable) -> Optional[Dict]:
+        """Serve a caption from the key's pool, or None on a miss"""
+        pool: Optional[Deque[PooledCaption]] = self._pools.get(key)
+        now = time.monotonic()
+        while pool:
+            entry = pool.popleft()
+            if entry.expires_at <= now:
+                self.retired += 1
+                continue
+            entry.uses += 1
+            if entry.uses < self.max_uses:
+                pool.append(entry)
+            else:
+                self.retired += 1
+            self.hits += 1
+            return {'caption': entry.caption['caption'], 'hashtags': list(entry.caption['hashtags'])}
+        self.misses += 1
+        return None
+
+    def add(self, key: Hashable, caption: Dict, refill: bool = False) -> None:
+        """Add a freshly generated caption to the key's pool if it is new and there is room"""
+        pool: Optional[Deque[PooledCaption]] = self._pools.peek(key)
+        if pool is None:
+            pool = deque()
+            self._pools.set(key, pool)
+        if len(pool) >= self.pool_size:
+            return
+        if any(entry.caption['caption'] == caption['caption'] for entry in pool):
+            return
+        pool.append(PooledCaption(caption=caption, expires_at=time.monotonic() + self.ttl_seconds))
+        if refill:
+            self.refills += 1
+
+    def needs_refill(self, key: Hashable) -> bool:
+        """Whether the key's pool holds fewer captions than its target size"""
+        pool = self._pools.peek(key)
+        return pool is None or len(pool) < self.pool_size
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss/refill counters and the number of pooled keys"""
+        return {
+            'keys': self._pools.stats()['entries'],
+            'hits': self.hits,
+            'misses': self.misses,
+            'refills': self.refills,
+            'retired': self.retired,
+            'evicted_keys': self._pools.evictions
+        }
+
+
+# Create singleton instances
+image_cache = ImageCache()
+caption_pool = CaptionPool()
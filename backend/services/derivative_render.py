@@ -0,0 +1,40 @@
+"""
+Image derivative encoding, run in the derivative worker processes.
+
+Worker processes are spawned, so they import the module of the function they
+run. This module imports nothing from the app, keeping its settings, Firebase and
+provider clients out of the workers.
+"""
+import io
+from typing import Dict
+
+
+def render_derivatives(data: bytes, sizes: Dict[str, int], quality: int) -> Dict[str, bytes]:
+    """
+    Encode downscaled WebP copies of an image
+
+    Args:
+        data: Encoded source image (PNG, JPEG, ...)
+        sizes: Derivative name -> maximum width/height in pixels
+        quality: WebP quality (0-100)
+
+    Returns:
+        Derivative name -> WebP bytes
+    """
+    # Imported here so only the worker processes load Pillow
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as source:
+        source.load()
+        if source.mode not in ('RGB', 'RGBA'):
+            source = source.convert('RGBA' if 'A' in source.getbands() else 'RGB')
+
+        derivatives = {}
+        for name, size in sizes.items():
+            resized = source.copy()
+            # Never upscale; keep the aspect ratio
+            resized.thumbnail((size, size), Image.LANCZOS)
+            output = io.BytesIO()
+            resized.save(output, format='WEBP', quality=quality, method=4)
+            derivatives[name] = output.getvalue()
+        return derivatives
@@ -0,0 +1,355 @@
+import base64
+import contextlib
+import copy
+import json
+from firebase_config import get_async_firestore_client
+from google.cloud.firestore import DELETE_FIELD
+from config import get_settings
+from services.metrics import firestore_operation_seconds
+from services.tracing import tracer
+from services.ttl_cache import TTLCache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+settings = get_settings()
+
+# Collections whose documents are served through the read-through cache
+CACHED_COLLECTIONS = ('brands', 'themes')
+
+class FirestoreService:
+    """
+    Non-blocking data access layer over Firestore's async client
+
+    Documents in CACHED_COLLECTIONS are served through a bounded read-through cache.
+    Every write made through this service bumps the document's version, refreshing
+    or invalidating its cache entry, so a read that raced with a write never caches
+    stale data. A separate ownership index (doc ID -> user ID) lets authorization
+    checks skip the network entirely on a warm cache.
+    """
+
+    def __init__(self, cached_collections: Iterable[str] = CACHED_COLLECTIONS):
+        self._db = None
+        self.cached_collections = frozenset(cached_collections)
+        self._documents = TTLCache(
+            max_entries=settings.document_cache_max_entries,
+            ttl_seconds=settings.document_cache_ttl_seconds
+        )
+        self._owners = TTLCache(
+            max_entries=settings.owner_index_max_entries,
+            ttl_seconds=settings.owner_index_ttl_seconds
+        )
+        # Per-document write counters; kept well past the document TTL so in-flight reads can compare
+        self._versions = TTLCache(
+            max_entries=settings.owner_index_max_entries,
+            ttl_seconds=settings.owner_index_ttl_seconds
+        )
+
+    @property
+    def db(self):
+        """Async Firestore client (created on first use, inside the running event loop)"""
+        if self._db is None:
+            self._db = get_async_firestore_client()
+        return self._db
+
+    def document(self, collection: str, doc_id: str):
+        """Get an async document reference"""
+        return self.db.collection(collection).document(doc_id)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def timed(operation: str, collection: str):
+        """Record the latency of one Firestore round-trip (as a metric and a trace span)"""
+        with tracer.span(f"firestore.{operation}", collection=collection):
+            with firestore_operation_seconds.time(operation=operation, collection=collection):
+                yield
+
+    async def get_document(self, collection: str, doc_id: str) -> Optional[Dict]:
+        """
+        Read a single document
+
+        Args:
+            collection: Collection name
+            doc_id: Document ID
+
+        Returns:
+            Document data, or None if the document does not exist
+        """
+        if collection not in self.cached_collections:
+            with self.timed('get', collection):
+                doc = await self.document(collection, doc_id).get()
+            return doc.to_dict() if doc.exists else None
+
+        key = (collection, doc_id)
+        cached = self._documents.get(key)
+        if cached is not None:
+            return copy.deepcopy(cached[1])
+
+        version = self.version(collection, doc_id)
+        with self.timed('get', collection):
+            doc = await self.document(collection, doc_id).get()
+        data = doc.to_dict() if doc.exists else None
+        self._remember(key, version, data)
+        return copy.deepcopy(data)
+
+    async def get_fields(self, collection: str, doc_id: str, fields: List[str]) -> Optional[Dict]:
+        """
+        Read some fields of a document from Firestore, bypassing the cache
+
+        Args:
+            collection: Collection name
+            doc_id: Document ID
+            fields: Fields to read (a Firestore projection)
+
+        Returns:
+            The fields the document has, or None if the document does not exist
+        """
+        with self.timed('get', collection):
+            doc = await self.document(collection, doc_id).get(field_paths=fields)
+        return doc.to_dict() if doc.exists else None
+
+    async def get_documents(self, keys: List[Tuple[str, str]]) -> List[Optional[Dict]]:
+        """
+        Read several documents in a single round-trip
+
+        Args:
+            keys: (collection, doc_id) pairs to read
+
+        Returns:
+            Document data in the same order as `keys` (None for missing documents)
+        """
+        results: List[Optional[Dict]] = [None] * len(keys)
+        missing = []
+        for i, key in enumerate(keys):
+            cached = self._documents.get(tuple(key)) if key[0] in self.cached_collections else None
+            if cached is not None:
+                results[i] = copy.deepcopy(cached[1])
+            else:
+                missing.append(i)
+        if not missing:
+            return results
+
+        versions = {i: self.version(*keys[i]) for i in missing}
+        refs = {i: self.document(*keys[i]) for i in missing}
+        found = {}
+        with self.timed('get_all', ','.join(sorted({keys[i][0] for i in missing}))):
+            async for doc in self.db.get_all(list(refs.values())):
+                if doc.exists:
+                    found[doc.reference.path] = doc.to_dict()
+
+        for i in missing:
+            data = found.get(refs[i].path)
+            if keys[i][0] in self.cached_collections:
+                self._remember(tuple(keys[i]), versions[i], data)
+            results[i] = copy.deepcopy(data)
+        return results
+
+    async def get_owner(self, collection: str, doc_id: str) -> Optional[str]:
+        """
+        Look up the user ID that owns a document, from the ownership index when possible
+
+        Args:
+            collection: Collection name
+            doc_id: Document ID
+
+        Returns:
+            The document's user_id, or None if the document does not exist
+        """
+        owner = self._owners.get((collection, doc_id))
+        if owner is not None:
+            return owner
+        data = await self.get_document(collection, doc_id)
+        return data.get('user_id') if data else None
+
+    def version(self, collection: str, doc_id: str) -> int:
+        """Number of writes made to a document through this service (while remembered)"""
+        return self._versions.peek((collection, doc_id)) or 0
+
+    def invalidate(self, collection: str, doc_id: str) -> None:
+        """Drop a document from the cache and the ownership index"""
+        key = (collection, doc_id)
+        self._bump(key)
+        self._documents.delete(key)
+        self._owners.delete(key)
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Hit/miss counters for the document cache and the ownership index"""
+        return {'documents': self._documents.stats(), 'owners': self._owners.stats()}
+
+    def _bump(self, key: Tuple[str, str]) -> int:
+        version = (self._versions.peek(key) or 0) + 1
+        self._versions.set(key, version)
+        return version
+
+    def _remember(self, key: Tuple[str, str], version: int, data: Optional[Dict]) -> None:
+        # A write landed while this read was in flight, so its result may already be stale
+        if self.version(*key) != version or data is None:
+            return
+        self._documents.set(key, (version, copy.deepcopy(data)))
+        if data.get('user_id'):
+            self._owners.set(key, data['user_id'])
+
+    async def set_document(self, collection: str, doc_id: str, data: Dict) -> None:
+        """Create or overwrite a document"""
+        with self.timed('set', collection):
+            await self.document(collection, doc_id).set(data)
+        if collection in self.cached_collections:
+            key = (collection, doc_id)
+            self._remember(key, self._bump(key), data)
+
+    async def add_document(self, collection: str, data: Dict) -> str:
+        """
+        Create a document with an auto-generated ID
+
+        Returns:
+            ID of the new document
+        """
+        doc_ref = self.db.collection(collection).document()
+        with self.timed('set', collection):
+            await doc_ref.set(data)
+        return doc_ref.id
+
+    async def update_document(self, collection: str, doc_id: str, data: Dict) -> None:
+        """Update fields of an existing document (merging them into its cached copy)"""
+        with self.timed('update', collection):
+            await self.document(collection, doc_id).update(data)
+        if collection not in self.cached_collections:
+            return
+
+        key = (collection, doc_id)
+        cached = self._documents.peek(key)
+        version = self._bump(key)
+        if cached is None or any('.' in field for field in data):
+            # Nested field paths are not merged locally; re-read on next access
+            self._documents.delete(key)
+            return
+        self._remember(key, version, {**cached[1], **data})
+
+    async def delete_fields(self, collection: str, doc_id: str, fields: List[str]) -> None:
+        """Remove top-level fields from an existing document (and from its cached copy)"""
+        with self.timed('update', collection):
+            await self.document(collection, doc_id).update({field: DELETE_FIELD for field in fields})
+        if collection not in self.cached_collections:
+            return
+
+        key = (collection, doc_id)
+        cached = self._documents.peek(key)
+        version = self._bump(key)
+        if cached is None:
+            return
+        self._remember(key, version, {k: v for k, v in cached[1].items() if k not in fields})
+
+    async def delete_document(self, collection: str, doc_id: str) -> None:
+        """Delete a document"""
+        with self.timed('delete', collection):
+            await self.document(collection, doc_id).delete()
+        if collection in self.cached_collections:
+            self.invalidate(collection, doc_id)
+
+    async def query_documents(
+        self,
+        collection: str,
+        filters: List[Tuple[str, str, Any]],
+        limit: Optional[int] = None,
+        id_field: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Run a query and collect the matching documents
+
+        Args:
+            collection: Collection name
+            filters: (field, operator, value) conditions combined with AND
+            limit: Optional maximum number of documents
+            id_field: If set, store each document's ID under this key
+
+        Returns:
+            List of document data
+        """
+        query = self.db.collection(collection)
+        for field, op, value in filters:
+            query = query.where(field, op, value)
+        if limit is not None:
+            query = query.limit(limit)
+
+        documents = []
+        with self.timed('query', collection):
+            async for doc in query.stream():
+                data = doc.to_dict()
+                if id_field:
+                    data[id_field] = doc.id
+                documents.append(data)
+        return documents
+
+    async def query_page(
+        self,
+        collection: str,
+        filters: List[Tuple[str, str, Any]],
+        order_by: str,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        descending: bool = True,
+        fields: Optional[List[str]] = None,
+        id_field: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Run a query one page at a time, ordered by a field with the document ID as tie-breaker
+
+        Args:
+            collection: Collection name
+            filters: (field, operator, value) conditions combined with AND
+            order_by: Field to order by (documents without it are not returned; migrate_posts.py
+                backfills created_at/created_date on older themes and brands)
+            limit: Page size, or None for every remaining document
+            cursor: Opaque cursor returned with the previous page
+            descending: Newest first when ordering by a timestamp
+            fields: If set, only fetch these fields (a Firestore projection)
+            id_field: If set, store each document's ID under this key
+
+        Returns:
+            The page of document data and the cursor of the next page (None on the last page)
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        direction = 'DESCENDING' if descending else 'ASCENDING'
+        query = self.db.collection(collection)
+        for field, op, value in filters:
+            query = query.where(field, op, value)
+        query = query.order_by(order_by, direction=direction).order_by('__name__', direction=direction)
+        if fields is not None:
+            query = query.select(list({*fields, order_by}))
+        if cursor:
+            query = query.start_after(list(self.decode_cursor(cursor)))
+        if limit is not None:
+            # One extra document tells us whether there is a next page
+            query = query.limit(limit + 1)
+
+        documents, last = [], None
+        with self.timed('query', collection):
+            async for doc in query.stream():
+                data = doc.to_dict()
+                if limit is not None and len(documents) == limit:
+                    return documents, self.encode_cursor(last[0], last[1])
+                last = (data.get(order_by), doc.id)
+                if id_field:
+                    data[id_field] = doc.id
+                documents.append(data)
+        return documents, None
+
+    @staticmethod
+    def encode_cursor(value: Any, doc_id: str) -> str:
+        """Encode the position after a document as an opaque URL-safe cursor"""
+        return base64.urlsafe_b64encode(json.dumps([value, doc_id]).encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[Any, str]:
+        """Decode a cursor produced by encode_cursor (raises ValueError if malformed)"""
+        try:
+            value, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except (TypeError, ValueError, UnicodeError) as e:
+            raise ValueError(f"Invalid cursor: {cursor}") from e
+        if not isinstance(doc_id, str) or not doc_id or '/' in doc_id:
+            raise ValueError(f"Invalid cursor: {cursor}")
+        return value, doc_id
+
+
+# Create a singleton instance
+firestore_service = FirestoreService()
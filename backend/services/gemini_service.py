@@ -1,22 +1,175 @@
 import os
+import asyncio
+import contextlib
 import google.generativeai as genai
-from typing import List, Dict
+from typing import List, Dict, Optional, AsyncIterator, Awaitable, Iterable, Tuple
 import uuid
+import json
 import httpx
 import base64
-from services.storage_service import storage_service
+from config import get_settings
+from services.storage_service import storage_service, ImageUploadError
+from services.upload_spool import upload_spool
+from services.image_data import GeneratedImage, InlineDataExtractor, UploadedImage
+from services.cache_service import image_cache, caption_pool
+from services.rate_limiter import rate_limiters, ProviderHTTPError, parse_retry_after
+from services.metrics import fallbacks, provider_request_seconds, provider_requests_in_flight
+from services.tracing import tracer
+from services.resilience import ResilientCaller, AttemptTimeout
+from services.single_flight import SingleFlight
 
 # Configure Gemini API
 genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
 
+settings = get_settings()
+
+# Post types assigned to generated posts in rotation
+POST_TYPES = [
+    'Functional', 'Brand resonance', 'Emotional', 'Educational',
+    'Experiential', 'Current events', 'Personal', 'Employee',
+    'Community', 'Customer story', 'Cause', 'Sales'
+]
+
+# Caption length instructions used in caption prompts
+CAPTION_LENGTH_GUIDE = {
+    'short': '1-2 sentences (under 50 words)',
+    'medium': '2-3 sentences (50-100 words)',
+    'long': '3-5 sentences (100-150 words)'
+}
+
 class GeminiImageGenerator:
     """Service for generating images using Google's Gemini API"""
 
     def __init__(self):
         # Use the text generation model directly via REST API to avoid SDK version issues
         self.api_key = os.environ.get("GEMINI_API_KEY")
-        self.image_generation_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-image:generateContent"
-        self.text_generation_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
+        self.image_model = "gemini-2.5-flash-image"
+        self.text_model = "gemini-1.5-flash"
+        self.image_generation_url = f"https://generativelanguage.googleapis.com/v1beta/models/{self.image_model}:generateContent"
+        self.text_generation_url = f"https://generativelanguage.googleapis.com/v1beta/models/{self.text_model}:generateContent"
+        self._client: Optional[httpx.AsyncClient] = None
+        # Retries, per-attempt deadlines and p95 hedging for image generation
+        self.image_caller = ResilientCaller(
+            'gemini image',
+            max_attempts=settings.image_retry_attempts,
+            attempt_timeout=settings.image_attempt_timeout,
+            total_budget=settings.image_total_budget,
+            hedge=settings.image_hedging
+        )
+        # Concurrent requests for the same prompt share one generation
+        self.image_flights = SingleFlight('gemini image')
+        # Shared per-model limiters (requests/minute + adaptive concurrency, fed by 429/5xx responses)
+        self._limiters = {
+            self.image_generation_url: rate_limiters.get(
+                'gemini', self.image_model, settings.gemini_image_rpm, settings.gemini_image_max_concurrency
+            ),
+            self.text_generation_url: rate_limiters.get(
+                'gemini', self.text_model, settings.gemini_text_rpm, settings.gemini_text_max_concurrency
+            )
+        }
+        # Caption pool keys being topped up, and references to their background tasks
+        self._refilling = set()
+        self._background_tasks = set()
+
+    async def start(self) -> None:
+        """Create the shared, pooled HTTP client used for all Gemini calls"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=settings.gemini_http2,
+                limits=httpx.Limits(
+                    max_connections=settings.gemini_max_connections,
+                    max_keepalive_connections=settings.gemini_max_keepalive_connections,
+                    keepalive_expiry=settings.gemini_keepalive_expiry
+                ),
+                timeout=httpx.Timeout(
+                    settings.gemini_image_timeout,
+                    connect=settings.gemini_connect_timeout
+                ),
+                headers={'x-goog-api-key': self.api_key or ''}
+            )
+
+    async def close(self) -> None:
+        """Close the shared HTTP client and its pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared HTTP client, available between start() and close()"""
+        if self._client is None:
+            raise RuntimeError("Gemini HTTP client is not started; call start() first")
+        return self._client
+
+    @contextlib.asynccontextmanager
+    async def _stream_post(self, url: str, payload: Dict, timeout: float) -> AsyncIterator[httpx.Response]:
+        """
+        POST a JSON payload over the shared client, leaving the successful response body unread
+
+        The request waits for the model's rate limiter and holds a slot until the body
+        has been consumed. Error responses raise ProviderHTTPError.
+        """
+        if self._client is None:
+            await self.start()
+        async with self._limiters[url].slot() as permit, self._measure(url):
+            async with self.client.stream(
+                'POST',
+                url,
+                headers={'Content-Type': 'application/json'},
+                json=payload,
+                timeout=httpx.Timeout(timeout, connect=settings.gemini_connect_timeout)
+            ) as response:
+                permit.observe(response.status_code, response.headers.get('retry-after'))
+                if not response.is_success:
+                    await response.aread()
+                    raise self._api_error(response)
+                yield response
+
+    async def _post(self, url: str, payload: Dict, timeout: float) -> httpx.Response:
+        """POST a JSON payload to the Gemini REST API through the model's rate limiter; errors raise ProviderHTTPError"""
+        if self._client is None:
+            await self.start()
+        async with self._limiters[url].slot() as permit, self._measure(url):
+            response = await self.client.post(
+                url,
+                headers={'Content-Type': 'application/json'},
+                json=payload,
+                timeout=httpx.Timeout(timeout, connect=settings.gemini_connect_timeout)
+            )
+            permit.observe(response.status_code, response.headers.get('retry-after'))
+            if not response.is_success:
+                raise self._api_error(response)
+            return response
+
+    @contextlib.asynccontextmanager
+    async def _measure(self, url: str) -> AsyncIterator[None]:
+        """Record the request's latency, trace it and count it as in flight (image or caption, by model)"""
+        operation, model = ('image', self.image_model) if url == self.image_generation_url else ('caption', self.text_model)
+        with tracer.span(f"gemini.{operation}_request", model=model), \
+                provider_requests_in_flight.track(provider='gemini', operation=operation, model=model):
+            with provider_request_seconds.time(provider='gemini', operation=operation, model=model):
+                yield
+
+    @staticmethod
+    def _api_error(response: httpx.Response) -> ProviderHTTPError:
+        """Build the error for a failed Gemini response, including any retry delay it asked for"""
+        try:
+            error = response.json().get('error', {})
+        except ValueError:
+            error = {}
+        error_msg = error.get('message', response.text)
+
+        retry_after = parse_retry_after(response.headers.get('retry-after'))
+        for detail in error.get('details', []):
+            # Quota errors carry a google.rpc.RetryInfo detail, e.g. {"retryDelay": "31s"}
+            if retry_after is None and str(detail.get('@type', '')).endswith('RetryInfo'):
+                retry_after = parse_retry_after(detail.get('retryDelay'))
+
+        return ProviderHTTPError(
+            f"Gemini API error: {response.status_code} - {error_msg}",
+            status_code=response.status_code,
+            retry_after=retry_after
+        )
 
     def generate_image_prompt(
         self,
@@ -58,80 +211,153 @@ Make it suitable for a professional social media marketing campaign."""
 
     async def generate_image(
         self,
-        prompt: str
-    ) -> str:
+        prompt: str,
+        use_cache: bool = True
+    ) -> GeneratedImage:
         """
         Generate an image using Gemini REST API
 
         Args:
             prompt: The image generation prompt
+            use_cache: Reuse a cached image for an identical prompt (False forces a fresh one,
+                generated for this caller alone)
 
         Returns:
-            Base64 data URL of the generated image (data:image/png;base64,...)
+            The generated image as raw bytes plus mime type
         """
-        try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    self.image_generation_url,
-                    headers={
-                        'Content-Type': 'application/json',
-                        'x-goog-api-key': self.api_key,
-                    },
-                    json={
-                        'contents': [
+        with tracer.span('gemini.generate_image', model=self.image_model) as span:
+            cache_key = image_cache.make_key(prompt, self.image_model)
+            if use_cache:
+                cached = await image_cache.get(cache_key)
+                if cached is not None and cached.image is not None:
+                    print("✅ Image served from cache")
+                    span.set(cached=True)
+                    return cached.image
+
+            try:
+                if not use_cache:
+                    # Joining an identical request already in flight would return its image, not a new one
+                    return await self._generate_uncached(prompt, cache_key)
+                # Identical in-flight requests are coalesced; each caller can still be cancelled on its own
+                return await self.image_flights.do(cache_key, lambda: self._generate_uncached(prompt, cache_key))
+
+            except (httpx.TimeoutException, AttemptTimeout):
+                raise Exception('Image generation request timed out. Please try again.')
+            except Exception as e:
+                print(f"Error generating image: {e}")
+                raise
+
+    async def _generate_uncached(self, prompt: str, cache_key: str) -> GeneratedImage:
+        """Generate an image with retries and hedging (see ResilientCaller), then cache it"""
+        image = await self.image_caller.call(lambda: self._request_image(prompt))
+        image_cache.put_image(cache_key, image)
+        return image
+
+    async def _request_image(self, prompt: str) -> GeneratedImage:
+        """
+        Make one Gemini image generation request
+
+        The response is streamed and its base64 image data decoded incrementally,
+        so the full base64 text is never held in memory.
+        """
+        async with self._stream_post(
+            self.image_generation_url,
+            {
+                'contents': [
+                    {
+                        'parts': [
                             {
-                                'parts': [
-                                    {
-                                        'text': prompt
-                                    }
-                                ]
+                                'text': prompt
                             }
                         ]
                     }
-                )
+                ]
+            },
+            timeout=settings.gemini_image_timeout
+        ) as response:
+            extractor = InlineDataExtractor()
+            async for chunk in response.aiter_bytes():
+                extractor.feed(chunk)
 
-                if not response.is_success:
-                    error_data = response.json()
-                    error_msg = error_data.get('error', {}).get('message', response.text)
-                    raise Exception(f"Gemini API error: {response.status_code} - {error_msg}")
+        data = extractor.finish()
+        payloads = iter(extractor.payloads)
 
-                data = response.json()
+        # Check for inline_data (image) in the response
+        response_parts = data.get('candidates', [{}])[0].get('content', {}).get('parts', [])
 
-                # Check for inline_data (image) in the response
-                response_parts = data.get('candidates', [{}])[0].get('content', {}).get('parts', [])
+        if not response_parts:
+            raise Exception('No content generated from Gemini')
 
-                if not response_parts:
-                    raise Exception('No content generated from Gemini')
+        # Look for inline image data (handle both snake_case and camelCase)
+        for part in response_parts:
+            # REST API uses snake_case (inline_data), SDK uses camelCase (inlineData)
+            inline_data = part.get('inline_data') or part.get('inlineData')
 
-                # Look for inline image data (handle both snake_case and camelCase)
-                for part in response_parts:
-                    # REST API uses snake_case (inline_data), SDK uses camelCase (inlineData)
-                    inline_data = part.get('inline_data') or part.get('inlineData')
+            if inline_data:
+                # Handle both mime_type (REST) and mimeType (SDK)
+                mime_type = inline_data.get('mime_type') or inline_data.get('mimeType') or 'image/png'
+                # The extractor decoded each "data" string in order of appearance
+                image_bytes = next(payloads, b'') if 'data' in inline_data else b''
 
-                    if inline_data:
-                        # Handle both mime_type (REST) and mimeType (SDK)
-                        mime_type = inline_data.get('mime_type') or inline_data.get('mimeType') or 'image/png'
-                        base64_data = inline_data.get('data')
+                if not image_bytes:
+                    raise Exception('Image data is empty in response')
 
-                        if not base64_data:
-                            raise Exception('Image data is empty in response')
+                print(f"✅ Received image data ({mime_type}), {len(image_bytes)} bytes")
+                return GeneratedImage(data=image_bytes, mime_type=mime_type)
 
-                        print(f"✅ Received image data ({mime_type}), {len(base64_data)} bytes")
-                        return f"data:{mime_type};base64,{base64_data}"
+        # Fallback: if no image, check for text response
+        if response_parts and response_parts[0].get('text'):
+            text_response = response_parts[0].get('text')
+            print(f'Gemini returned text instead of image. Response: {text_response}')
+            raise Exception('Gemini image generation not available. The model returned text instead of an image.')
 
-                # Fallback: if no image, check for text response
-                if response_parts and response_parts[0].get('text'):
-                    text_response = response_parts[0].get('text')
-                    print(f'Gemini returned text instead of image. Response: {text_response}')
-                    raise Exception('Gemini image generation not available. The model returned text instead of an image.')
+        raise Exception('No image data found in Gemini response')
 
-                raise Exception('No image data found in Gemini response')
+    async def upload_generated_image(
+        self,
+        prompt: str,
+        folder: str,
+        filename_prefix: str,
+        use_cache: bool = True
+    ) -> "asyncio.Task[UploadedImage]":
+        """
+        Generate an image and start uploading it (and its derivatives) to Firebase Storage in the background
 
-        except httpx.TimeoutException:
-            raise Exception('Image generation request timed out. Please try again.')
-        except Exception as e:
-            print(f"Error generating image: {e}")
-            raise
+        If an identical prompt was already generated and uploaded, its Storage URLs
+        are reused and neither generation nor upload happens.
+
+        Args:
+            prompt: The image generation prompt
+            folder: Folder path in storage bucket
+            filename_prefix: Prefix for the uploaded file name
+            use_cache: Reuse cached results (False when the user asks for fresh variations)
+
+        Returns:
+            Upload task resolving to the public URLs once the upload finishes. If the upload
+            fails, the image is spooled to disk and a temporary URL served by the API is
+            returned instead, without derivatives (ImageUploadError only if spooling fails too).
+        """
+        cache_key = image_cache.make_key(prompt, self.image_model)
+        if use_cache:
+            cached = await image_cache.get(cache_key)
+            if cached is not None and cached.uploaded is not None:
+                print("✅ Image URL served from cache")
+                return asyncio.create_task(asyncio.sleep(0, result=cached.uploaded))
+
+        image = await self.generate_image(prompt, use_cache=use_cache)
+
+        async def upload() -> UploadedImage:
+            filename = f"{filename_prefix}_{uuid.uuid4()}{image.extension}"
+            try:
+                uploaded = await storage_service.upload_with_derivatives_async(image, folder=folder, filename=filename)
+            except ImageUploadError:
+                # Retried in the background; posts are patched with the Storage URLs later
+                fallbacks.inc(kind='spooled_upload', model=self.image_model)
+                return UploadedImage(url=await upload_spool.spool(image, folder, filename))
+            await image_cache.put_url(cache_key, uploaded, self.image_model)
+            return uploaded
+
+        return asyncio.create_task(upload())
 
     async def generate_caption(
         self,
@@ -141,11 +367,16 @@ Make it suitable for a professional social media marketing campaign."""
         caption_length: str,
         use_emojis: bool,
         use_hashtags: bool,
-        brand_name: str = "your brand"
+        brand_name: str = "your brand",
+        post_type: Optional[str] = None,
+        use_cache: bool = True
     ) -> Dict[str, any]:
         """
         Generate a caption using Gemini based on theme parameters
 
+        Captions are pooled per parameter set: repeat requests are served from the
+        pool while it is topped up with new captions in the background.
+
         Args:
             theme_name: Name of the theme
             mood: Visual mood
@@ -154,85 +385,413 @@ Make it suitable for a professional social media marketing campaign."""
             use_emojis: Whether to include emojis
             use_hashtags: Whether to include hashtags
             brand_name: Name of the brand
+            post_type: Optional post type the caption should be written for
+            use_cache: Serve from the caption pool (False always calls Gemini)
 
         Returns:
             Dict with caption and hashtags
         """
-        length_guide = {
-            'short': '1-2 sentences (under 50 words)',
-            'medium': '2-3 sentences (50-100 words)',
-            'long': '3-5 sentences (100-150 words)'
+        caption_params = {
+            'theme_name': theme_name,
+            'mood': mood,
+            'tone': tone,
+            'caption_length': caption_length,
+            'use_emojis': use_emojis,
+            'use_hashtags': use_hashtags,
+            'brand_name': brand_name,
+            'post_type': post_type
         }
+        pool_key = tuple(caption_params.values())
+
+        if use_cache:
+            caption = caption_pool.take(pool_key)
+            if caption is not None:
+                self._schedule_caption_refill(pool_key, caption_params)
+                return caption
+
+        try:
+            caption = await self._request_caption(**caption_params)
+        except Exception as e:
+            print(f"Error generating caption: {e}")
+            # Fallback caption
+            fallbacks.inc(kind='default_caption', model=self.text_model)
+            return {
+                'caption': f"Check out our latest {theme_name}! ✨",
+                'hashtags': ['#brand', '#social', '#marketing'] if use_hashtags else []
+            }
+
+        caption_pool.add(pool_key, caption)
+        self._schedule_caption_refill(pool_key, caption_params)
+        return {'caption': caption['caption'], 'hashtags': list(caption['hashtags'])}
+
+    def _schedule_caption_refill(self, pool_key: tuple, caption_params: Dict) -> None:
+        """Top up a caption pool in the background (one request at a time per key)"""
+        if pool_key in self._refilling or not caption_pool.needs_refill(pool_key):
+            return
 
+        async def refill():
+            try:
+                caption = await self._request_caption(**caption_params)
+                caption_pool.add(pool_key, caption, refill=True)
+            except Exception as e:
+                print(f"⚠️ Caption pool refill failed: {e}")
+                return
+            finally:
+                self._refilling.discard(pool_key)
+            # Keep going until the pool reaches its target size
+            self._schedule_caption_refill(pool_key, caption_params)
+
+        self._refilling.add(pool_key)
+        task = asyncio.create_task(refill())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _request_caption(
+        self,
+        theme_name: str,
+        mood: str,
+        tone: str,
+        caption_length: str,
+        use_emojis: bool,
+        use_hashtags: bool,
+        brand_name: str,
+        post_type: Optional[str] = None
+    ) -> Dict[str, any]:
+        """Call Gemini for one caption (raises on failure)"""
         prompt = f"""Write an engaging Instagram caption for {brand_name}.
 
 Theme: {theme_name}
+{f'Post type: {post_type}' if post_type else ''}
 Tone: {tone}
 Mood: {mood}
-Length: {length_guide.get(caption_length, 'medium')}
+Length: {CAPTION_LENGTH_GUIDE.get(caption_length, 'medium')}
 {'Include relevant emojis naturally throughout the text.' if use_emojis else 'Do not use any emojis.'}
 {'Include 3-5 relevant hashtags at the end.' if use_hashtags else 'Do not include hashtags.'}
 
 The caption should be {tone.lower()}, engaging, and suitable for a {mood.lower()} post.
 Make it authentic and brand-appropriate."""
 
-        try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    self.text_generation_url,
-                    headers={
-                        'Content-Type': 'application/json',
-                        'x-goog-api-key': self.api_key,
-                    },
-                    json={
-                        'contents': [
+        response = await self._post(
+            self.text_generation_url,
+            {
+                'contents': [
+                    {
+                        'parts': [
                             {
-                                'parts': [
-                                    {
-                                        'text': prompt
-                                    }
-                                ]
+                                'text': prompt
                             }
                         ]
                     }
+                ]
+            },
+            timeout=settings.gemini_caption_timeout
+        )
+
+        data = response.json()
+        response_parts = data.get('candidates', [{}])[0].get('content', {}).get('parts', [])
+
+        if not response_parts or not response_parts[0].get('text'):
+            raise Exception('No text generated from Gemini')
+
+        caption_text = response_parts[0]['text'].strip()
+
+        # Extract hashtags if present
+        hashtags = []
+        if use_hashtags and '#' in caption_text:
+            # Find all hashtags in the caption
+            words = caption_text.split()
+            hashtags = [word.strip('.,!?') for word in words if word.startswith('#')]
+            # Remove hashtags from caption text for separate storage
+            for tag in hashtags:
+                caption_text = caption_text.replace(tag, '').strip()
+
+        return {
+            'caption': caption_text,
+            'hashtags': hashtags
+        }
+
+    async def generate_captions_batch(
+        self,
+        theme_name: str,
+        mood: str,
+        tone: str,
+        caption_length: str,
+        use_emojis: bool,
+        use_hashtags: bool,
+        post_types: List[str],
+        brand_name: str = "your brand",
+        use_cache: bool = True
+    ) -> List[Dict[str, any]]:
+        """
+        Generate one caption per post type with a single structured-JSON Gemini call
+
+        Pooled captions are used first. The remaining post types are requested
+        together; any caption missing from a failed or short batch response is
+        generated with an individual call instead.
+
+        Args:
+            theme_name: Name of the theme
+            mood: Visual mood
+            tone: Caption tone (Professional, Casual, etc.)
+            caption_length: short, medium, or long
+            use_emojis: Whether to include emojis
+            use_hashtags: Whether to include hashtags
+            post_types: Post type of each caption to generate, in order
+            brand_name: Name of the brand
+            use_cache: Serve from and feed the caption pool
+
+        Returns:
+            List of dicts with caption and hashtags, one per post type
+        """
+        base_params = {
+            'theme_name': theme_name,
+            'mood': mood,
+            'tone': tone,
+            'caption_length': caption_length,
+            'use_emojis': use_emojis,
+            'use_hashtags': use_hashtags,
+            'brand_name': brand_name
+        }
+        captions: List[Optional[Dict]] = [None] * len(post_types)
+
+        if use_cache:
+            for i, post_type in enumerate(post_types):
+                caption_params = {**base_params, 'post_type': post_type}
+                pool_key = tuple(caption_params.values())
+                captions[i] = caption_pool.take(pool_key)
+                if captions[i] is not None:
+                    self._schedule_caption_refill(pool_key, caption_params)
+
+        missing = [i for i, caption in enumerate(captions) if caption is None]
+        if missing:
+            try:
+                batch = await self._request_caption_batch(
+                    **base_params,
+                    post_types=[post_types[i] for i in missing]
                 )
+                for i, caption in zip(missing, batch):
+                    captions[i] = caption
+                    caption_pool.add(tuple({**base_params, 'post_type': post_types[i]}.values()), caption)
+                if len(batch) < len(missing):
+                    print(f"⚠️ Caption batch returned {len(batch)}/{len(missing)} captions")
+            except Exception as e:
+                print(f"⚠️ Caption batch failed, falling back to individual captions: {e}")
+
+        # Fall back to one call per caption for anything the batch did not cover
+        missing = [i for i, caption in enumerate(captions) if caption is None]
+        if missing:
+            fallbacks.inc(len(missing), kind='individual_caption', model=self.text_model)
+            individual = await asyncio.gather(*[
+                self.generate_caption(**base_params, post_type=post_types[i], use_cache=use_cache)
+                for i in missing
+            ])
+            for i, caption in zip(missing, individual):
+                captions[i] = caption
+
+        return [{'caption': c['caption'], 'hashtags': list(c['hashtags'])} for c in captions]
+
+    async def _request_caption_batch(
+        self,
+        theme_name: str,
+        mood: str,
+        tone: str,
+        caption_length: str,
+        use_emojis: bool,
+        use_hashtags: bool,
+        brand_name: str,
+        post_types: List[str]
+    ) -> List[Dict[str, any]]:
+        """Call Gemini once for several captions as a JSON array (raises on failure)"""
+        numbered_types = "\n".join(f"{i + 1}. {post_type}" for i, post_type in enumerate(post_types))
 
-                if not response.is_success:
-                    error_data = response.json()
-                    error_msg = error_data.get('error', {}).get('message', response.text)
-                    raise Exception(f"Gemini API error: {response.status_code} - {error_msg}")
-
-                data = response.json()
-                response_parts = data.get('candidates', [{}])[0].get('content', {}).get('parts', [])
-
-                if not response_parts or not response_parts[0].get('text'):
-                    raise Exception('No text generated from Gemini')
-
-                caption_text = response_parts[0]['text'].strip()
-
-                # Extract hashtags if present
-                hashtags = []
-                if use_hashtags and '#' in caption_text:
-                    # Find all hashtags in the caption
-                    words = caption_text.split()
-                    hashtags = [word.strip('.,!?') for word in words if word.startswith('#')]
-                    # Remove hashtags from caption text for separate storage
-                    for tag in hashtags:
-                        caption_text = caption_text.replace(tag, '').strip()
-
-                return {
-                    'caption': caption_text,
-                    'hashtags': hashtags
+        prompt = f"""Write {len(post_types)} engaging Instagram captions for {brand_name}, one for each post type below, in the same order.
+
+Theme: {theme_name}
+Tone: {tone}
+Mood: {mood}
+Length of each caption: {CAPTION_LENGTH_GUIDE.get(caption_length, 'medium')}
+{'Include relevant emojis naturally throughout the text.' if use_emojis else 'Do not use any emojis.'}
+{'Return 3-5 relevant hashtags for each caption in the "hashtags" field, not in the caption text.' if use_hashtags else 'Do not include hashtags; return an empty "hashtags" list.'}
+
+Post types:
+{numbered_types}
+
+Each caption should be {tone.lower()}, engaging, suitable for a {mood.lower()} post, and clearly written for its post type.
+Make every caption distinct, authentic and brand-appropriate."""
+
+        response = await self._post(
+            self.text_generation_url,
+            {
+                'contents': [
+                    {
+                        'parts': [
+                            {
+                                'text': prompt
+                            }
+                        ]
+                    }
+                ],
+                'generationConfig': {
+                    'responseMimeType': 'application/json',
+                    'responseSchema': {
+                        'type': 'ARRAY',
+                        'items': {
+                            'type': 'OBJECT',
+                            'properties': {
+                                'post_type': {'type': 'STRING'},
+                                'caption': {'type': 'STRING'},
+                                'hashtags': {'type': 'ARRAY', 'items': {'type': 'STRING'}}
+                            },
+                            'required': ['post_type', 'caption', 'hashtags']
+                        }
+                    }
                 }
-        except Exception as e:
-            print(f"Error generating caption: {e}")
-            # Fallback caption
-            return {
-                'caption': f"Check out our latest {theme_name}! ✨",
-                'hashtags': ['#brand', '#social', '#marketing'] if use_hashtags else []
-            }
+            },
+            timeout=settings.gemini_caption_timeout
+        )
 
-    async def generate_posts(
+        data = response.json()
+        response_parts = data.get('candidates', [{}])[0].get('content', {}).get('parts', [])
+
+        if not response_parts or not response_parts[0].get('text'):
+            raise Exception('No text generated from Gemini')
+
+        items = json.loads(response_parts[0]['text'])
+        if not isinstance(items, list):
+            raise Exception('Caption batch response is not a JSON array')
+
+        captions = []
+        for item in items[:len(post_types)]:
+            caption_text = str(item.get('caption', '')).strip() if isinstance(item, dict) else ''
+            if not caption_text:
+                # Stop at the first unusable entry so positions still line up with post types
+                break
+            hashtags = []
+            if use_hashtags:
+                hashtags = [
+                    tag if tag.startswith('#') else f"#{tag}"
+                    for tag in (str(t).strip() for t in item.get('hashtags') or [])
+                    if tag
+                ]
+            captions.append({'caption': caption_text, 'hashtags': hashtags})
+        return captions
+
+    def resolve_concurrency(self, concurrency: Optional[int] = None) -> int:
+        """
+        Clamp a requested post generation concurrency to the configured bounds
+
+        Args:
+            concurrency: Requested number of posts to generate at once (None for the default)
+
+        Returns:
+            Concurrency between 1 and the configured maximum
+        """
+        if concurrency is None:
+            concurrency = settings.post_generation_concurrency
+        return max(1, min(concurrency, settings.max_post_generation_concurrency))
+
+    async def generate_post(
+        self,
+        index: int,
+        theme_id: str,
+        base_image_prompt: str,
+        theme_name: str,
+        mood: str,
+        tone: str,
+        caption_length: str,
+        use_emojis: bool,
+        use_hashtags: bool,
+        brand_name: str = "your brand",
+        provider_slots: Optional[asyncio.Semaphore] = None,
+        caption: Optional[Awaitable[Dict]] = None,
+        use_cache: bool = True
+    ) -> Dict:
+        """
+        Generate a single post, running caption and image generation in parallel
+
+        Args:
+            index: Zero-based position of the post within the theme
+            theme_id: ID of the theme
+            base_image_prompt: Image prompt shared by every post of the theme
+            theme_name: Name of the theme
+            mood: Visual mood
+            tone: Caption tone
+            caption_length: short, medium, or long
+            use_emojis: Include emojis in captions
+            use_hashtags: Include hashtags in captions
+            brand_name: Name of the brand
+            provider_slots: Optional semaphore bounding concurrent Gemini calls
+            caption: Optional awaitable resolving to this post's caption (e.g. from a batch);
+                a caption is generated individually when omitted
+            use_cache: Reuse cached images and pooled captions
+
+        Returns:
+            Post object with image and caption
+        """
+        async def generate_variation() -> Optional["asyncio.Task[UploadedImage]"]:
+            try:
+                # Add variation to each image prompt
+                variation_prompt = f"{base_image_prompt}\n\nVariation {index + 1}: Create a unique composition."
+                upload = await self.upload_generated_image(
+                    variation_prompt,
+                    folder="generated_images",
+                    filename_prefix=theme_id,
+                    use_cache=use_cache
+                )
+                print(f"✅ Image {index + 1} generated successfully")
+                return upload
+            except Exception as e:
+                print(f"⚠️ Failed to generate image {index + 1}: {e}")
+                return None
+
+        # Only the provider calls hold a generation slot; the upload below runs
+        # outside it so it overlaps with the next post's generation
+        with tracer.span('gemini.generate_post', index=index) as span:
+            post_type = POST_TYPES[index % len(POST_TYPES)]
+            if caption is None:
+                caption = self.generate_caption(
+                    theme_name=theme_name,
+                    mood=mood,
+                    tone=tone,
+                    caption_length=caption_length,
+                    use_emojis=use_emojis,
+                    use_hashtags=use_hashtags,
+                    brand_name=brand_name,
+                    post_type=post_type,
+                    use_cache=use_cache
+                )
+
+            async with provider_slots or contextlib.nullcontext():
+                caption_data, upload = await asyncio.gather(caption, generate_variation())
+
+            uploaded = None
+            if upload is not None:
+                # Wait for the upload to Firebase Storage (or the spool, if Storage is failing)
+                try:
+                    uploaded = await upload
+                    print(f"✅ Image {index + 1} uploaded to Firebase Storage")
+                except ImageUploadError as upload_error:
+                    print(f"⚠️ Failed to upload or spool image {index + 1}: {upload_error}")
+            if uploaded is None:
+                # Fallback to placeholder if image generation or upload fails
+                fallbacks.inc(kind='placeholder_image', model=self.image_model)
+                uploaded = UploadedImage(url=f"https://images.unsplash.com/photo-{1600000000000 + index}?w=1080")
+                span.set(placeholder=True)
+
+        return {
+            'id': str(uuid.uuid4()),
+            'theme_id': theme_id,
+            'image_url': uploaded.url,
+            **uploaded.derivative_urls(),
+            'caption': caption_data['caption'],
+            'hashtags': caption_data['hashtags'],
+            'post_type': post_type,
+            'selected': False,
+            'scheduled_time': None,
+            'status': 'draft'
+        }
+
+    async def iter_posts(
         self,
         theme_id: str,
         theme_name: str,
@@ -244,10 +803,17 @@ Make it authentic and brand-appropriate."""
         caption_length: str,
         use_emojis: bool,
         use_hashtags: bool,
-        brand_name: str = "your brand"
-    ) -> List[Dict]:
+        brand_name: str = "your brand",
+        concurrency: Optional[int] = None,
+        use_cache: bool = True,
+        skip: Iterable[int] = ()
+    ) -> AsyncIterator[Tuple[int, Dict]]:
         """
-        Generate multiple social media posts with images and captions
+        Generate posts concurrently and yield each one as soon as it completes
+
+        At most `concurrency` posts call Gemini at once; uploads overlap with
+        the generation of the following posts. Posts are yielded in
+        completion order, so each one comes with its original zero-based index.
 
         Args:
             theme_id: ID of the theme
@@ -261,17 +827,13 @@ Make it authentic and brand-appropriate."""
             use_emojis: Include emojis in captions
             use_hashtags: Include hashtags in captions
             brand_name: Name of the brand
+            concurrency: Maximum posts generated at once (None for the configured default)
+            use_cache: Reuse cached images and pooled captions
+            skip: Indices of posts not to generate (e.g. finished by an interrupted job)
 
-        Returns:
-            List of post objects with images and captions
+        Yields:
+            (index, post) tuples in completion order
         """
-        posts = []
-        post_types = [
-            'Functional', 'Brand resonance', 'Emotional', 'Educational',
-            'Experiential', 'Current events', 'Personal', 'Employee',
-            'Community', 'Customer story', 'Cause', 'Sales'
-        ]
-
         # Generate the base image prompt
         base_image_prompt = self.generate_image_prompt(
             mood=mood,
@@ -280,58 +842,111 @@ Make it authentic and brand-appropriate."""
             brand_name=brand_name
         )
 
-        for i in range(posts_count):
-            print(f"Generating post {i + 1}/{posts_count}...")
+        semaphore = asyncio.Semaphore(self.resolve_concurrency(concurrency))
+        skip = set(skip)
+        indices = [i for i in range(posts_count) if i not in skip]
 
-            # Generate caption using Gemini
-            caption_data = await self.generate_caption(
+        # All captions come from one batched request that runs alongside the images
+        captions_task = asyncio.create_task(self.generate_captions_batch(
+            theme_name=theme_name,
+            mood=mood,
+            tone=tone,
+            caption_length=caption_length,
+            use_emojis=use_emojis,
+            use_hashtags=use_hashtags,
+            post_types=[POST_TYPES[i % len(POST_TYPES)] for i in indices],
+            brand_name=brand_name,
+            use_cache=use_cache
+        ))
+
+        async def caption_for(index: int) -> Dict:
+            captions = await asyncio.shield(captions_task)
+            return captions[indices.index(index)]
+
+        async def run(index: int) -> Tuple[int, Dict]:
+            print(f"Generating post {index + 1}/{posts_count}...")
+            post = await self.generate_post(
+                index=index,
+                theme_id=theme_id,
+                base_image_prompt=base_image_prompt,
                 theme_name=theme_name,
                 mood=mood,
                 tone=tone,
                 caption_length=caption_length,
                 use_emojis=use_emojis,
                 use_hashtags=use_hashtags,
-                brand_name=brand_name
+                brand_name=brand_name,
+                provider_slots=semaphore,
+                caption=caption_for(index),
+                use_cache=use_cache
             )
+            return index, post
 
-            # Generate image using Gemini REST API
-            try:
-                # Add variation to each image prompt
-                variation_prompt = f"{base_image_prompt}\n\nVariation {i + 1}: Create a unique composition."
-                base64_image = await self.generate_image(variation_prompt)
-                print(f"✅ Image {i + 1} generated successfully")
+        tasks = [asyncio.create_task(run(i)) for i in indices]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Stop outstanding work if the consumer goes away early
+            captions_task.cancel()
+            for task in tasks:
+                task.cancel()
 
-                # Upload to Firebase Storage
-                try:
-                    image_filename = f"{theme_id}_{uuid.uuid4()}.png"
-                    image_url = storage_service.upload_base64_image(
-                        base64_data=base64_image,
-                        folder="generated_images",
-                        filename=image_filename
-                    )
-                    print(f"✅ Image {i + 1} uploaded to Firebase Storage")
-                except Exception as upload_error:
-                    print(f"⚠️ Failed to upload image {i + 1} to Firebase: {upload_error}")
-                    # Use base64 as fallback
-                    image_url = base64_image
-            except Exception as e:
-                print(f"⚠️ Failed to generate image {i + 1}: {e}")
-                # Fallback to placeholder if image generation fails
-                image_url = f"https://images.unsplash.com/photo-{1600000000000 + i}?w=1080"
-
-            post = {
-                'id': str(uuid.uuid4()),
-                'theme_id': theme_id,
-                'image_url': image_url,
-                'caption': caption_data['caption'],
-                'hashtags': caption_data['hashtags'],
-                'post_type': post_types[i % len(post_types)],
-                'selected': False,
-                'scheduled_time': None,
-                'status': 'draft'
-            }
+    async def generate_posts(
+        self,
+        theme_id: str,
+        theme_name: str,
+        posts_count: int,
+        mood: str,
+        colors: List[str],
+        imagery: str,
+        tone: str,
+        caption_length: str,
+        use_emojis: bool,
+        use_hashtags: bool,
+        brand_name: str = "your brand",
+        concurrency: Optional[int] = None,
+        use_cache: bool = True
+    ) -> List[Dict]:
+        """
+        Generate multiple social media posts with images and captions
+
+        Args:
+            theme_id: ID of the theme
+            theme_name: Name of the theme
+            posts_count: Number of posts to generate
+            mood: Visual mood
+            colors: List of color hex codes
+            imagery: Imagery style
+            tone: Caption tone
+            caption_length: short, medium, or long
+            use_emojis: Include emojis in captions
+            use_hashtags: Include hashtags in captions
+            brand_name: Name of the brand
+            concurrency: Maximum posts generated at once (None for the configured default)
+            use_cache: Reuse cached images and pooled captions
 
-            posts.append(post)
+        Returns:
+            List of post objects with images and captions, in theme order
+        """
+        posts: List[Optional[Dict]] = [None] * posts_count
+
+        async for index, post in self.iter_posts(
+            theme_id=theme_id,
+            theme_name=theme_name,
+            posts_count=posts_count,
+            mood=mood,
+            colors=colors,
+            imagery=imagery,
+            tone=tone,
+            caption_length=caption_length,
+            use_emojis=use_emojis,
+            use_hashtags=use_hashtags,
+            brand_name=brand_name,
+            concurrency=concurrency,
+            use_cache=use_cache
+        ):
+            posts[index] = post
 
         return posts
 
@@ -0,0 +1,425 @@
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from datetime import datetime
+import asyncio
+import json
+from services.gemini_service import gemini_generator
+from services.image_data import UploadedImage
+from services.openai_service import openai_generator
+from services.firestore_service import firestore_service
+from services.job_queue import job_queue
+from services.metrics import fallbacks
+from services.post_service import post_service
+from services.theme_summary import post_summary
+from services.tracing import tracer
+
+
+async def get_theme_and_brand(theme_id: str, brand_id: Optional[str] = None) -> Tuple[Optional[Dict], Optional[Dict]]:
+    """
+    Read a theme and its brand.
+    When the caller already knows the brand ID, both documents are fetched in one round-trip.
+    """
+    if brand_id:
+        theme_data, brand_data = await firestore_service.get_documents([('themes', theme_id), ('brands', brand_id)])
+        if theme_data is None or theme_data.get('brand_id') == brand_id:
+            return theme_data, brand_data
+    else:
+        theme_data = await firestore_service.get_document('themes', theme_id)
+        if theme_data is None:
+            return None, None
+
+    # Brand ID was unknown (or did not match), so read the theme's own brand
+    brand_data = None
+    if theme_data.get('brand_id'):
+        brand_data = await firestore_service.get_document('brands', theme_data['brand_id'])
+    return theme_data, brand_data
+
+
+async def resolve_image_url(upload: Optional["asyncio.Task[UploadedImage]"], index: int) -> UploadedImage:
+    """Wait for a background image upload, falling back to a placeholder if generation or upload failed"""
+    if upload is not None:
+        try:
+            return await upload
+        except Exception as e:
+            print(f"Error uploading image {index + 1}: {e}")
+    fallbacks.inc(kind='placeholder_image', model=gemini_generator.image_model)
+    return UploadedImage(url=f"https://images.unsplash.com/photo-{1600000000000 + index}?w=1080")
+
+
+async def theme_option_event(index: int, theme_params: Dict, upload: Optional["asyncio.Task[UploadedImage]"]) -> Dict:
+    """Build the event for one theme option once its image upload has finished"""
+    uploaded = await resolve_image_url(upload, index)
+    theme_option = {
+        'type': 'theme_option',
+        'index': index + 1,
+        'total': 5,
+        'theme': {
+            'name': theme_params['name'],
+            'mood': theme_params['mood'],
+            'colors': theme_params['colors'],
+            'imagery': theme_params['imagery'],
+            'tone': theme_params['tone'],
+            'caption_length': theme_params['caption_length'],
+            'use_emojis': theme_params['use_emojis'],
+            'use_hashtags': theme_params['use_hashtags'],
+            'image_url': uploaded.url,
+            **uploaded.derivative_urls()
+        }
+    }
+    return theme_option
+
+
+async def stored_theme_posts(theme_id: str, user_id: str, theme_data: Dict) -> List[Dict]:
+    """
+    The theme's stored posts in order, moving posts still embedded in the theme to the subcollection first
+
+    Generated posts are written one by one over the stored ones, which needs them in the subcollection.
+    """
+    if 'posts' not in theme_data:
+        return await post_service.list_posts(theme_id)
+    posts = [post for post in theme_data.pop('posts') or [] if post]
+    await post_service.store_theme_posts(theme_id, user_id, posts)
+    return posts
+
+
+def completed_options(completed: Optional[List[Dict]]) -> Set[int]:
+    """Zero-based indices of the theme options an interrupted run already sent"""
+    return {event['index'] - 1 for event in completed or [] if event.get('type') == 'theme_option'}
+
+
+async def keep_finished_posts(theme_id: str, user_id: str, stored: List[Optional[Dict]], posts_count: int) -> None:
+    """
+    Tidy up the posts of a job that was cancelled
+
+    Its finished posts were already written over the posts at their positions, and
+    positions whose new post never finished keep the old post; only posts past the
+    theme's post count are removed and the theme's post counts refreshed.
+    """
+    kept = [post for post in stored[:posts_count] if post]
+    await post_service.store_theme_posts(theme_id, user_id, kept, stored=stored)
+    print(f"✅ Kept the finished posts of cancelled job for theme {theme_id}")
+
+
+async def generate_theme_options(
+    user_id: str,
+    brand_id: str,
+    fresh: bool = False,
+    reshuffle: bool = False,
+    completed: Optional[List[Dict]] = None
+) -> AsyncIterator[Dict]:
+    """
+    Job: generate 5 theme options (parameters + one image each) for a brand
+
+    Args:
+        completed: Events recorded by an interrupted earlier run; their options are not rendered again
+
+    Yields:
+        One `theme_option` event per option as soon as its image is ready, then `complete`
+    """
+    try:
+        # 1. Get brand data
+        brand_data = await firestore_service.get_document('brands', brand_id)
+
+        if brand_data is None:
+            yield {'error': 'Brand not found'}
+            return
+
+        # Verify ownership
+        if brand_data.get('user_id') != user_id:
+            yield {'error': 'Not authorized'}
+            return
+
+        brand_name = brand_data.get('name', 'your brand')
+
+        # 2. Stream 5 theme parameter sets from OpenAI; each theme's image starts as soon
+        #    as the theme is complete, and its option goes out once the image is ready
+        print("Generating 5 theme options with OpenAI...")
+        done = completed_options(completed)
+        events: asyncio.Queue = asyncio.Queue()
+        slots = asyncio.Semaphore(gemini_generator.resolve_concurrency())
+
+        async def render(i: int, theme_params: Dict):
+            print(f"Generating theme option {i + 1}/5: {theme_params['name']}...")
+
+            # Generate image prompt for this theme
+            image_prompt = gemini_generator.generate_image_prompt(
+                mood=theme_params['mood'],
+                colors=theme_params['colors'],
+                imagery=theme_params['imagery'],
+                brand_name=brand_name
+            )
+
+            # Generate one representative image and upload it to Firebase Storage
+            upload = None
+            try:
+                async with slots:
+                    upload = await gemini_generator.upload_generated_image(
+                        image_prompt,
+                        folder="theme_options",
+                        filename_prefix="theme_option",
+                        use_cache=not fresh
+                    )
+            except Exception as e:
+                print(f"Error generating image for theme {i + 1}: {e}")
+
+            await events.put(await theme_option_event(i, theme_params, upload))
+
+        async def produce():
+            renders = []
+            try:
+                i = 0
+                async for theme_params in openai_generator.stream_theme_parameters(
+                    brand_data,
+                    count=5,
+                    reshuffle=reshuffle
+                ):
+                    if i not in done:
+                        renders.append(asyncio.create_task(render(i, theme_params)))
+                    i += 1
+                await asyncio.gather(*renders)
+            finally:
+                for task in renders:
+                    task.cancel()
+                events.put_nowait(None)
+
+        # 3. Stream theme+image pairs in the order their images finish
+        producer = asyncio.create_task(produce())
+        try:
+            while (event := await events.get()) is not None:
+                yield event
+            await producer
+        finally:
+            producer.cancel()
+
+        # 4. Send completion message (no theme saved yet - user needs to select one)
+        yield {'type': 'complete', 'total_options': 5}
+
+    except Exception as e:
+        print(f"Error in theme options job: {e}")
+        import traceback
+        traceback.print_exc()
+        yield {'type': 'error', 'message': str(e)}
+
+
+async def generate_posts(
+    user_id: str,
+    theme_id: str,
+    brand_id: Optional[str] = None,
+    concurrency: Optional[int] = None,
+    fresh: bool = False,
+    completed: Optional[List[Dict]] = None
+) -> AsyncIterator[Dict]:
+    """
+    Job: generate every post of a theme and save them to the theme
+
+    Args:
+        completed: Events recorded by an interrupted earlier run; their posts are already
+            stored and are not generated again
+
+    Yields:
+        One `post` event per post in completion order (with its index in the theme), then `complete`
+    """
+    try:
+        # Get the theme and its brand
+        theme_data, brand_data = await get_theme_and_brand(theme_id, brand_id)
+
+        if theme_data is None:
+            yield {'error': 'Theme not found'}
+            return
+
+        # Verify ownership
+        if theme_data.get('user_id') != user_id:
+            yield {'error': 'Not authorized'}
+            return
+
+        # Get brand information
+        brand_name = "your brand"
+        if brand_data is not None:
+            brand_name = brand_data.get('name', 'your brand')
+
+        # Extract theme parameters
+        theme_name = theme_data.get('name', 'Untitled Theme')
+        posts_count = theme_data.get('posts_count', 5)
+        mood = theme_data.get('mood', 'Professional')
+        colors = theme_data.get('colors', ['#4F46E5', '#EC4899', '#F59E0B', '#10B981'])
+        imagery = theme_data.get('imagery', 'Product-focused')
+        tone = theme_data.get('tone', 'Professional')
+        caption_length = theme_data.get('caption_length', 'medium')
+        use_emojis = theme_data.get('use_emojis', False)
+        use_hashtags = theme_data.get('use_hashtags', True)
+
+        all_posts = [None] * posts_count
+        for event in completed or []:
+            if event.get('type') == 'post' and 0 < event['index'] <= posts_count:
+                all_posts[event['index'] - 1] = event['post']
+
+        # Each finished post is written right away over the post stored at its position
+        stored: List[Optional[Dict]] = await stored_theme_posts(theme_id, user_id, theme_data)
+        stored += [None] * (posts_count - len(stored))
+
+        # Generate posts concurrently and stream each one as soon as it is ready
+        posts = gemini_generator.iter_posts(
+            theme_id=theme_id,
+            theme_name=theme_name,
+            posts_count=posts_count,
+            mood=mood,
+            colors=colors,
+            imagery=imagery,
+            tone=tone,
+            caption_length=caption_length,
+            use_emojis=use_emojis,
+            use_hashtags=use_hashtags,
+            brand_name=brand_name,
+            concurrency=concurrency,
+            use_cache=not fresh,
+            skip=[index for index, post in enumerate(all_posts) if post]
+        )
+        try:
+            async for index, post in posts:
+                print(f"Streaming post {index + 1}/{posts_count}...")
+                all_posts[index] = post
+                replaces = stored[index]['id'] if stored[index] else None
+                stored[index] = post
+                await post_service.put_post(
+                    theme_id, user_id, post, index, replaces, post_summary(stored[:posts_count])
+                )
+
+                # Send the post to frontend immediately, keeping its position in the theme
+                yield {'type': 'post', 'post': post, 'index': index + 1, 'total': posts_count}
+        except (asyncio.CancelledError, GeneratorExit):
+            # Unfinished posts are cancelled with the job; the finished ones are kept
+            await posts.aclose()
+            if any(all_posts):
+                await keep_finished_posts(theme_id, user_id, stored, posts_count)
+            raise
+
+        # Every post is stored already: remove old posts past the theme's post count
+        theme_data['updated_at'] = datetime.utcnow().isoformat()
+        with tracer.span('posts.store', theme_id=theme_id, posts=len(all_posts)):
+            await post_service.store_theme_posts(
+                theme_id, user_id, all_posts, {'updated_at': theme_data['updated_at']}, stored=stored
+            )
+
+        # Send completion message
+        yield {'type': 'complete', 'total_posts': len(all_posts)}
+
+    except Exception as e:
+        print(f"Error in posts job: {e}")
+        yield {'type': 'error', 'message': str(e)}
+
+
+async def regenerate_theme_images(
+    user_id: str,
+    brand_id: str,
+    name: str,
+    mood: str,
+    colors: str,
+    imagery: str,
+    tone: str,
+    caption_length: str,
+    use_emojis: str,
+    use_hashtags: str,
+    fresh: bool = False,
+    completed: Optional[List[Dict]] = None
+) -> AsyncIterator[Dict]:
+    """
+    Job: generate 5 image variations for user-edited theme parameters
+
+    Args:
+        colors: JSON string of the color array
+        use_emojis, use_hashtags: "true" or "false"
+        completed: Events recorded by an interrupted earlier run; their variations are not generated again
+
+    Yields:
+        One `theme_option` event per variation, then `complete`
+    """
+    try:
+        # Parse parameters
+        colors_list = json.loads(colors)
+        use_emojis_bool = use_emojis.lower() == 'true'
+        use_hashtags_bool = use_hashtags.lower() == 'true'
+
+        # Get brand data
+        brand_data = await firestore_service.get_document('brands', brand_id)
+
+        if brand_data is None:
+            yield {'error': 'Brand not found'}
+            return
+
+        # Verify ownership
+        if brand_data.get('user_id') != user_id:
+            yield {'error': 'Not authorized'}
+            return
+
+        brand_name = brand_data.get('name', 'your brand')
+
+        theme_params = {
+            'name': name,
+            'mood': mood,
+            'colors': colors_list,
+            'imagery': imagery,
+            'tone': tone,
+            'caption_length': caption_length,
+            'use_emojis': use_emojis_bool,
+            'use_hashtags': use_hashtags_bool
+        }
+
+        # Generate image prompt
+        image_prompt = gemini_generator.generate_image_prompt(
+            mood=mood,
+            colors=colors_list,
+            imagery=imagery,
+            brand_name=brand_name
+        )
+
+        # Generate 5 image variations with the provided parameters
+        pending, upload = None, None
+        done = completed_options(completed)
+        try:
+            for i in range(5):
+                if i in done:
+                    continue
+                print(f"Regenerating image {i + 1}/5 with custom parameters...")
+
+                # Generate image
+                upload = None
+                try:
+                    variation_prompt = f"{image_prompt}\n\nVariation {i + 1}: Create a unique composition."
+
+                    # Upload to Firebase Storage in the background while the next image is generated
+                    upload = await gemini_generator.upload_generated_image(
+                        variation_prompt,
+                        folder="theme_options",
+                        filename_prefix="regenerated",
+                        use_cache=not fresh
+                    )
+                except Exception as e:
+                    print(f"Error generating image {i + 1}: {e}")
+
+                # Stream the previous theme option; its upload overlapped with this generation
+                if pending is not None:
+                    yield await theme_option_event(*pending)
+                pending = (i, theme_params, upload)
+        except (asyncio.CancelledError, GeneratorExit):
+            # Stop the uploads nobody will see
+            for outstanding in (upload, pending[2] if pending is not None else None):
+                if isinstance(outstanding, asyncio.Task):
+                    outstanding.cancel()
+            raise
+
+        if pending is not None:
+            yield await theme_option_event(*pending)
+
+        # Send completion message
+        yield {'type': 'complete', 'total_options': 5}
+
+    except Exception as e:
+        print(f"Error in regenerate images job: {e}")
+        import traceback
+        traceback.print_exc()
+        yield {'type': 'error', 'message': str(e)}
+
+
+# Register generation job handlers
+job_queue.register('theme_options', generate_theme_options)
+job_queue.register('posts', generate_posts)
+job_queue.register('regenerated_images', regenerate_theme_images)
@@ -0,0 +1,56 @@
+import hashlib
+import json
+from typing import Any, Dict, Optional
+from fastapi import Response
+from services.serialization import handler_headers
+
+# Browsers may store responses but must revalidate them (cheap with a matching ETag)
+CACHE_CONTROL = "private, no-cache"
+
+
+def document_version(data: Dict) -> str:
+    """A document's updated_at, or a hash of its content if it has none"""
+    if data.get('updated_at'):
+        return str(data['updated_at'])
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def make_etag(*parts: Any) -> str:
+    """
+    Build a weak ETag from the values that determine a response
+
+    Args:
+        parts: JSON-serializable values, e.g. the query and each document's version
+
+    Returns:
+        ETag header value
+    """
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches an ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag.removeprefix('W/')
+    return any(tag.strip().removeprefix('W/') == opaque for tag in if_none_match.split(','))
+
+
+def conditional(response: Response, if_none_match: Optional[str], etag: str) -> Optional[Response]:
+    """
+    Set ETag and Cache-Control on a response; return a 304 if the client's copy is current
+
+    Call this before building the response body so an unchanged resource is never serialized.
+
+    Returns:
+        A 304 Not Modified response, or None if the full response should be sent
+    """
+    headers = {'ETag': etag, 'Cache-Control': CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        # Headers set by the handler before the check (e.g. X-Next-Cursor) still apply to a 304
+        return Response(status_code=304, headers={**headers, **handler_headers(response)})
+    response.headers.update(headers)
+    return None
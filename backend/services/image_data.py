@@ -0,0 +1,132 @@
+import base64
+import io
+import json
+import mimetypes
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+# Matches the opening of a JSON "data" string, e.g. `"data": "`
+_DATA_KEY = re.compile(rb'"data"\s*:\s*"')
+# How far back into the envelope to look for a "data" key split across chunks
+_KEY_LOOKBACK = 32
+
+
+@dataclass
+class GeneratedImage:
+    """Raw image bytes plus their mime type, passed around instead of data URLs"""
+    data: bytes
+    mime_type: str = 'image/png'
+
+    @property
+    def extension(self) -> str:
+        """File extension for the mime type (e.g. ".png")"""
+        return mimetypes.guess_extension(self.mime_type) or '.png'
+
+    def to_data_url(self) -> str:
+        """Build a base64 data URL (only for callers that really need one)"""
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode('ascii')}"
+
+    @classmethod
+    def from_data_url(cls, data_url: str) -> "GeneratedImage":
+        """
+        Decode a base64 data URL (or bare base64 string, assumed PNG)
+
+        Args:
+            data_url: e.g. "data:image/png;base64,iVBORw0..."
+
+        Returns:
+            GeneratedImage with the decoded bytes
+        """
+        if data_url.startswith('data:'):
+            header, encoded = data_url.split(',', 1)
+            mime_type = header.split(':')[1].split(';')[0]
+        else:
+            encoded = data_url
+            mime_type = 'image/png'
+        return cls(data=base64.b64decode(encoded), mime_type=mime_type)
+
+
+@dataclass
+class UploadedImage:
+    """Storage URLs of an uploaded image and its smaller WebP derivatives (when rendered)"""
+    url: str
+    thumbnail_url: Optional[str] = None
+    medium_url: Optional[str] = None
+
+    def derivative_urls(self) -> Dict[str, Optional[str]]:
+        """Derivative URL fields as stored on posts and theme options"""
+        return {'thumbnail_url': self.thumbnail_url, 'medium_url': self.medium_url}
+
+
+class InlineDataExtractor:
+    """
+    Incrementally decode base64 "data" strings out of a streamed Gemini JSON response
+
+    The response is fed in chunks as it arrives. Every "data" string is decoded
+    straight into raw bytes, four base64 characters at a time, and emptied in the
+    retained JSON envelope, so the full base64 text is never held in memory.
+    """
+
+    def __init__(self):
+        self._envelope = bytearray()
+        self._scan_from = 0
+        self._in_data = False
+        self._carry = b''
+        self._current: Optional[io.BytesIO] = None
+        self.payloads: List[bytes] = []
+
+    def feed(self, chunk: bytes) -> None:
+        """Consume the next chunk of the response body"""
+        while chunk:
+            if self._in_data:
+                end = chunk.find(b'"')
+                self._decode(chunk if end < 0 else chunk[:end])
+                if end < 0:
+                    return
+                self._finish_payload()
+                self._envelope += b'"'
+                self._scan_from = len(self._envelope)
+                chunk = chunk[end + 1:]
+            else:
+                # The key may straddle two chunks, so re-scan the tail of the envelope
+                start = max(self._scan_from, len(self._envelope) - _KEY_LOOKBACK)
+                self._envelope += chunk
+                match = _DATA_KEY.search(self._envelope, start)
+                if match is None:
+                    return
+                # Everything after the opening quote belongs to the data string
+                chunk = bytes(self._envelope[match.end():])
+                del self._envelope[match.end():]
+                self._in_data = True
+                self._current = io.BytesIO()
+
+    def finish(self) -> Dict:
+        """
+        Parse the JSON envelope once the whole response has been fed
+
+        Returns:
+            The response JSON, with every "data" value replaced by an empty string
+        """
+        if self._in_data:
+            raise ValueError('Response ended inside an image data string')
+        return json.loads(bytes(self._envelope))
+
+    def _decode(self, piece: bytes) -> None:
+        if not piece:
+            return
+        # JSON may escape "/" as "\/"; base64 never contains a backslash
+        text = self._carry + piece.replace(b'\\', b'')
+        usable = len(text) - len(text) % 4
+        if usable:
+            self._current.write(base64.b64decode(text[:usable]))
+        self._carry = text[usable:]
+
+    def _finish_payload(self) -> None:
+        if self._carry:
+            # Tolerate a payload that is missing its trailing padding
+            self._current.write(base64.b64decode(self._carry + b'=' * (-len(self._carry) % 4)))
+        self.payloads.append(self._current.getvalue())
+        self._current = None
+        self._carry = b''
+        self._in_data = False
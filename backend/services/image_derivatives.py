@@ -0,0 +1,64 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+from config import get_settings
+from services.image_data import GeneratedImage
+# Leaf module: the spawned workers import only it (and Pillow), not the app
+from services.derivative_render import render_derivatives
+
+settings = get_settings()
+
+
+class DerivativeRenderer:
+    """
+    Renders thumbnail and medium WebP derivatives in a process pool
+
+    Decoding and re-encoding images is CPU-bound, so it runs in separate processes
+    and never blocks the event loop (or the GIL shared with upload threads).
+    """
+
+    def __init__(self):
+        self.sizes = {
+            'thumbnail': settings.thumbnail_size,
+            'medium': settings.medium_image_size
+        }
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def enabled(self) -> bool:
+        """Whether derivatives are rendered at upload time"""
+        return settings.image_derivatives
+
+    async def render(self, image: GeneratedImage) -> Dict[str, GeneratedImage]:
+        """
+        Render the derivatives of an image
+
+        Returns:
+            Derivative name ("thumbnail", "medium") -> WebP image
+        """
+        if self._executor is None:
+            # Spawned, not forked: the parent has an event loop and upload threads running
+            self._executor = ProcessPoolExecutor(
+                max_workers=settings.derivative_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        loop = asyncio.get_running_loop()
+        rendered = await loop.run_in_executor(
+            self._executor,
+            render_derivatives,
+            image.data,
+            self.sizes,
+            settings.webp_quality
+        )
+        return {name: GeneratedImage(data=data, mime_type='image/webp') for name, data in rendered.items()}
+
+    def shutdown(self) -> None:
+        """Release the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+# Create a singleton instance
+derivative_renderer = DerivativeRenderer()
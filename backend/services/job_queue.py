@@ -0,0 +1,619 @@
+import asyncio
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+from config import get_settings
+from services.metrics import current_endpoint, generation_jobs_in_flight
+from services.serialization import dumps_str
+from services.tracing import tracer
+
+settings = get_settings()
+
+# Job statuses after which a job never changes again
+TERMINAL_STATUSES = ('complete', 'error', 'cancelled')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    params TEXT NOT NULL,
+    dedupe_key TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    event_count INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    worker_id TEXT,
+    heartbeat_at REAL,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs (dedupe_key, status);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE TABLE IF NOT EXISTS job_followers (
+    follower_id TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS job_followers_job ON job_followers (job_id, seen_at);
+"""
+
+
+class JobValidationError(ValueError):
+    """Raised when a job is submitted with an unknown kind or invalid parameters"""
+
+
+@dataclass
+class Job:
+    """A queued, running or finished generation job"""
+    id: str
+    kind: str
+    user_id: str
+    params: Dict[str, Any]
+    status: str
+    attempts: int
+    event_count: int
+    error: Optional[str]
+    created_at: str
+    started_at: Optional[str]
+    finished_at: Optional[str]
+
+    @property
+    def finished(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Job":
+        return cls(
+            id=row['id'],
+            kind=row['kind'],
+            user_id=row['user_id'],
+            params=json.loads(row['params']),
+            status=row['status'],
+            attempts=row['attempts'],
+            event_count=row['event_count'],
+            error=row['error'],
+            created_at=row['created_at'],
+            started_at=row['started_at'],
+            finished_at=row['finished_at']
+        )
+
+
+class JobQueue:
+    """
+    Persistent generation job queue backed by a local SQLite file, with a pool of async workers
+
+    A job is an async generator of progress events (the same dicts the SSE streams
+    send). Every event is stored as it is produced, so clients can poll, subscribe
+    or resume from any point. Workers can run inside the API process or in separate
+    processes (see worker.py) sharing the same database file; a worker that stops
+    heartbeating loses its lease and the job is picked up again, resuming after the
+    events it had already recorded (see register).
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or settings.job_queue_path
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, Callable[..., AsyncIterator[Dict]]] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, asyncio.Event] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._followers: Dict[str, str] = {}  # follower ID -> job ID, for client streams in this process
+        self._abandon_timers: Dict[str, asyncio.Task] = {}
+        self._follower_heartbeat: Optional[asyncio.Task] = None
+        self._background: Set[asyncio.Task] = set()
+        self.abandoned = 0
+
+    def register(self, kind: str, handler: Callable[..., AsyncIterator[Dict]]) -> None:
+        """
+        Register the handler for a job kind
+
+        A job whose worker stopped is run again by another worker. If its earlier attempt
+        already recorded events, a handler with a `completed` parameter is passed those
+        events and must skip the work they cover; a job of any other handler fails instead
+        of repeating work its subscribers have already seen.
+
+        Args:
+            kind: Job kind (e.g. "posts")
+            handler: Async generator function called as handler(user_id=..., **params)
+        """
+        self._handlers[kind] = handler
+
+    async def submit(
+        self,
+        kind: str,
+        user_id: str,
+        params: Dict[str, Any],
+        dedupe: bool = True
+    ) -> Job:
+        """
+        Queue a job
+
+        Args:
+            kind: Registered job kind
+            user_id: User the job runs for
+            params: Keyword arguments for the handler (JSON-serializable)
+            dedupe: Return the user's unfinished job with identical kind and params instead of queuing another
+
+        Returns:
+            The new (or existing) job
+
+        Raises:
+            JobValidationError: Unknown kind or parameters the handler does not accept
+        """
+        handler = self._handlers.get(kind)
+        if handler is None:
+            raise JobValidationError(f"Unknown job kind: {kind}")
+        if 'completed' in params:
+            raise JobValidationError("Invalid parameters: 'completed' is only passed when resuming a job")
+        try:
+            inspect.signature(handler).bind(user_id=user_id, **params)
+        except TypeError as e:
+            raise JobValidationError(f"Invalid parameters for {kind} job: {e}")
+
+        job_id = str(uuid.uuid4())
+        dedupe_key = json.dumps([kind, user_id, params], sort_keys=True) if dedupe else None
+        job = await self._run(self._insert, job_id, kind, user_id, params, dedupe_key)
+        if job.id == job_id:
+            print(f"✅ Queued {kind} job {job_id}")
+            self._wake_workers()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """Look up a job by ID"""
+        return await self._run(self._select_job, job_id)
+
+    async def events(self, job_id: str, after: int = 0) -> List[Tuple[int, Dict]]:
+        """Stored (seq, payload) events of a job after sequence number `after`"""
+        _, events = await self._run(self._snapshot, job_id, after)
+        return events
+
+    async def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancel a job: queued jobs are cancelled immediately, running ones as soon as their worker notices
+
+        Returns:
+            The updated job, or None if it does not exist
+        """
+        job = await self._run(self._request_cancel, job_id)
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        if job is not None and job.finished:
+            self._notify(job_id)
+        return job
+
+    async def subscribe(self, job_id: str, after: int = 0) -> AsyncIterator[Tuple[int, Dict]]:
+        """
+        Yield (seq, payload) for every event after `after`, following the job until it finishes
+
+        Events produced in this process wake subscribers immediately; events from a
+        worker in another process are picked up by polling.
+        """
+        seq = max(0, after)
+        while True:
+            waiter = self._waiters.setdefault(job_id, asyncio.Event())
+            job, events = await self._run(self._snapshot, job_id, seq)
+            for seq, payload in events:
+                yield seq, payload
+            if job is None or (job.finished and seq >= job.event_count):
+                return
+            await self._wait(waiter, settings.job_poll_interval)
+
+    def attach(self, job_id: str) -> str:
+        """
+        Record a client stream following a job (stops a pending abandon-cancel)
+
+        Followers are stored in the database and kept alive by a heartbeat, so API
+        processes sharing it see each other's followers.
+
+        Returns:
+            Follower ID to pass to detach
+        """
+        follower_id = uuid.uuid4().hex
+        self._followers[follower_id] = job_id
+        timer = self._abandon_timers.pop(job_id, None)
+        if timer is not None:
+            timer.cancel()
+        self._spawn(self._run(self._touch_followers, {follower_id: job_id}))
+        return follower_id
+
+    def detach(self, job_id: str, follower_id: str, disconnected: bool) -> None:
+        """
+        Record that a client stream stopped following a job
+
+        If the client disconnected before the job finished and no other stream (in any
+        process) follows it within stream_disconnect_grace_seconds (e.g. an EventSource
+        reconnecting with Last-Event-ID), the job is cancelled so its provider calls and
+        uploads stop.
+        """
+        self._followers.pop(follower_id, None)
+        self._spawn(self._run(self._remove_follower, follower_id))
+        if disconnected and job_id not in self._abandon_timers and job_id not in self._followers.values():
+            self._abandon_timers[job_id] = asyncio.create_task(self._cancel_abandoned(job_id))
+
+    def stats(self) -> Dict[str, int]:
+        """Jobs running in this process, jobs followed by streams in this process and jobs cancelled after their client left"""
+        return {
+            'running': len(self._running),
+            'followed': len(set(self._followers.values())),
+            'abandoned': self.abandoned
+        }
+
+    async def wait(self, job_id: str) -> Optional[Job]:
+        """Wait until a job has finished and return its final state"""
+        async for _ in self.subscribe(job_id):
+            pass
+        return await self.get(job_id)
+
+    async def start(self, workers: Optional[int] = None) -> None:
+        """Open the database and start the worker pool (workers=0 makes this process submit-only)"""
+        count = settings.job_workers if workers is None else workers
+        self._wakeup = asyncio.Event()
+        await self._run(self._open)
+        self._workers = [asyncio.create_task(self._worker_loop(i)) for i in range(count)]
+        self._follower_heartbeat = asyncio.create_task(self._keep_followers_alive())
+        print(f"✅ Job queue ready at {self.path} with {count} worker(s)")
+
+    async def stop(self) -> None:
+        """Stop the workers; their running jobs are released to be picked up again"""
+        tasks = [*self._workers, *self._abandon_timers.values()]
+        if self._follower_heartbeat is not None:
+            tasks.append(self._follower_heartbeat)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, *self._background, return_exceptions=True)
+        self._workers = []
+        self._abandon_timers = {}
+        self._follower_heartbeat = None
+        # A claim started by a cancelled worker may still be running in its thread
+        await asyncio.to_thread(self._close)
+
+    # --- Workers ---
+
+    async def _worker_loop(self, index: int) -> None:
+        while True:
+            try:
+                job, given_up = await self._run(self._claim)
+            except Exception as e:
+                print(f"⚠️ Job worker {index} failed to claim a job: {e}")
+                job, given_up = None, []
+            for job_id in given_up:
+                print(f"⚠️ Job {job_id} failed: its worker stopped {settings.job_max_attempts} times")
+                self._notify(job_id)
+
+            if job is None:
+                self._wakeup.clear()
+                await self._wait(self._wakeup, settings.job_poll_interval)
+                continue
+
+            task = asyncio.create_task(self._execute(job))
+            self._running[job.id] = task
+            try:
+                await asyncio.wait({task})
+            except asyncio.CancelledError:
+                # The worker itself is shutting down: release the job for another worker
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await self._run(self._release, job.id)
+                raise
+            finally:
+                self._running.pop(job.id, None)
+            if not task.cancelled() and task.exception() is not None:
+                print(f"⚠️ Job worker {index} failed to record job {job.id}: {task.exception()}")
+
+    async def _execute(self, job: Job) -> None:
+        # Each run is its own trace; streams and requests link to it through the job_id attribute
+        with tracer.span(f"job.{job.kind}", root=True, job_id=job.id, attempt=job.attempts) as span:
+            print(f"Running {job.kind} job {job.id} (attempt {job.attempts})...")
+            # Metrics recorded while the job runs (and in tasks it starts) are labelled with its kind
+            current_endpoint.set(f"job:{job.kind}")
+            handler, params = self._handlers[job.kind], dict(job.params)
+            if job.event_count:
+                # An earlier attempt was interrupted after recording events
+                if 'completed' not in inspect.signature(handler).parameters:
+                    error = 'Job was interrupted and cannot be resumed'
+                    await self._run(self._append_event, job.id, job.event_count + 1, {'type': 'error', 'message': error})
+                    await self._run(self._finish, job.id, 'error', error)
+                    self._notify(job.id)
+                    span.set(status='error')
+                    print(f"⚠️ {job.kind} job {job.id} was interrupted and cannot be resumed")
+                    return
+                params['completed'] = [payload for _, payload in await self.events(job.id)]
+                print(f"Resuming {job.kind} job {job.id} after {job.event_count} events")
+            generation_jobs_in_flight.inc()
+            heartbeat = asyncio.create_task(self._heartbeat(job.id))
+            status, error, seq = 'complete', None, job.event_count
+            events = handler(user_id=job.user_id, **params)
+            try:
+                async for payload in events:
+                    seq += 1
+                    await self._run(self._append_event, job.id, seq, payload)
+                    self._notify(job.id)
+                    if payload.get('type') == 'error' or 'error' in payload:
+                        status, error = 'error', payload.get('message') or payload.get('error')
+            except asyncio.CancelledError:
+                # Let the handler clean up (e.g. keep work it already finished) if it was paused at a yield
+                await events.aclose()
+                current = await self.get(job.id)
+                if current is None or current.status != 'cancelling':
+                    raise
+                status, error = 'cancelled', 'Job cancelled'
+                seq += 1
+                await self._run(self._append_event, job.id, seq, {'type': 'error', 'message': error})
+            except Exception as e:
+                print(f"Error in {job.kind} job {job.id}: {e}")
+                status, error = 'error', str(e)
+                seq += 1
+                await self._run(self._append_event, job.id, seq, {'type': 'error', 'message': error})
+            finally:
+                heartbeat.cancel()
+                generation_jobs_in_flight.dec()
+
+            span.set(status=status)
+            await self._run(self._finish, job.id, status, error)
+            self._notify(job.id)
+            print(f"✅ {job.kind} job {job.id} finished: {status}")
+
+    async def _heartbeat(self, job_id: str) -> None:
+        """Keep the job's lease alive and stop it if a cancel was requested elsewhere"""
+        interval = settings.job_lease_seconds / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                cancel_requested = await self._run(self._touch, job_id)
+            except Exception as e:
+                print(f"⚠️ Job heartbeat failed for {job_id}: {e}")
+                continue
+            if cancel_requested and job_id in self._running:
+                self._running[job_id].cancel()
+                return
+
+    async def _cancel_abandoned(self, job_id: str) -> None:
+        try:
+            await asyncio.sleep(settings.stream_disconnect_grace_seconds)
+        finally:
+            if self._abandon_timers.get(job_id) is asyncio.current_task():
+                del self._abandon_timers[job_id]
+        if job_id in self._followers.values() or await self._run(self._is_followed, job_id):
+            return
+        job = await self.get(job_id)
+        if job is None or job.finished:
+            return
+        self.abandoned += 1
+        print(f"⚠️ Cancelling {job.kind} job {job_id}: its client disconnected")
+        await self.cancel(job_id)
+
+    async def _keep_followers_alive(self) -> None:
+        """Refresh the heartbeat of every client stream in this process following a job"""
+        while True:
+            await asyncio.sleep(settings.job_lease_seconds / 3)
+            if not self._followers:
+                continue
+            try:
+                await self._run(self._touch_followers, dict(self._followers))
+            except Exception as e:
+                print(f"⚠️ Job follower heartbeat failed: {e}")
+
+    def _spawn(self, coro) -> None:
+        # Fire-and-forget bookkeeping; keep a reference so the task is not garbage collected
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    @staticmethod
+    async def _wait(event: asyncio.Event, timeout: float) -> None:
+        # Not asyncio.wait_for: before Python 3.12 it drops a cancel that arrives as the wait ends
+        waiter = asyncio.ensure_future(event.wait())
+        try:
+            await asyncio.wait({waiter}, timeout=timeout)
+        finally:
+            waiter.cancel()
+
+    def _notify(self, job_id: str) -> None:
+        waiter = self._waiters.pop(job_id, None)
+        if waiter is not None:
+            waiter.set()
+
+    def _wake_workers(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # --- SQLite (runs in a worker thread) ---
+
+    async def _run(self, fn: Callable, *args):
+        return await asyncio.to_thread(self._locked, fn, *args)
+
+    def _locked(self, fn: Callable, *args):
+        with self._lock:
+            if self._conn is None:
+                self._open()
+            return fn(*args)
+
+    def _open(self) -> None:
+        if self._conn is not None:
+            return
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        self._conn = conn
+
+    def _close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _select_job(self, job_id: str) -> Optional[Job]:
+        row = self._conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return Job.from_row(row) if row else None
+
+    def _snapshot(self, job_id: str, after: int) -> Tuple[Optional[Job], List[Tuple[int, Dict]]]:
+        rows = self._conn.execute(
+            'SELECT seq, payload FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq',
+            (job_id, after)
+        ).fetchall()
+        return self._select_job(job_id), [(row['seq'], json.loads(row['payload'])) for row in rows]
+
+    def _insert(self, job_id: str, kind: str, user_id: str, params: Dict, dedupe_key: Optional[str]) -> Job:
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if dedupe_key is not None:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE dedupe_key = ? AND status IN ('queued', 'running') LIMIT 1",
+                    (dedupe_key,)
+                ).fetchone()
+                if row is not None:
+                    conn.execute('COMMIT')
+                    return Job.from_row(row)
+            conn.execute(
+                "INSERT INTO jobs (id, kind, user_id, params, dedupe_key, status, created_at) VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+                (job_id, kind, user_id, json.dumps(params), dedupe_key, datetime.utcnow().isoformat())
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return self._select_job(job_id)
+
+    def _claim(self) -> Tuple[Optional[Job], List[str]]:
+        # Returns the claimed job (if any) and the IDs of jobs failed for running out of attempts,
+        # whose subscribers the caller notifies
+        conn = self._conn
+        now = time.time()
+        given_up = []
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Jobs whose worker died while they were being cancelled
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', error = 'Job cancelled', finished_at = ? WHERE status = 'cancelling' AND heartbeat_at < ?",
+                (datetime.utcnow().isoformat(), now - settings.job_lease_seconds)
+            )
+            while True:
+                row = conn.execute(
+                    """
+                    SELECT id, attempts, event_count FROM jobs
+                    WHERE status = 'queued' OR (status = 'running' AND heartbeat_at < ?)
+                    ORDER BY created_at LIMIT 1
+                    """,
+                    (now - settings.job_lease_seconds,)
+                ).fetchone()
+                if row is None or row['attempts'] < settings.job_max_attempts:
+                    break
+                # Fail it with a terminal event, so its streams end, and claim the next job instead
+                error = 'Worker stopped too many times'
+                self._insert_event(row['id'], row['event_count'] + 1, {'type': 'error', 'message': error})
+                self._finish(row['id'], 'error', error)
+                given_up.append(row['id'])
+            if row is not None:
+                conn.execute(
+                    """
+                    UPDATE jobs SET status = 'running', attempts = attempts + 1, worker_id = ?,
+                        heartbeat_at = ?, started_at = COALESCE(started_at, ?)
+                    WHERE id = ?
+                    """,
+                    (self.worker_id, now, datetime.utcnow().isoformat(), row['id'])
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return (self._select_job(row['id']) if row is not None else None), given_up
+
+    def _append_event(self, job_id: str, seq: int, payload: Dict) -> None:
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._insert_event(job_id, seq, payload)
+            self._conn.execute('COMMIT')
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+
+    def _insert_event(self, job_id: str, seq: int, payload: Dict) -> None:
+        # Inside the caller's transaction
+        self._conn.execute(
+            'INSERT OR REPLACE INTO job_events (job_id, seq, payload) VALUES (?, ?, ?)',
+            (job_id, seq, dumps_str(payload))
+        )
+        self._conn.execute('UPDATE jobs SET event_count = ?, heartbeat_at = ? WHERE id = ?', (seq, time.time(), job_id))
+
+    def _touch(self, job_id: str) -> bool:
+        self._conn.execute('UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker_id = ?', (time.time(), job_id, self.worker_id))
+        row = self._conn.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def _touch_followers(self, followers: Dict[str, str]) -> None:
+        # Followers that detached before this ran are skipped, so their rows are not recreated
+        now = time.time()
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO job_followers (follower_id, job_id, seen_at) VALUES (?, ?, ?)',
+            [(follower_id, job_id, now) for follower_id, job_id in followers.items() if follower_id in self._followers]
+        )
+
+    def _remove_follower(self, follower_id: str) -> None:
+        # Rows of processes that died without detaching expire after a lease
+        self._conn.execute(
+            'DELETE FROM job_followers WHERE follower_id = ? OR seen_at < ?',
+            (follower_id, time.time() - settings.job_lease_seconds)
+        )
+
+    def _is_followed(self, job_id: str) -> bool:
+        row = self._conn.execute(
+            'SELECT 1 FROM job_followers WHERE job_id = ? AND seen_at >= ? LIMIT 1',
+            (job_id, time.time() - settings.job_lease_seconds)
+        ).fetchone()
+        return row is not None
+
+    def _request_cancel(self, job_id: str) -> Optional[Job]:
+        job = self._select_job(job_id)
+        if job is not None and job.status == 'queued':
+            # Give subscribers a final event so they stop waiting
+            self._append_event(job_id, job.event_count + 1, {'type': 'error', 'message': 'Job cancelled'})
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', error = 'Job cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                (datetime.utcnow().isoformat(), job_id)
+            )
+        self._conn.execute(
+            "UPDATE jobs SET status = 'cancelling', cancel_requested = 1 WHERE id = ? AND status = 'running'",
+            (job_id,)
+        )
+        return self._select_job(job_id)
+
+    def _release(self, job_id: str) -> None:
+        self._conn.execute(
+            "UPDATE jobs SET status = 'queued', worker_id = NULL WHERE id = ? AND status = 'running'",
+            (job_id,)
+        )
+
+    def _finish(self, job_id: str, status: str, error: Optional[str]) -> None:
+        self._conn.execute(
+            'UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?',
+            (status, error, datetime.utcnow().isoformat(), job_id)
+        )
+
+
+# Create a singleton instance
+job_queue = JobQueue()
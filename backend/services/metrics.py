@@ -0,0 +1,223 @@
+import abc
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Request latency buckets in seconds (image generation can take a minute or more)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+# Endpoint the current work is done for: the route path of an HTTP request, or "job:{kind}"
+# for a generation job. Tasks started from a request or job inherit it.
+current_endpoint: contextvars.ContextVar[str] = contextvars.ContextVar('metrics_endpoint', default='background')
+
+
+class Metric(abc.ABC):
+    """A named metric whose values are kept per combination of label values"""
+
+    type = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if 'endpoint' in self.labels and 'endpoint' not in labels:
+            labels = {**labels, 'endpoint': current_endpoint.get()}
+        return tuple(str(labels.get(label, '')) for label in self.labels)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: Optional[Dict[str, str]] = None) -> str:
+        pairs = list(zip(self.labels, key)) + list((extra or {}).items())
+        if not pairs:
+            return ''
+        escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return '{' + ','.join(f'{label}="{value}"' for (label, _), value in zip(pairs, escaped)) + '}'
+
+    @abc.abstractmethod
+    def samples(self) -> List[str]:
+        """Sample lines in the Prometheus text format"""
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.type}', *self.samples()]
+
+
+class Counter(Metric):
+    """Monotonically increasing count (labels: endpoint is filled in from the current context)"""
+
+    type = 'counter'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f'{self.name}{self._format_labels(key)} {value:g}' for key, value in sorted(self._values.items())]
+
+
+class Gauge(Metric):
+    """Value that goes up and down, e.g. work in flight"""
+
+    type = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    @contextlib.contextmanager
+    def track(self, **labels: str) -> Iterator[None]:
+        """Count the block as in flight while it runs"""
+        labels = {**labels, 'endpoint': labels.get('endpoint', current_endpoint.get())}
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f'{self.name}{self._format_labels(key)} {value:g}' for key, value in sorted(self._values.items())]
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets, plus their sum and count"""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> (per-bucket counts with a final +Inf bucket, sum)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextlib.contextmanager
+    def time(self, **labels: str) -> Iterator[Dict[str, str]]:
+        """
+        Observe the duration of the block
+
+        Yields the label dict; an `outcome` label is set to "error" if the block raises
+        ("cancelled" if it is cancelled or closed early), else to "ok" unless the block set it itself.
+        """
+        labels = {**labels, 'endpoint': labels.get('endpoint', current_endpoint.get())}
+        start = time.perf_counter()
+        try:
+            yield labels
+        except BaseException as e:
+            labels['outcome'] = 'cancelled' if isinstance(e, (asyncio.CancelledError, GeneratorExit)) else 'error'
+            raise
+        finally:
+            labels.setdefault('outcome', 'ok')
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip((*self.buckets, float('inf')), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                    lines.append(f'{self.name}_bucket{self._format_labels(key, {"le": le})} {cumulative}')
+                lines.append(f'{self.name}_sum{self._format_labels(key)} {total:g}')
+                lines.append(f'{self.name}_count{self._format_labels(key)} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """Every metric of this process, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition of every metric"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Global registry
+metrics = MetricsRegistry()
+
+# HTTP requests
+http_request_seconds = metrics.histogram(
+    'http_request_duration_seconds', 'HTTP request duration (for streams: until the stream ends)',
+    ('endpoint', 'method', 'status')
+)
+
+# Provider calls (one per HTTP request to Gemini/OpenAI, retries and hedges included)
+provider_request_seconds = metrics.histogram(
+    'provider_request_duration_seconds', 'Duration of one Gemini/OpenAI request',
+    ('endpoint', 'provider', 'operation', 'model', 'outcome')
+)
+provider_requests_in_flight = metrics.gauge(
+    'provider_requests_in_flight', 'Gemini/OpenAI requests in flight',
+    ('endpoint', 'provider', 'operation', 'model')
+)
+
+# Firebase
+storage_upload_seconds = metrics.histogram(
+    'storage_upload_duration_seconds', 'Duration of one Firebase Storage upload (including queueing for an upload thread)',
+    ('endpoint', 'outcome')
+)
+storage_uploaded_bytes = metrics.counter(
+    'storage_uploaded_bytes_total', 'Bytes uploaded to Firebase Storage', ('endpoint',)
+)
+firestore_operation_seconds = metrics.histogram(
+    'firestore_operation_duration_seconds', 'Duration of one Firestore round-trip',
+    ('endpoint', 'operation', 'collection', 'outcome')
+)
+
+# Generation
+sse_first_event_seconds = metrics.histogram(
+    'sse_time_to_first_event_seconds', 'Time from opening a generation stream to its first event', ('endpoint',)
+)
+sse_complete_seconds = metrics.histogram(
+    'sse_time_to_complete_seconds', 'Time from opening a generation stream to its last event', ('endpoint', 'outcome')
+)
+sse_streams_open = metrics.gauge('sse_streams_open', 'Generation streams currently open', ('endpoint',))
+generation_jobs_in_flight = metrics.gauge('generation_jobs_in_flight', 'Generation jobs running in this process', ('endpoint',))
+fallbacks = metrics.counter(
+    'generation_fallbacks_total', 'Generated content replaced by a fallback (placeholder image, default caption or theme, spooled upload, individual caption call)',
+    ('endpoint', 'kind', 'model')
+)
@@ -1,19 +1,269 @@
 import os
+import copy
+import contextlib
+import hashlib
 import json
-from openai import AsyncOpenAI
+import re
+from typing import AsyncIterator, Optional
+from openai import AsyncOpenAI, APIStatusError
+from config import get_settings
+from services.ttl_cache import TTLCache
+from services.rate_limiter import rate_limiters
+from services.metrics import fallbacks, provider_request_seconds, provider_requests_in_flight
+from services.tracing import tracer
+from services.single_flight import SingleFlight
+
+settings = get_settings()
+
+# Brand fields that feed the theme prompt; a change to any of them invalidates cached themes
+BRAND_PROMPT_FIELDS = (
+    'name', 'category', 'description', 'target_audience',
+    'major_strengths', 'main_products', 'brand_voice'
+)
+
+class JSONArrayStreamParser:
+    """
+    Incrementally extract the objects of one array from a streamed JSON document
+
+    Text is fed as it arrives; every object in the array named `array_key` is
+    returned as soon as its closing brace has been seen.
+    """
+
+    def __init__(self, array_key: str):
+        self._array_start = re.compile(r'"' + re.escape(array_key) + r'"\s*:\s*\[')
+        self._buffer = ''
+        self._pos = 0
+        self._in_array = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start: Optional[int] = None
+
+    def feed(self, text: str) -> list:
+        """Add more text and return the objects completed by it"""
+        self._buffer += text
+        if not self._in_array:
+            match = self._array_start.search(self._buffer)
+            if match is None:
+                return []
+            self._in_array = True
+            self._pos = match.end()
+
+        objects = []
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer) and not self._done:
+            ch = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                if self._depth == 0 and ch == '{':
+                    self._object_start = i
+                self._depth += 1
+            elif ch in '}]':
+                if self._depth == 0:
+                    # End of the array itself
+                    self._done = True
+                else:
+                    self._depth -= 1
+                    if self._depth == 0 and self._object_start is not None:
+                        try:
+                            objects.append(json.loads(buffer[self._object_start:i + 1]))
+                        except json.JSONDecodeError:
+                            pass
+                        self._object_start = None
+            i += 1
+        self._pos = i
+        return objects
+
+def brand_fingerprint(brand_data: dict) -> str:
+    """Stable hash of the brand fields used in the theme prompt"""
+    fields = {field: brand_data.get(field) for field in BRAND_PROMPT_FIELDS}
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode('utf-8')).hexdigest()
 
 class OpenAIThemeGenerator:
     def __init__(self):
         self.client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        self.model = "gpt-4o-mini"
+        # Shared limiter for the chat model (requests/minute + adaptive concurrency, fed by 429/5xx responses)
+        self._limiter = rate_limiters.get('openai', self.model, settings.openai_rpm, settings.openai_max_concurrency)
+        # (brand fingerprint, count) -> generated theme list
+        self._theme_cache = TTLCache(
+            max_entries=settings.theme_params_cache_max_entries,
+            ttl_seconds=settings.theme_params_cache_ttl_seconds
+        )
+        # brand ID -> cache keys generated for that brand
+        self._brand_keys: dict[str, set] = {}
+        # Concurrent identical requests share one completion
+        self.flights = SingleFlight('openai themes')
+
+    @contextlib.asynccontextmanager
+    async def _chat_completion(self, **kwargs):
+        """
+        Create a chat completion through the model's rate limiter
 
-    async def generate_theme_parameters(self, brand_data: dict, count: int = 5) -> list[dict]:
+        The limiter slot is held until the block exits, so a streamed completion
+        counts as in flight until it has been fully read (and is timed and traced until then).
+        """
+        labels = {'provider': 'openai', 'operation': 'theme_params', 'model': self.model}
+        async with self._limiter.slot() as permit:
+            with tracer.span('openai.chat_completion', model=self.model, stream=bool(kwargs.get('stream'))), \
+                    provider_requests_in_flight.track(**labels), provider_request_seconds.time(**labels):
+                try:
+                    response = await self.client.chat.completions.create(model=self.model, **kwargs)
+                except APIStatusError as e:
+                    permit.observe(e.status_code, e.response.headers.get('retry-after'))
+                    raise
+                permit.observe(200)
+                yield response
+
+    def invalidate_brand(self, brand_id: str) -> None:
+        """Drop every cached theme list generated for a brand"""
+        for key in self._brand_keys.pop(brand_id, set()):
+            self._theme_cache.delete(key)
+
+    async def generate_theme_parameters(self, brand_data: dict, count: int = 5, reshuffle: bool = False) -> list[dict]:
         """
         Generate multiple theme parameter sets based on brand data using OpenAI.
         Returns a list of dicts, each with: name, mood, colors, imagery, tone, caption_length, use_emojis, use_hashtags
+
+        Results are cached per brand fingerprint and count; pass reshuffle=True to
+        ask OpenAI for a new set (which then replaces the cached one). A reshuffle is
+        never shared with identical requests in flight.
         """
+        cache_key = (brand_fingerprint(brand_data), count)
+        if reshuffle:
+            return await self._generate_uncached(brand_data, count, cache_key)
+
+        cached = self._theme_cache.get(cache_key)
+        if cached is not None:
+            print("✅ Theme parameters served from cache")
+            return copy.deepcopy(cached)
 
-        # Build prompt based on brand data
-        prompt = f"""You are a social media marketing expert. Based on the following brand information, generate {count} DIFFERENT Instagram theme options with specific parameters.
+        flight_key = (brand_data.get('id'), cache_key)
+        return await self.flights.do(flight_key, lambda: self._generate_uncached(brand_data, count, cache_key))
+
+    async def _generate_uncached(self, brand_data: dict, count: int, cache_key: tuple) -> list[dict]:
+        """Ask OpenAI for a theme list and cache it (falls back to defaults on failure)"""
+        prompt = self._build_prompt(brand_data, count)
+
+        try:
+            async with self._chat_completion(
+                messages=[
+                    {"role": "system", "content": "You are a professional social media marketing expert who generates diverse, cohesive Instagram themes. Always respond with valid JSON only."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.9,
+                max_tokens=2000,
+                response_format={"type": "json_object"}
+            ) as response:
+                # Parse the response
+                result_text = response.choices[0].message.content
+            result = json.loads(result_text)
+            themes = result.get('themes', [])
+
+            # Validate each theme
+            validated_themes = [theme for theme in map(self._validate_theme, themes) if theme is not None]
+
+            # If we didn't get enough themes, generate defaults
+            if len(validated_themes) < count:
+                fallbacks.inc(count - len(validated_themes), kind='default_theme', model=self.model)
+            while len(validated_themes) < count:
+                validated_themes.append(self._default_theme(brand_data, len(validated_themes)))
+
+            themes = validated_themes[:count]
+            self._remember(brand_data, cache_key, themes)
+            return themes
+
+        except Exception as e:
+            print(f"Error generating theme parameters: {e}")
+            # Return default theme parameters if AI generation fails
+            fallbacks.inc(count, kind='default_theme', model=self.model)
+            return [self._default_theme(brand_data, i) for i in range(count)]
+
+    async def stream_theme_parameters(self, brand_data: dict, count: int = 5, reshuffle: bool = False) -> AsyncIterator[dict]:
+        """
+        Stream theme parameter sets as OpenAI writes them.
+
+        The completion is streamed and its "themes" array parsed incrementally, so each
+        theme is yielded as soon as its JSON object is complete. Missing or invalid
+        themes are replaced by defaults at the end. Uses the same cache as
+        generate_theme_parameters.
+        """
+        cache_key = (brand_fingerprint(brand_data), count)
+        if reshuffle:
+            async for theme in self._stream_uncached(brand_data, count, cache_key):
+                yield theme
+            return
+
+        cached = self._theme_cache.get(cache_key)
+        if cached is not None:
+            print("✅ Theme parameters served from cache")
+            for theme in copy.deepcopy(cached):
+                yield theme
+            return
+
+        flight_key = (brand_data.get('id'), cache_key)
+        async for theme in self.flights.stream(flight_key, lambda: self._stream_uncached(brand_data, count, cache_key)):
+            yield theme
+
+    async def _stream_uncached(self, brand_data: dict, count: int, cache_key: tuple) -> AsyncIterator[dict]:
+        """Stream a theme list from OpenAI, padded with defaults, and cache it if the completion succeeded"""
+        themes = []
+        failed = False
+        try:
+            async with self._chat_completion(
+                messages=[
+                    {"role": "system", "content": "You are a professional social media marketing expert who generates diverse, cohesive Instagram themes. Always respond with valid JSON only."},
+                    {"role": "user", "content": self._build_prompt(brand_data, count)}
+                ],
+                temperature=0.9,
+                max_tokens=2000,
+                response_format={"type": "json_object"},
+                stream=True
+            ) as stream:
+                parser = JSONArrayStreamParser('themes')
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    for raw_theme in parser.feed(chunk.choices[0].delta.content or ''):
+                        theme = self._validate_theme(raw_theme)
+                        if theme is not None and len(themes) < count:
+                            themes.append(theme)
+                            yield theme
+
+        except Exception as e:
+            print(f"Error streaming theme parameters: {e}")
+            failed = True
+
+        # If we didn't get enough themes, generate defaults
+        if len(themes) < count:
+            fallbacks.inc(count - len(themes), kind='default_theme', model=self.model)
+        while len(themes) < count:
+            theme = self._default_theme(brand_data, len(themes))
+            themes.append(theme)
+            yield theme
+
+        if not failed:
+            self._remember(brand_data, cache_key, themes)
+
+    def _remember(self, brand_data: dict, cache_key: tuple, themes: list[dict]) -> None:
+        """Cache a generated theme list and index it under the brand ID for invalidation"""
+        self._theme_cache.set(cache_key, copy.deepcopy(themes))
+        if brand_data.get('id'):
+            self._brand_keys.setdefault(brand_data['id'], set()).add(cache_key)
+
+    def _build_prompt(self, brand_data: dict, count: int) -> str:
+        """Build the theme generation prompt for a brand"""
+        return f"""You are a social media marketing expert. Based on the following brand information, generate {count} DIFFERENT Instagram theme options with specific parameters.
 
 Brand Information:
 - Name: {brand_data.get('name', 'Unknown')}
@@ -46,78 +296,43 @@ Return ONLY a valid JSON object with a "themes" array:
 IMPORTANT: Make each theme DISTINCTLY different - vary the mood, colors, imagery style, and tone across all {count} themes.
 """
 
-        try:
-            response = await self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a professional social media marketing expert who generates diverse, cohesive Instagram themes. Always respond with valid JSON only."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.9,
-                max_tokens=2000,
-                response_format={"type": "json_object"}
-            )
-
-            # Parse the response
-            result_text = response.choices[0].message.content
-            result = json.loads(result_text)
-            themes = result.get('themes', [])
+    @staticmethod
+    def _validate_theme(theme: dict) -> Optional[dict]:
+        """Return the theme with its colors normalized, or None if required fields are missing"""
+        if not isinstance(theme, dict):
+            return None
 
-            # Validate each theme
-            validated_themes = []
-            required_fields = ['name', 'mood', 'colors', 'imagery', 'tone', 'caption_length', 'use_emojis', 'use_hashtags']
+        # Ensure all required fields exist
+        required_fields = ['name', 'mood', 'colors', 'imagery', 'tone', 'caption_length', 'use_emojis', 'use_hashtags']
+        if not all(field in theme for field in required_fields):
+            return None
 
-            for theme in themes:
-                # Ensure all required fields exist
-                valid = all(field in theme for field in required_fields)
+        # Ensure colors is an array of 4 hex values
+        if not isinstance(theme.get('colors'), list) or len(theme.get('colors', [])) != 4:
+            theme['colors'] = ['#4F46E5', '#EC4899', '#F59E0B', '#10B981']
 
-                # Ensure colors is an array of 4 hex values
-                if not isinstance(theme.get('colors'), list) or len(theme.get('colors', [])) != 4:
-                    theme['colors'] = ['#4F46E5', '#EC4899', '#F59E0B', '#10B981']
+        return theme
 
-                if valid:
-                    validated_themes.append(theme)
+    @staticmethod
+    def _default_theme(brand_data: dict, i: int) -> dict:
+        """Default theme parameters used when OpenAI returns too few themes (or fails)"""
+        return {
+            "name": f"{brand_data.get('name', 'Brand')} Theme {i + 1}",
+            "mood": ["Professional", "Playful", "Elegant", "Bold", "Minimal"][i % 5],
+            "colors": [
+                ["#4F46E5", "#EC4899", "#F59E0B", "#10B981"],
+                ["#DC2626", "#F59E0B", "#10B981", "#3B82F6"],
+                ["#6B7280", "#D1D5DB", "#F3F4F6", "#111827"],
+                ["#EC4899", "#8B5CF6", "#F59E0B", "#10B981"],
+                ["#14B8A6", "#06B6D4", "#0EA5E9", "#3B82F6"]
+            ][i % 5],
+            "imagery": ["Product-focused", "Lifestyle", "Flat lay", "In-use", "Behind-the-scenes"][i % 5],
+            "tone": ["Professional", "Casual", "Inspirational", "Educational", "Conversational"][i % 5],
+            "caption_length": "medium",
+            "use_emojis": i % 2 == 0,
+            "use_hashtags": True
+        }
 
-            # If we didn't get enough themes, generate defaults
-            while len(validated_themes) < count:
-                validated_themes.append({
-                    "name": f"{brand_data.get('name', 'Brand')} Theme {len(validated_themes) + 1}",
-                    "mood": ["Professional", "Playful", "Elegant", "Bold", "Minimal"][len(validated_themes) % 5],
-                    "colors": [
-                        ["#4F46E5", "#EC4899", "#F59E0B", "#10B981"],
-                        ["#DC2626", "#F59E0B", "#10B981", "#3B82F6"],
-                        ["#6B7280", "#D1D5DB", "#F3F4F6", "#111827"],
-                        ["#EC4899", "#8B5CF6", "#F59E0B", "#10B981"],
-                        ["#14B8A6", "#06B6D4", "#0EA5E9", "#3B82F6"]
-                    ][len(validated_themes) % 5],
-                    "imagery": ["Product-focused", "Lifestyle", "Flat lay", "In-use", "Behind-the-scenes"][len(validated_themes) % 5],
-                    "tone": ["Professional", "Casual", "Inspirational", "Educational", "Conversational"][len(validated_themes) % 5],
-                    "caption_length": "medium",
-                    "use_emojis": len(validated_themes) % 2 == 0,
-                    "use_hashtags": True
-                })
-
-            return validated_themes[:count]
 
-        except Exception as e:
-            print(f"Error generating theme parameters: {e}")
-            # Return default theme parameters if AI generation fails
-            return [
-                {
-                    "name": f"{brand_data.get('name', 'Brand')} Theme {i + 1}",
-                    "mood": ["Professional", "Playful", "Elegant", "Bold", "Minimal"][i % 5],
-                    "colors": [
-                        ["#4F46E5", "#EC4899", "#F59E0B", "#10B981"],
-                        ["#DC2626", "#F59E0B", "#10B981", "#3B82F6"],
-                        ["#6B7280", "#D1D5DB", "#F3F4F6", "#111827"],
-                        ["#EC4899", "#8B5CF6", "#F59E0B", "#10B981"],
-                        ["#14B8A6", "#06B6D4", "#0EA5E9", "#3B82F6"]
-                    ][i % 5],
-                    "imagery": ["Product-focused", "Lifestyle", "Flat lay", "In-use", "Behind-the-scenes"][i % 5],
-                    "tone": ["Professional", "Casual", "Inspirational", "Educational", "Conversational"][i % 5],
-                    "caption_length": "medium",
-                    "use_emojis": i % 2 == 0,
-                    "use_hashtags": True
-                }
-                for i in range(count)
-            ]
+# Create a singleton instance
+openai_generator = OpenAIThemeGenerator()
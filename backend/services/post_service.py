@@ -0,0 +1,253 @@
+import asyncio
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from services.firestore_service import firestore_service
+from services.image_data import UploadedImage
+from services.theme_summary import post_summary
+
+# Subcollection (under each theme) holding one document per post
+POSTS_COLLECTION = 'posts'
+
+# Firestore allows at most 500 writes per batch
+BATCH_LIMIT = 500
+
+# Bookkeeping fields stored on post documents but not part of PostData
+INTERNAL_FIELDS = ('position', 'user_id')
+
+class PostService:
+    """
+    Theme posts stored as individual documents in themes/{theme_id}/posts
+
+    Each post document also carries its theme ID, owner and position, so posts can
+    be queried across themes (by status or scheduled_time) with a collection group
+    query. Themes written before posts moved out of the theme document still have
+    an embedded `posts` array; they are read as-is and migrated on their next write
+    (or by migrate_posts.py).
+    """
+
+    def collection(self, theme_id: str):
+        """Get the posts subcollection of a theme"""
+        return firestore_service.document('themes', theme_id).collection(POSTS_COLLECTION)
+
+    async def list_posts(self, theme_id: str, status: Optional[str] = None) -> List[Dict]:
+        """
+        Read a theme's posts in theme order
+
+        Args:
+            theme_id: Theme ID
+            status: Optional status filter (draft, scheduled, published)
+
+        Returns:
+            List of post data
+        """
+        posts = []
+        with firestore_service.timed('query', POSTS_COLLECTION):
+            async for doc in self.collection(theme_id).order_by('position').stream():
+                post = self._public(doc.to_dict())
+                if status is None or post.get('status') == status:
+                    posts.append(post)
+        return posts
+
+    async def get_post(self, theme_id: str, post_id: str) -> Optional[Dict]:
+        """Read one post, or None if it does not exist"""
+        with firestore_service.timed('get', POSTS_COLLECTION):
+            doc = await self.collection(theme_id).document(post_id).get()
+        return self._public(doc.to_dict()) if doc.exists else None
+
+    async def query_posts(
+        self,
+        user_id: str,
+        status: Optional[str] = None,
+        scheduled_from: Optional[str] = None,
+        scheduled_to: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        Query a user's posts across all themes
+
+        Args:
+            user_id: Owner of the posts
+            status: Optional status filter
+            scheduled_from: Only posts scheduled at or after this ISO time
+            scheduled_to: Only posts scheduled before this ISO time
+            limit: Optional maximum number of posts
+
+        Returns:
+            List of post data, ordered by scheduled_time when a time range is given
+        """
+        query = firestore_service.db.collection_group(POSTS_COLLECTION).where('user_id', '==', user_id)
+        if status:
+            query = query.where('status', '==', status)
+        if scheduled_from:
+            query = query.where('scheduled_time', '>=', scheduled_from)
+        if scheduled_to:
+            query = query.where('scheduled_time', '<', scheduled_to)
+        if scheduled_from or scheduled_to:
+            query = query.order_by('scheduled_time')
+        if limit is not None:
+            query = query.limit(limit)
+        with firestore_service.timed('query', POSTS_COLLECTION):
+            return [self._public(doc.to_dict()) async for doc in query.stream()]
+
+    async def attach_posts(self, theme_data: Dict) -> Dict:
+        """
+        Compatibility view: fill in theme_data['posts'] the way the embedded array used to be
+
+        Themes that still embed their posts are returned unchanged.
+        """
+        if 'posts' not in theme_data:
+            theme_data['posts'] = await self.list_posts(theme_data['id'])
+        return theme_data
+
+    async def attach_posts_all(self, themes: List[Dict]) -> List[Dict]:
+        """attach_posts for several themes, reading their posts concurrently"""
+        await asyncio.gather(*(self.attach_posts(theme_data) for theme_data in themes))
+        return themes
+
+    async def store_theme_posts(
+        self,
+        theme_id: str,
+        user_id: str,
+        posts: List[Dict],
+        theme_fields: Optional[Dict[str, Any]] = None,
+        stored: Optional[List[Dict]] = None
+    ) -> Dict:
+        """
+        Replace a theme's posts, writing only the posts that were added, changed or removed
+
+        The theme document gets the post counts and cover image (plus any theme_fields),
+        and its updated_at is bumped when any post changed so theme ETags change too.
+        A theme that still embeds its posts is migrated: the embedded array is removed
+        once every post has been written to the subcollection. Posts without an ID
+        (embedded by old versions) are given one.
+
+        Args:
+            theme_id: Theme ID
+            user_id: Owner of the theme
+            posts: The theme's complete list of posts, in order
+            theme_fields: Other theme fields to update in the same write
+            stored: The posts currently in the subcollection, in order, if the caller
+                knows them; only posts that differ are written. Otherwise only the
+                stored post IDs are read and every post is written.
+
+        Returns:
+            The fields written to the theme document
+        """
+        if stored is None:
+            known = dict.fromkeys(await self._post_ids(theme_id))
+        else:
+            known = {
+                post['id']: {**post, 'theme_id': theme_id, 'user_id': user_id, 'position': position}
+                for position, post in enumerate(stored) if post and post.get('id')
+            }
+
+        writes, deletes = [], set(known)
+        for position, post in enumerate(posts):
+            post.setdefault('id', str(uuid.uuid4()))
+            data = {**post, 'theme_id': theme_id, 'user_id': user_id, 'position': position}
+            deletes.discard(post['id'])
+            if known.get(post['id']) != data:
+                writes.append(data)
+
+        ops = [('set', post['id'], post) for post in writes] + [('delete', post_id, None) for post_id in deletes]
+        await self._commit(theme_id, ops)
+
+        fields = {**post_summary(posts), **(theme_fields or {})}
+        if ops and 'updated_at' not in fields:
+            fields['updated_at'] = datetime.utcnow().isoformat()
+        await firestore_service.update_document('themes', theme_id, fields)
+        theme_data = await firestore_service.get_document('themes', theme_id)
+        if theme_data is not None and 'posts' in theme_data:
+            await firestore_service.delete_fields('themes', theme_id, ['posts'])
+
+        if ops:
+            print(f"✅ Stored posts of theme {theme_id}: {len(writes)} written, {len(deletes)} deleted")
+        return fields
+
+    async def put_post(
+        self,
+        theme_id: str,
+        user_id: str,
+        post: Dict,
+        position: int,
+        replaces: Optional[str] = None,
+        theme_fields: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """
+        Write one post at its position, e.g. as soon as a generation job finishes it
+
+        Args:
+            theme_id: Theme ID
+            user_id: Owner of the theme
+            post: The post
+            position: Its position in the theme
+            replaces: ID of the post stored at that position before, deleted in the same batch
+            theme_fields: Theme fields to update with it (updated_at is always bumped)
+        """
+        ops = [('set', post['id'], {**post, 'theme_id': theme_id, 'user_id': user_id, 'position': position})]
+        if replaces and replaces != post['id']:
+            ops.append(('delete', replaces, None))
+        await self._commit(theme_id, ops)
+        await firestore_service.update_document(
+            'themes', theme_id, {'updated_at': datetime.utcnow().isoformat(), **(theme_fields or {})}
+        )
+
+    async def update_post(self, theme_id: str, post_id: str, data: Dict) -> None:
+        """
+        Update fields of one post
+
+        The theme's updated_at is bumped (it versions the theme's ETag); post counts and
+        the cover image stored on the theme are refreshed when the post's selection or
+        image changes.
+        """
+        with firestore_service.timed('update', POSTS_COLLECTION):
+            await self.collection(theme_id).document(post_id).update(data)
+        theme_fields = {'updated_at': datetime.utcnow().isoformat()}
+        if 'selected' in data or 'image_url' in data:
+            posts = await self.list_posts(theme_id)
+            theme_fields.update(post_summary(posts))
+        await firestore_service.update_document('themes', theme_id, theme_fields)
+
+    async def replace_image_url(self, old_url: str, uploaded: UploadedImage) -> int:
+        """
+        Point every post using old_url at an uploaded image and its derivatives (e.g. once a spooled image is uploaded)
+
+        Returns:
+            Number of posts updated
+        """
+        query = firestore_service.db.collection_group(POSTS_COLLECTION).where('image_url', '==', old_url)
+        with firestore_service.timed('query', POSTS_COLLECTION):
+            posts = [doc.to_dict() async for doc in query.stream()]
+        for post in posts:
+            await self.update_post(post['theme_id'], post['id'], {'image_url': uploaded.url, **uploaded.derivative_urls()})
+        return len(posts)
+
+    async def delete_posts(self, theme_id: str) -> None:
+        """Delete every post of a theme"""
+        await self._commit(theme_id, [('delete', post_id, None) for post_id in await self._post_ids(theme_id)])
+
+    async def _post_ids(self, theme_id: str) -> List[str]:
+        # Empty projection: only document names are returned, not the post data
+        with firestore_service.timed('query', POSTS_COLLECTION):
+            return [doc.id async for doc in self.collection(theme_id).select([]).stream()]
+
+    async def _commit(self, theme_id: str, ops: List[tuple]) -> None:
+        collection = self.collection(theme_id)
+        for start in range(0, len(ops), BATCH_LIMIT):
+            batch = firestore_service.db.batch()
+            for op, post_id, data in ops[start:start + BATCH_LIMIT]:
+                if op == 'set':
+                    batch.set(collection.document(post_id), data)
+                else:
+                    batch.delete(collection.document(post_id))
+            with firestore_service.timed('batch_commit', POSTS_COLLECTION):
+                await batch.commit()
+
+    @staticmethod
+    def _public(data: Dict) -> Dict:
+        return {k: v for k, v in data.items() if k not in INTERNAL_FIELDS}
+
+
+# Create a singleton instance
+post_service = PostService()
@@ -0,0 +1,216 @@
+import asyncio
+import contextlib
+import re
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Dict, Optional, Tuple
+from config import get_settings
+
+settings = get_settings()
+
+
+class ProviderHTTPError(Exception):
+    """An error response from an AI provider, with its status code and any server-requested delay"""
+
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def throttled(self) -> bool:
+        """Whether the provider asked us to slow down (429) or is overloaded (5xx)"""
+        return self.status_code == 429 or self.status_code >= 500
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After value: delay seconds, an HTTP date, or a Google RPC duration ("30s")
+
+    Returns:
+        Seconds to wait, or None if the value is missing or unparseable
+    """
+    if not value:
+        return None
+    value = str(value).strip()
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)s?', value)
+    if match:
+        return float(match.group(1))
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class Permit:
+    """One admitted request; report its outcome with observe()"""
+
+    def __init__(self):
+        self.status_code: Optional[int] = None
+        self.retry_after: Optional[float] = None
+
+    def observe(self, status_code: int, retry_after: Optional[str] = None) -> None:
+        """Record the response status and Retry-After header"""
+        self.status_code = status_code
+        parsed = parse_retry_after(retry_after)
+        if parsed is not None:
+            self.retry_after = parsed
+
+
+class AdaptiveLimiter:
+    """
+    Per provider/model admission control: a token bucket plus an AIMD concurrency window
+
+    The token bucket caps requests per minute (with a burst of `burst` requests).
+    The window caps requests in flight: it grows additively (about +1 per window's
+    worth of successes) and is halved on a 429 or 5xx, at most once per cool-down so
+    a burst of failures from the same window only counts once. A Retry-After from
+    the provider pauses all new requests until it has passed.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float,
+        max_concurrency: int,
+        min_concurrency: int = 1,
+        burst: Optional[int] = None,
+        decrease_factor: float = 0.5,
+        cooldown_seconds: float = 5.0
+    ):
+        self.name = name
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(burst or max(1, max_concurrency))
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.decrease_factor = decrease_factor
+        self.cooldown_seconds = cooldown_seconds
+        self.window = float(max_concurrency)
+        self.in_flight = 0
+        self._tokens = self.capacity
+        self._refilled_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._decreased_at = 0.0
+        self._released: Optional[asyncio.Event] = None
+        self.admitted = 0
+        self.throttled = 0
+        self.cancelled = 0
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> AsyncIterator[Permit]:
+        """
+        Wait for admission, then hold a concurrency slot for the duration of the block
+
+        Yields:
+            A Permit; call permit.observe(status_code, retry_after_header) once the response arrives.
+            An exception carrying `status_code`/`retry_after` (e.g. ProviderHTTPError) counts as observed.
+        """
+        await self._acquire()
+        permit = Permit()
+        try:
+            yield permit
+        except asyncio.CancelledError:
+            # The caller went away (client disconnected, job cancelled, hedge lost) mid-call
+            self.cancelled += 1
+            raise
+        except BaseException as e:
+            if getattr(e, 'status_code', None) is not None:
+                permit.status_code = e.status_code
+            if getattr(e, 'retry_after', None) is not None:
+                permit.retry_after = e.retry_after
+            raise
+        finally:
+            self._release(permit)
+
+    def stats(self) -> Dict[str, float]:
+        """Current window, in-flight count and counters"""
+        return {
+            'window': round(self.window, 2),
+            'in_flight': self.in_flight,
+            'tokens': round(self._tokens, 2),
+            'blocked_for': round(max(0.0, self._blocked_until - time.monotonic()), 2),
+            'admitted': self.admitted,
+            'throttled': self.throttled,
+            'cancelled': self.cancelled
+        }
+
+    async def _acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._blocked_until:
+                delay = self._blocked_until - now
+            elif self.in_flight >= int(self.window):
+                delay = None
+            elif self._tokens < 1:
+                delay = (1 - self._tokens) / self.rate
+            else:
+                self._tokens -= 1
+                self.in_flight += 1
+                self.admitted += 1
+                return
+            # Woken early by a release, otherwise re-check once the delay has passed.
+            # Not asyncio.wait_for: before Python 3.12 it can drop a cancel that arrives as
+            # the wait ends, admitting a caller that already went away.
+            if self._released is None:
+                self._released = asyncio.Event()
+            waiter = asyncio.ensure_future(self._released.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=delay)
+            finally:
+                waiter.cancel()
+
+    def _release(self, permit: Permit) -> None:
+        # Synchronous, so a caller cancelled again while leaving its slot cannot leak it
+        self.in_flight -= 1
+        now = time.monotonic()
+        status_code = permit.status_code
+        if status_code is not None and (status_code == 429 or status_code >= 500):
+            self.throttled += 1
+            if now - self._decreased_at >= self.cooldown_seconds:
+                self.window = max(self.min_concurrency, self.window * self.decrease_factor)
+                self._decreased_at = now
+                print(f"⚠️ {self.name}: {status_code} received, concurrency window now {self.window:.1f}")
+        elif status_code is not None and status_code < 400:
+            self.window = min(self.max_concurrency, self.window + 1.0 / max(self.window, 1.0))
+        if permit.retry_after:
+            self._blocked_until = max(self._blocked_until, now + permit.retry_after)
+        if self._released is not None:
+            # Wake every waiter to re-check; later waiters wait on a fresh event
+            self._released.set()
+            self._released = None
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+
+class RateLimiterRegistry:
+    """One shared AdaptiveLimiter per (provider, model)"""
+
+    def __init__(self):
+        self._limiters: Dict[Tuple[str, str], AdaptiveLimiter] = {}
+
+    def get(self, provider: str, model: str, requests_per_minute: float, max_concurrency: int) -> AdaptiveLimiter:
+        """Get (or create) the limiter for a provider and model"""
+        key = (provider, model)
+        if key not in self._limiters:
+            self._limiters[key] = AdaptiveLimiter(
+                f"{provider}/{model}",
+                requests_per_minute=requests_per_minute,
+                max_concurrency=max_concurrency,
+                cooldown_seconds=settings.rate_limit_cooldown_seconds
+            )
+        return self._limiters[key]
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Stats of every limiter, keyed by provider/model"""
+        return {limiter.name: limiter.stats() for limiter in self._limiters.values()}
+
+
+# Create a singleton instance
+rate_limiters = RateLimiterRegistry()
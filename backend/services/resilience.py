@@ -0,0 +1,166 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+import httpx
+from config import get_settings
+from services.rate_limiter import ProviderHTTPError
+
+settings = get_settings()
+
+T = TypeVar('T')
+
+
+class AttemptTimeout(Exception):
+    """A single attempt exceeded its deadline"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Transient failures worth another attempt: throttling, 5xx, timeouts and connection errors"""
+    if isinstance(error, ProviderHTTPError):
+        return error.throttled
+    return isinstance(error, (AttemptTimeout, asyncio.TimeoutError, httpx.TransportError))
+
+
+class LatencyTracker:
+    """Sliding window of recent successful call durations"""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int) -> Optional[float]:
+        """The q-quantile of recent durations, or None until there are enough samples"""
+        if len(self._samples) < min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ResilientCaller:
+    """
+    Retries with jittered exponential backoff, per-attempt deadlines and optional hedging
+
+    Each attempt gets its own deadline, shorter than the overall budget. When hedging
+    is on and enough latencies have been observed, an identical second request is
+    started once an attempt runs past the observed p95; whichever finishes first
+    wins and the other is cancelled. Hedges are capped at a fraction of primary
+    requests so tail-latency insurance never more than marginally increases spend.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_attempts: int,
+        attempt_timeout: float,
+        total_budget: float,
+        hedge: bool = False
+    ):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.attempt_timeout = attempt_timeout
+        self.total_budget = total_budget
+        self.hedge = hedge
+        self.latency = LatencyTracker()
+        self.metrics: Dict[str, int] = {
+            'calls': 0,
+            'requests': 0,
+            'retries': 0,
+            'attempt_timeouts': 0,
+            'hedges': 0,
+            'hedge_wins': 0,
+            'hedges_skipped_budget': 0,
+            'failures': 0
+        }
+
+    async def call(self, request: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run `request` (a factory for one provider call) with retries and hedging
+
+        Raises:
+            The last error once attempts or the overall budget run out, or any non-retryable error
+        """
+        self.metrics['calls'] += 1
+        deadline = time.monotonic() + self.total_budget
+        attempt = 0
+        while True:
+            attempt += 1
+            remaining = deadline - time.monotonic()
+            try:
+                return await self._attempt(request, min(self.attempt_timeout, remaining))
+            except Exception as e:
+                remaining = deadline - time.monotonic()
+                if attempt >= self.max_attempts or not is_retryable(e) or remaining <= 0:
+                    self.metrics['failures'] += 1
+                    raise
+                delay = random.uniform(0, min(settings.retry_max_delay, settings.retry_base_delay * 2 ** (attempt - 1)))
+                retry_after = getattr(e, 'retry_after', None)
+                if retry_after:
+                    delay = max(delay, retry_after)
+                if delay >= remaining:
+                    self.metrics['failures'] += 1
+                    raise
+                self.metrics['retries'] += 1
+                print(f"⚠️ {self.name} attempt {attempt} failed ({e}); retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, float]:
+        """Counters plus the current hedge threshold"""
+        threshold = self._hedge_threshold()
+        return {**self.metrics, 'hedge_after_seconds': round(threshold, 3) if threshold else None}
+
+    async def _attempt(self, request: Callable[[], Awaitable[T]], timeout: float) -> T:
+        started = time.monotonic()
+        tasks = {self._start(request)}
+        hedge_task = None
+        try:
+            end = started + timeout
+            hedge_at = self._hedge_threshold()
+            errors = []
+            while tasks:
+                now = time.monotonic()
+                if now >= end:
+                    self.metrics['attempt_timeouts'] += 1
+                    raise AttemptTimeout(f"{self.name} attempt timed out after {timeout:.1f}s")
+                wait_until = end
+                if hedge_task is None and hedge_at is not None and started + hedge_at < end:
+                    wait_until = min(wait_until, started + hedge_at)
+                done, _ = await asyncio.wait(tasks, timeout=max(0.0, wait_until - now), return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    tasks.discard(task)
+                    if task.exception() is None:
+                        self.latency.record(time.monotonic() - started)
+                        if task is hedge_task:
+                            self.metrics['hedge_wins'] += 1
+                        return task.result()
+                    errors.append(task.exception())
+
+                if not done and hedge_task is None and hedge_at is not None and time.monotonic() >= started + hedge_at:
+                    if self._hedge_allowed():
+                        self.metrics['hedges'] += 1
+                        hedge_task = self._start(request)
+                        tasks.add(hedge_task)
+                    else:
+                        self.metrics['hedges_skipped_budget'] += 1
+                    hedge_at = None
+            raise errors[0]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _start(self, request: Callable[[], Awaitable[T]]) -> asyncio.Task:
+        self.metrics['requests'] += 1
+        return asyncio.ensure_future(request())
+
+    def _hedge_threshold(self) -> Optional[float]:
+        if not self.hedge:
+            return None
+        return self.latency.quantile(settings.hedge_quantile, settings.hedge_min_samples)
+
+    def _hedge_allowed(self) -> bool:
+        # Extra spend cap: hedges may be at most hedge_budget_ratio of all primary calls
+        return self.metrics['hedges'] < settings.hedge_budget_ratio * self.metrics['calls']
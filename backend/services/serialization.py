@@ -0,0 +1,105 @@
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Type, Union, get_args, get_origin
+import orjson
+from fastapi import Response
+from pydantic import BaseModel
+
+# Like json.dumps, accept int/float dict keys
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode JSON with orjson (UTF-8 bytes; datetimes as ISO strings)"""
+    return orjson.dumps(obj, option=ORJSON_OPTIONS)
+
+
+def dumps_str(obj: Any) -> str:
+    """Encode JSON with orjson as text"""
+    return orjson.dumps(obj, option=ORJSON_OPTIONS).decode('utf-8')
+
+
+def from_store(model: Type[BaseModel], data: Dict) -> Dict:
+    """
+    Shape a document we wrote ourselves like `model`, without validating it again
+
+    Documents in Firestore were validated when they were written, so reads only
+    need the model's fields, with defaults for missing ones. Nested models (e.g. a
+    theme's posts) are shaped the same way; fields the model does not declare are
+    dropped. The result is a plain dict ready for json_response.
+
+    Args:
+        model: Pydantic model class the response is documented with
+        data: Stored document data
+
+    Returns:
+        Dict with exactly the model's fields
+    """
+    shaped = {}
+    for name, default, nested, many in _plan(model):
+        value = data.get(name, default)
+        if nested is not None and value is not None:
+            value = [from_store(nested, item) for item in value if item is not None] if many else from_store(nested, value)
+        shaped[name] = value
+    return shaped
+
+
+def from_store_all(model: Type[BaseModel], docs: List[Dict]) -> List[Dict]:
+    """from_store for a list of documents"""
+    return [from_store(model, data) for data in docs]
+
+
+def json_response(content: Any, response: Optional[Response] = None) -> Response:
+    """
+    Encode content with orjson into a response, bypassing FastAPI's response_model pass
+
+    Returning a Response skips FastAPI dumping the content, validating it against
+    response_model and encoding it again. Keep response_model on the route for the
+    OpenAPI schema.
+
+    Args:
+        content: JSON-serializable content (e.g. from from_store)
+        response: The handler's injected Response, whose headers (X-Next-Cursor, ETag) are kept
+
+    Returns:
+        application/json response
+    """
+    return Response(
+        content=dumps(content),
+        media_type='application/json',
+        headers=handler_headers(response) if response is not None else None
+    )
+
+
+def handler_headers(response: Response) -> Dict[str, str]:
+    """Headers a handler set on its injected Response, for a Response it returns itself"""
+    return {
+        key: value for key, value in response.headers.items()
+        if key.lower() not in ('content-length', 'content-type')
+    }
+
+
+@lru_cache(maxsize=None)
+def _plan(model: Type[BaseModel]) -> Tuple[Tuple[str, Any, Optional[Type[BaseModel]], bool], ...]:
+    # (field name, default, nested model, is list of nested models), resolved once per model
+    plan = []
+    for name, field in model.model_fields.items():
+        default = None if field.is_required() else field.get_default(call_default_factory=True)
+        nested, many = _nested_model(field.annotation)
+        plan.append((name, default, nested, many))
+    return tuple(plan)
+
+
+def _nested_model(annotation: Any) -> Tuple[Optional[Type[BaseModel]], bool]:
+    if get_origin(annotation) is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) != 1:
+            return None, False
+        annotation = args[0]
+    if get_origin(annotation) in (list, List):
+        (item,) = get_args(annotation) or (Any,)
+        return (item, True) if _is_model(item) else (None, False)
+    return (annotation, False) if _is_model(annotation) else (None, False)
+
+
+def _is_model(annotation: Any) -> bool:
+    return isinstance(annotation, type) and issubclass(annotation, BaseModel)
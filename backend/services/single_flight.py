@@ -0,0 +1,140 @@
+import asyncio
+import copy
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class _Call:
+    """One in-flight call and how many callers are waiting for it"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiting = 0
+
+
+class _SharedStream:
+    """Items of one async iterator, buffered so late joiners can replay them"""
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._updated = asyncio.Event()
+
+    def notify(self) -> None:
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def wait(self) -> None:
+        await self._updated.wait()
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical requests into one underlying call
+
+    Callers with the same key while a call is in flight share its result (each
+    gets its own deep copy). Every caller can be cancelled independently; the
+    underlying call is only cancelled once no caller is waiting for it anymore.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._streams: Dict[Hashable, _SharedStream] = {}
+        self.metrics = {'calls': 0, 'coalesced': 0, 'abandoned': 0}
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run factory() unless an identical call is already in flight, then share its result
+
+        Args:
+            key: Normalized request key
+            factory: Starts the underlying call
+        """
+        call = self._calls.get(key)
+        if call is None:
+            self.metrics['calls'] += 1
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _, key=key, call=call: self._forget(self._calls, key, call))
+        else:
+            self.metrics['coalesced'] += 1
+
+        call.waiting += 1
+        try:
+            result = await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if not call.task.done() and call.waiting == 1:
+                # This was the last caller interested in the result
+                self.metrics['abandoned'] += 1
+                self._forget(self._calls, key, call)
+                call.task.cancel()
+            raise
+        finally:
+            call.waiting -= 1
+        return copy.deepcopy(result)
+
+    async def stream(self, key: Hashable, factory: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """
+        Iterate factory() unless an identical stream is already in flight, then follow that one
+
+        Late joiners first receive every item produced so far. The underlying stream
+        is cancelled once every subscriber has stopped iterating.
+        """
+        shared = self._streams.get(key)
+        if shared is None:
+            self.metrics['calls'] += 1
+            shared = _SharedStream()
+            self._streams[key] = shared
+            shared.task = asyncio.ensure_future(self._pump(key, shared, factory()))
+        else:
+            self.metrics['coalesced'] += 1
+
+        shared.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(shared.items):
+                    item = shared.items[index]
+                    index += 1
+                    yield copy.deepcopy(item)
+                if shared.done:
+                    if shared.error is not None:
+                        raise shared.error
+                    return
+                await shared.wait()
+        finally:
+            shared.subscribers -= 1
+            if shared.subscribers == 0 and not shared.done:
+                self.metrics['abandoned'] += 1
+                self._forget(self._streams, key, shared)
+                shared.task.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        """Underlying calls made, callers that joined an in-flight call, and calls abandoned by every caller"""
+        return {**self.metrics, 'in_flight': len(self._calls) + len(self._streams)}
+
+    async def _pump(self, key: Hashable, shared: _SharedStream, source: AsyncIterator[T]) -> None:
+        try:
+            async for item in source:
+                shared.items.append(item)
+                shared.notify()
+        except asyncio.CancelledError:
+            shared.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            shared.error = e
+        finally:
+            shared.done = True
+            self._forget(self._streams, key, shared)
+            shared.notify()
+
+    @staticmethod
+    def _forget(registry: Dict[Hashable, Any], key: Hashable, value: Any) -> None:
+        # A finished call must not be joined, but a newer call under the same key stays
+        if registry.get(key) is value:
+            del registry[key]
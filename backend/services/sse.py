@@ -0,0 +1,78 @@
+import asyncio
+from typing import AsyncIterator, Dict, Optional
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from config import get_settings
+from services.serialization import dumps_str
+
+settings = get_settings()
+
+# Headers that keep proxies from buffering or caching an event stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+    "Connection": "keep-alive",
+}
+
+
+def format_sse(payload: Dict, event_id: Optional[str] = None) -> str:
+    """
+    Encode one Server-Sent Event (every SSE endpoint goes through this encoder)
+
+    Args:
+        payload: JSON-serializable event data
+        event_id: Optional event ID (echoed back by the browser as Last-Event-ID on reconnect)
+
+    Returns:
+        SSE message text
+    """
+    data = dumps_str(payload)
+    if event_id is None:
+        return f"data: {data}\n\n"
+    return f"id: {event_id}\ndata: {data}\n\n"
+
+
+def sse_response(messages: AsyncIterator[str], request: Optional[Request] = None) -> StreamingResponse:
+    """
+    Wrap encoded SSE messages in a streaming text/event-stream response
+
+    With the request, the message generator is closed as soon as the client disconnects.
+    """
+    if request is not None:
+        messages = until_disconnected(request, messages)
+    return StreamingResponse(messages, media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+async def until_disconnected(
+    request: Request,
+    messages: AsyncIterator[str],
+    poll_interval: Optional[float] = None
+) -> AsyncIterator[str]:
+    """
+    Relay messages until the client disconnects, then close the message generator
+
+    A closed connection only shows up as the ASGI http.disconnect message (or a failed
+    send once the next event is ready), so while waiting for the next message the
+    request is polled with Request.is_disconnected(). Closing the generator runs its
+    cleanup right away instead of whenever the next event would have been sent.
+    """
+    interval = poll_interval or settings.stream_disconnect_poll_interval
+    pending = None
+    try:
+        while True:
+            pending = asyncio.ensure_future(messages.__anext__())
+            while not (await asyncio.wait({pending}, timeout=interval))[0]:
+                if await request.is_disconnected():
+                    print(f"⚠️ Client disconnected from {request.url.path}")
+                    return
+            try:
+                message = pending.result()
+            except StopAsyncIteration:
+                return
+            pending = None
+            yield message
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        await messages.aclose()
@@ -1,46 +1,75 @@
-import base64
+import asyncio
+import functools
+import io
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from config import get_settings
 from firebase_config import get_storage_bucket
-from typing import Optional
+from services.image_data import GeneratedImage, UploadedImage
+from services.image_derivatives import derivative_renderer
+from services.metrics import storage_upload_seconds, storage_uploaded_bytes
+from services.tracing import tracer
+from typing import BinaryIO, Dict, List, Optional, Union
 import mimetypes
 
+settings = get_settings()
+
+class ImageUploadError(Exception):
+    """Raised when an upload fails; keeps the image so callers can fall back to it"""
+
+    def __init__(self, message: str, image: Optional[GeneratedImage] = None):
+        super().__init__(message)
+        self.image = image
+
 class StorageService:
     """Service for handling file uploads to Firebase Storage"""
 
     def __init__(self):
         self.bucket = get_storage_bucket()
+        # Dedicated pool so blocking storage I/O never runs on the event loop
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.storage_upload_workers,
+            thread_name_prefix="storage-upload"
+        )
 
-    def upload_base64_image(
+    def upload_image(
         self,
-        base64_data: str,
+        image: Union[GeneratedImage, bytes, bytearray, memoryview, BinaryIO],
         folder: str = "generated_images",
-        filename: Optional[str] = None
+        filename: Optional[str] = None,
+        mime_type: Optional[str] = None,
+        cancelled: Optional[threading.Event] = None
     ) -> str:
         """
-        Upload a base64 encoded image to Firebase Storage
+        Upload raw image bytes (or a readable buffer) to Firebase Storage
 
         Args:
-            base64_data: Base64 data URL (e.g., "data:image/png;base64,iVBORw0...")
+            image: GeneratedImage, bytes-like object, or binary file-like object
             folder: Folder path in storage bucket
             filename: Optional filename (will generate UUID if not provided)
+            mime_type: Mime type of the data (taken from GeneratedImage, else image/png)
+            cancelled: Set when the caller gave up: the upload is skipped if it has not
+                started yet, and deleted again if it was already in progress
 
         Returns:
             Public URL of the uploaded image
+
+        Raises:
+            ImageUploadError: If the upload fails (or was skipped)
         """
+        generated = image if isinstance(image, GeneratedImage) else None
         try:
-            # Parse the base64 data URL
-            # Format: "data:image/png;base64,{base64_string}"
-            if base64_data.startswith('data:'):
-                # Extract mime type and base64 string
-                header, encoded = base64_data.split(',', 1)
-                mime_type = header.split(':')[1].split(';')[0]
-            else:
-                # If no data URL prefix, assume it's pure base64
-                encoded = base64_data
-                mime_type = 'image/png'
+            if generated is not None:
+                mime_type = mime_type or generated.mime_type
+                image = generated.data
+            mime_type = mime_type or 'image/png'
 
-            # Decode base64 to bytes
-            image_bytes = base64.b64decode(encoded)
+            # Wrap bytes in a stream without re-encoding; file-like objects are used as-is
+            if isinstance(image, (bytes, bytearray, memoryview)):
+                stream = io.BytesIO(image)
+            else:
+                stream = image
 
             # Generate filename if not provided
             if not filename:
@@ -51,15 +80,20 @@ class StorageService:
             # Create blob path
             blob_path = f"{folder}/{filename}"
             blob = self.bucket.blob(blob_path)
+            if cancelled is not None and cancelled.is_set():
+                raise ImageUploadError(f"Upload of {blob_path} cancelled", image=generated)
 
-            # Upload the image
-            blob.upload_from_string(
-                image_bytes,
-                content_type=mime_type
+            # Upload the image and make it publicly readable in the same request
+            blob.upload_from_file(
+                stream,
+                rewind=True,
+                content_type=mime_type,
+                predefined_acl='publicRead'
             )
-
-            # Make the blob publicly accessible
-            blob.make_public()
+            if cancelled is not None and cancelled.is_set():
+                # The request cannot be interrupted once sent; remove what nobody will use
+                blob.delete()
+                raise ImageUploadError(f"Upload of {blob_path} cancelled", image=generated)
 
             # Get the public URL
             public_url = blob.public_url
@@ -69,9 +103,159 @@ class StorageService:
 
             return public_url
 
+        except ImageUploadError:
+            raise
         except Exception as e:
             print(f"❌ Error uploading image to Firebase Storage: {e}")
+            raise ImageUploadError(f"Failed to upload image: {str(e)}", image=generated)
+
+    def upload_base64_image(
+        self,
+        base64_data: str,
+        folder: str = "generated_images",
+        filename: Optional[str] = None
+    ) -> str:
+        """
+        Upload a base64 encoded image to Firebase Storage
+
+        Args:
+            base64_data: Base64 data URL (e.g., "data:image/png;base64,iVBORw0...")
+            folder: Folder path in storage bucket
+            filename: Optional filename (will generate UUID if not provided)
+
+        Returns:
+            Public URL of the uploaded image
+        """
+        try:
+            image = GeneratedImage.from_data_url(base64_data)
+        except Exception as e:
+            print(f"❌ Error decoding base64 image: {e}")
             raise Exception(f"Failed to upload image: {str(e)}")
+        return self.upload_image(image, folder=folder, filename=filename)
+
+    async def upload_image_async(
+        self,
+        image: Union[GeneratedImage, bytes, bytearray, memoryview, BinaryIO],
+        folder: str = "generated_images",
+        filename: Optional[str] = None,
+        mime_type: Optional[str] = None
+    ) -> str:
+        """
+        Upload an image without blocking the event loop
+
+        Cancelling the caller stops the upload: one still waiting for a thread never
+        starts, and one already sending is deleted from Storage once it completes.
+
+        Args:
+            image: GeneratedImage, bytes-like object, or binary file-like object
+            folder: Folder path in storage bucket
+            filename: Optional filename (will generate UUID if not provided)
+            mime_type: Mime type of the data (taken from GeneratedImage, else image/png)
+
+        Returns:
+            Public URL of the uploaded image
+        """
+        loop = asyncio.get_running_loop()
+        size = self._byte_size(image)
+        cancelled = threading.Event()
+        with tracer.span('storage.upload', folder=folder, filename=filename, bytes=size), storage_upload_seconds.time():
+            try:
+                url = await loop.run_in_executor(
+                    self._executor,
+                    functools.partial(
+                        self.upload_image,
+                        image,
+                        folder=folder,
+                        filename=filename,
+                        mime_type=mime_type,
+                        cancelled=cancelled
+                    )
+                )
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        if size is not None:
+            storage_uploaded_bytes.inc(size)
+        return url
+
+    @staticmethod
+    def _byte_size(image: Union[GeneratedImage, bytes, bytearray, memoryview, BinaryIO]) -> Optional[int]:
+        """Size of the data being uploaded, if known without reading a stream"""
+        if isinstance(image, GeneratedImage):
+            return len(image.data)
+        if isinstance(image, memoryview):
+            return image.nbytes
+        if isinstance(image, (bytes, bytearray)):
+            return len(image)
+        return None
+
+    async def upload_with_derivatives_async(
+        self,
+        image: GeneratedImage,
+        folder: str = "generated_images",
+        filename: Optional[str] = None
+    ) -> UploadedImage:
+        """
+        Upload an image plus its thumbnail and medium WebP derivatives, stored next to it
+
+        Derivatives are rendered in a process pool while the original uploads. A failed
+        derivative is logged and left out; only a failed original upload raises. If the
+        original fails or the caller is cancelled, uploads not started yet are skipped and
+        finished ones deleted.
+
+        Args:
+            image: The generated image
+            folder: Folder path in storage bucket
+            filename: Optional filename (will generate UUID if not provided)
+
+        Returns:
+            URLs of the original and its derivatives
+
+        Raises:
+            ImageUploadError: If the original upload fails
+        """
+        filename = filename or f"{uuid.uuid4()}{image.extension}"
+        if not derivative_renderer.enabled:
+            return UploadedImage(url=await self.upload_image_async(image, folder=folder, filename=filename))
+
+        url, uploaded = None, []
+        derivatives = asyncio.ensure_future(self._upload_derivatives(image, folder, filename, uploaded))
+        try:
+            url = await self.upload_image_async(image, folder=folder, filename=filename)
+            derivative_urls = await derivatives
+        except BaseException:
+            derivatives.cancel()
+            await asyncio.gather(derivatives, return_exceptions=True)
+            # Derivatives are useless without their original, and the original without its
+            # caller; delete whatever was uploaded off the event loop
+            loop = asyncio.get_running_loop()
+            for path in uploaded + ([f"{folder}/{filename}"] if url is not None else []):
+                loop.run_in_executor(self._executor, self.delete_image, path)
+            raise
+        return UploadedImage(url=url, **derivative_urls)
+
+    async def _upload_derivatives(self, image: GeneratedImage, folder: str, filename: str, uploaded: List[str]) -> Dict[str, str]:
+        # Appends the path of each derivative to `uploaded` as soon as it is stored
+        stem = filename.rsplit('.', 1)[0]
+
+        async def upload(name: str, derivative: GeneratedImage) -> str:
+            url = await self.upload_image_async(derivative, folder=folder, filename=f"{stem}_{name}.webp")
+            uploaded.append(f"{folder}/{stem}_{name}.webp")
+            return url
+
+        try:
+            with tracer.span('storage.render_derivatives', filename=filename):
+                rendered = await derivative_renderer.render(image)
+            urls = await asyncio.gather(*(upload(name, derivative) for name, derivative in rendered.items()))
+        except Exception as e:
+            print(f"⚠️ Failed to create image derivatives for {folder}/{filename}: {e}")
+            return {}
+        return {f"{name}_url": url for name, url in zip(rendered, urls)}
+
+    def shutdown(self) -> None:
+        """Wait for in-flight uploads and release the upload thread pool and derivative processes"""
+        self._executor.shutdown(wait=True)
+        derivative_renderer.shutdown()
 
     def delete_image(self, file_path: str) -> bool:
         """
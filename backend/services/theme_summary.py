@@ -0,0 +1,43 @@
+from typing import Dict, List, Optional
+
+# Theme fields fetched for the summary list (posts themselves are never read)
+THEME_SUMMARY_FIELDS = [
+    'brand_id', 'user_id', 'name', 'posts_count', 'mood', 'colors', 'tone',
+    'generated_posts', 'selected_posts', 'cover_image_url', 'cover_thumbnail_url', 'created_at', 'updated_at'
+]
+
+# Brand fields fetched for the summary list (reference images and long text are left out)
+BRAND_SUMMARY_FIELDS = ['user_id', 'name', 'category', 'logo_image', 'created_date', 'updated_at']
+
+
+def post_summary(posts: List[Dict]) -> Dict:
+    """
+    Counts and cover image stored alongside a theme's posts
+
+    These are written whenever a theme's posts change, so the summary list can be
+    served from a projection without loading the posts.
+
+    Args:
+        posts: The theme's posts (None entries are ignored)
+
+    Returns:
+        Dict with generated_posts, selected_posts, cover_image_url and cover_thumbnail_url
+    """
+    posts = [post for post in posts if post]
+    cover = cover_post(posts) or {}
+    return {
+        'generated_posts': len(posts),
+        'selected_posts': sum(1 for post in posts if post.get('selected')),
+        'cover_image_url': cover.get('image_url'),
+        'cover_thumbnail_url': cover.get('thumbnail_url')
+    }
+
+
+def cover_post(posts: List[Dict]) -> Optional[Dict]:
+    """The first selected post with an image, else the first post with one (inline base64 fallbacks are skipped)"""
+    ordered = [post for post in posts if post.get('selected')] + [post for post in posts if not post.get('selected')]
+    for post in ordered:
+        url = post.get('image_url')
+        if url and not url.startswith('data:'):
+            return post
+    return None
@@ -0,0 +1,207 @@
+import abc
+import asyncio
+import contextlib
+import contextvars
+import json
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+from config import get_settings
+
+settings = get_settings()
+
+
+@dataclass
+class Span:
+    """One timed stage of a trace"""
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    name: str
+    start: float  # wall-clock time (epoch seconds)
+    duration: Optional[float] = None  # seconds, set when the span ends
+    status: str = 'ok'  # ok, error or cancelled
+    error: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    def set(self, **attributes: Any) -> None:
+        """Add attributes (e.g. sizes or IDs known only once the stage has run)"""
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class SpanExporter(abc.ABC):
+    """Receives every finished span; subclass and add with tracer.add_exporter()"""
+
+    @abc.abstractmethod
+    def export(self, span: Span) -> None:
+        """Handle one finished span (called on the event loop, so hand off any I/O)"""
+
+    def shutdown(self) -> None:
+        pass
+
+
+class JsonLinesExporter(SpanExporter):
+    """
+    Append finished spans to a local file, one JSON object per line
+
+    Spans are handed to a writer thread, so tracing never blocks the event loop on disk I/O.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: "queue.SimpleQueue[Optional[Span]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write_loop, name='trace-exporter', daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span) -> None:
+        self._queue.put(span)
+
+    def shutdown(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _write_loop(self) -> None:
+        with open(self.path, 'a', encoding='utf-8') as file:
+            while True:
+                span = self._queue.get()
+                if span is None:
+                    return
+                file.write(json.dumps(span.to_dict(), default=str) + '\n')
+                # Write out whatever else is already waiting before flushing
+                while not self._queue.empty():
+                    span = self._queue.get()
+                    if span is None:
+                        file.flush()
+                        return
+                    file.write(json.dumps(span.to_dict(), default=str) + '\n')
+                file.flush()
+
+
+class Tracer:
+    """
+    In-process tracing: nested spans carried in a context variable
+
+    asyncio tasks copy the context they are created in, so spans opened in tasks
+    started by a span (gathered posts, background uploads) become its children.
+    Finished spans go to every exporter and are kept per trace in memory, so the
+    slowest recent traces can be inspected without an external collector.
+    """
+
+    def __init__(self, max_traces: int = 200, max_spans_per_trace: int = 1000):
+        self.max_traces = max_traces
+        self.max_spans_per_trace = max_spans_per_trace
+        self._current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar('current_span', default=None)
+        self._exporters: List[SpanExporter] = []
+        self._traces: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def current_span(self) -> Optional[Span]:
+        """The innermost open span of the running task, if any"""
+        return self._current.get()
+
+    def add_exporter(self, exporter: SpanExporter) -> None:
+        self._exporters.append(exporter)
+
+    def shutdown(self) -> None:
+        """Flush and close every exporter"""
+        for exporter in self._exporters:
+            exporter.shutdown()
+        self._exporters = []
+
+    @contextlib.contextmanager
+    def span(self, name: str, root: bool = False, **attributes: Any) -> Iterator[Span]:
+        """
+        Time a stage as a child of the current span (or as a new trace)
+
+        Args:
+            name: Stage name, e.g. "gemini.image_request"
+            root: Start a new trace even if a span is open
+            attributes: Attributes recorded on the span
+
+        Yields:
+            The span, for attributes known only while it runs
+        """
+        parent = None if root else self._current.get()
+        span = Span(
+            trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=parent.span_id if parent else None,
+            name=name,
+            start=time.time(),
+            attributes=attributes
+        )
+        token = self._current.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.status = 'cancelled' if isinstance(e, (asyncio.CancelledError, GeneratorExit)) else 'error'
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            try:
+                self._current.reset(token)
+            except ValueError:
+                # Closed from another context (e.g. an async generator finalized elsewhere)
+                self._current.set(parent)
+            self._finish(span)
+
+    def slowest(self, limit: int = 10, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        The slowest recent traces, each with its spans in start order
+
+        Args:
+            limit: Number of traces
+            name: Only traces whose root span has this name
+
+        Returns:
+            Dicts with trace_id, root span name, duration and spans
+        """
+        with self._lock:
+            finished = [trace for trace in self._traces.values() if trace['root'] is not None]
+        if name:
+            finished = [trace for trace in finished if trace['root'].name == name]
+        finished.sort(key=lambda trace: trace['root'].duration, reverse=True)
+        return [
+            {
+                'trace_id': trace['root'].trace_id,
+                'name': trace['root'].name,
+                'start': trace['root'].start,
+                'duration': trace['root'].duration,
+                'status': trace['root'].status,
+                'spans': [span.to_dict() for span in sorted(trace['spans'], key=lambda span: span.start)]
+            }
+            for trace in finished[:limit]
+        ]
+
+    def _finish(self, span: Span) -> None:
+        with self._lock:
+            trace = self._traces.get(span.trace_id)
+            if trace is None:
+                trace = self._traces[span.trace_id] = {'root': None, 'spans': []}
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            if len(trace['spans']) < self.max_spans_per_trace:
+                trace['spans'].append(span)
+            if span.parent_id is None:
+                trace['root'] = span
+        for exporter in self._exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                print(f"⚠️ Trace exporter {type(exporter).__name__} failed: {e}")
+
+
+# Global tracer
+tracer = Tracer(max_traces=settings.trace_recent_max)
+if settings.trace_file:
+    tracer.add_exporter(JsonLinesExporter(settings.trace_file))
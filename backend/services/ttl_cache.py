@@ -0,0 +1,88 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """In-process LRU cache with a per-entry TTL and optional total size bound"""
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        max_size: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.sizeof = sizeof or (lambda value: 0)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value (refreshing its LRU position), or None if missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value without touching LRU order or hit/miss counters"""
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """Store a value, evicting least recently used entries to stay within bounds"""
+        if key in self._entries:
+            self._remove(key)
+        size = self.sizeof(value)
+        if self.max_size is not None and size > self.max_size:
+            # Never cache a single value larger than the whole cache
+            return
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (value, time.monotonic() + ttl, size)
+        self._size += size
+        while len(self._entries) > self.max_entries or (
+            self.max_size is not None and self._size > self.max_size
+        ):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        """Remove a key if present"""
+        if key in self._entries:
+            self._remove(key)
+
+    def clear(self) -> None:
+        """Remove every entry"""
+        self._entries.clear()
+        self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss/eviction counters and current occupancy"""
+        return {
+            'entries': len(self._entries),
+            'size': self._size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._entries.pop(key)
+        self._size -= size
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import os
+import random
+import re
+import time
+import uuid
+from typing import Dict, List, Optional
+from config import get_settings
+from services.image_data import GeneratedImage, UploadedImage
+from services.post_service import post_service
+from services.storage_service import storage_service, ImageUploadError
+
+settings = get_settings()
+
+# Spool IDs are UUID hex strings; anything else is rejected before touching the disk
+_SPOOL_ID = re.compile(r'^[0-9a-f]{32}$')
+
+class UploadSpool:
+    """
+    Durable on-disk spool for images whose Storage upload failed
+
+    A spooled image is written next to a small JSON record and served by the API at
+    a temporary URL (/api/uploads/{spool_id}), so posts never have to embed the
+    image as a data URL. A background retrier uploads spooled images with
+    exponential backoff, rewrites every post that references the temporary URL to
+    the Storage URL, and keeps redirecting the temporary URL afterwards for copies
+    it could not patch (e.g. theme options still open in a browser).
+
+    Several processes (API and workers) may share the spool directory; a lock file
+    per entry makes sure only one of them uploads it at a time.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._task: Optional[asyncio.Task] = None
+        self.metrics = {'spooled': 0, 'uploaded': 0, 'retries_failed': 0}
+
+    def temporary_url(self, spool_id: str) -> str:
+        """URL that serves a spooled image (and later redirects to its Storage URL)"""
+        return f"{settings.api_base_url.rstrip('/')}/api/uploads/{spool_id}"
+
+    async def spool(self, image: GeneratedImage, folder: str, filename: str) -> str:
+        """
+        Write an image to the spool for a later upload
+
+        Args:
+            image: The image that could not be uploaded
+            folder: Storage folder it should be uploaded to
+            filename: Storage file name
+
+        Returns:
+            Temporary URL serving the image until it is uploaded
+
+        Raises:
+            ImageUploadError: If the image cannot be written to the spool either
+        """
+        spool_id = uuid.uuid4().hex
+        record = {
+            'id': spool_id,
+            'folder': folder,
+            'filename': filename,
+            'mime_type': image.mime_type,
+            'status': 'pending',
+            'attempts': 0,
+            'next_attempt_at': time.time() + settings.upload_retry_base_delay,
+            'created_at': time.time(),
+            'url': None
+        }
+        try:
+            await asyncio.to_thread(self._write_entry, record, image.data)
+        except OSError as e:
+            raise ImageUploadError(f"Failed to spool image: {e}", image=image)
+
+        self.metrics['spooled'] += 1
+        print(f"⚠️ Upload spooled for retry: {folder}/{filename} ({spool_id})")
+        return self.temporary_url(spool_id)
+
+    def read_record(self, spool_id: str) -> Optional[Dict]:
+        """The spool record of an ID, or None if unknown"""
+        if not _SPOOL_ID.match(spool_id):
+            return None
+        try:
+            with open(self._record_path(spool_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def image_path(self, spool_id: str) -> str:
+        """Path of a spooled image file"""
+        return os.path.join(self.directory, f"{spool_id}.img")
+
+    async def start(self) -> None:
+        """Start the background retrier"""
+        if self._task is None:
+            await asyncio.to_thread(os.makedirs, self.directory, exist_ok=True)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background retrier (pending entries stay on disk for the next start)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        """Counters plus the number of entries waiting for upload"""
+        pending = sum(1 for record in self._records() if record.get('status') == 'pending')
+        return {**self.metrics, 'pending': pending}
+
+    async def retry_due(self) -> None:
+        """Upload every pending entry whose backoff has elapsed, and expire old redirects"""
+        now = time.time()
+        for record in await asyncio.to_thread(self._records):
+            if record.get('status') == 'pending' and record['next_attempt_at'] <= now:
+                if await asyncio.to_thread(self._lock, record['id']):
+                    try:
+                        await self._retry(record)
+                    finally:
+                        await asyncio.to_thread(self._unlock, record['id'])
+            elif record.get('status') == 'uploaded' and now - record['created_at'] > settings.upload_spool_retention_seconds:
+                # Catch posts saved with the temporary URL after the upload went through
+                await post_service.replace_image_url(self.temporary_url(record['id']), self._uploaded(record))
+                await asyncio.to_thread(self._remove, self._record_path(record['id']))
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.retry_due()
+            except Exception as e:
+                print(f"⚠️ Upload spool retry pass failed: {e}")
+            await asyncio.sleep(settings.upload_retry_interval)
+
+    async def _retry(self, record: Dict) -> None:
+        # Another process may have handled the entry since it was listed
+        record = await asyncio.to_thread(self.read_record, record['id'])
+        if record is None or record['status'] != 'pending':
+            return
+
+        temporary_url = self.temporary_url(record['id'])
+        try:
+            data = await asyncio.to_thread(self._read_image, record['id'])
+            uploaded = await storage_service.upload_with_derivatives_async(
+                GeneratedImage(data=data, mime_type=record['mime_type']),
+                folder=record['folder'],
+                filename=record['filename']
+            )
+        except Exception as e:
+            record['attempts'] += 1
+            delay = min(settings.upload_retry_max_delay, settings.upload_retry_base_delay * 2 ** record['attempts'])
+            record['next_attempt_at'] = time.time() + random.uniform(delay / 2, delay)
+            await asyncio.to_thread(self._write_record, record)
+            self.metrics['retries_failed'] += 1
+            print(f"⚠️ Spooled upload {record['id']} failed (attempt {record['attempts']}): {e}")
+            return
+
+        record.update({'status': 'uploaded', 'url': uploaded.url, **uploaded.derivative_urls()})
+        await asyncio.to_thread(self._write_record, record)
+        await asyncio.to_thread(self._remove, self.image_path(record['id']))
+        self.metrics['uploaded'] += 1
+        print(f"✅ Spooled upload {record['id']} uploaded after {record['attempts'] + 1} attempts")
+
+        patched = await post_service.replace_image_url(temporary_url, uploaded)
+        if patched:
+            print(f"✅ Patched {patched} posts with the Storage URL")
+
+    @staticmethod
+    def _uploaded(record: Dict) -> UploadedImage:
+        return UploadedImage(url=record['url'], thumbnail_url=record.get('thumbnail_url'), medium_url=record.get('medium_url'))
+
+    def _records(self) -> List[Dict]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        records = []
+        for name in names:
+            if name.endswith('.json'):
+                record = self.read_record(name[:-len('.json')])
+                if record is not None:
+                    records.append(record)
+        return records
+
+    def _write_entry(self, record: Dict, data: bytes) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._write_atomic(self.image_path(record['id']), data)
+        # The record is written last, so a listed record always has its image
+        self._write_record(record)
+
+    def _write_record(self, record: Dict) -> None:
+        self._write_atomic(self._record_path(record['id']), json.dumps(record).encode('utf-8'))
+
+    def _write_atomic(self, path: str, data: bytes) -> None:
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    def _read_image(self, spool_id: str) -> bytes:
+        with open(self.image_path(spool_id), 'rb') as f:
+            return f.read()
+
+    def _record_path(self, spool_id: str) -> str:
+        return os.path.join(self.directory, f"{spool_id}.json")
+
+    def _lock(self, spool_id: str) -> bool:
+        path = os.path.join(self.directory, f"{spool_id}.lock")
+        try:
+            # A lock left behind by a crashed process expires after the longest backoff
+            if time.time() - os.path.getmtime(path) > settings.upload_retry_max_delay:
+                os.remove(path)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            return False
+
+    def _unlock(self, spool_id: str) -> None:
+        self._remove(os.path.join(self.directory, f"{spool_id}.lock"))
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# Create a singleton instance
+upload_spool = UploadSpool(settings.upload_spool_dir)
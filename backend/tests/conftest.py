@@ -0,0 +1,188 @@
+import asyncio
+import copy
+import os
+import sys
+
+# Settings are read once, on first import; give the required ones test values
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+os.environ.setdefault('GEMINI_API_KEY', 'test')
+os.environ.setdefault('FIREBASE_STORAGE_BUCKET', 'test-bucket')
+os.environ['TRACE_FILE'] = ''
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import firebase_admin
+import pytest
+from firebase_admin import credentials
+from google.auth.credentials import AnonymousCredentials
+from google.cloud.firestore import DELETE_FIELD
+
+
+class OfflineCredential(credentials.Base):
+    """Lets services create their Firebase clients without a service account (tests never reach Firebase)"""
+
+    def get_credential(self):
+        return AnonymousCredentials()
+
+
+if not firebase_admin._apps:
+    firebase_admin.initialize_app(OfflineCredential(), {'projectId': 'test', 'storageBucket': 'test-bucket'})
+
+
+@pytest.fixture
+def settings():
+    """The app settings; change them with monkeypatch.setattr so each test starts from the defaults"""
+    from config import get_settings
+    return get_settings()
+
+
+def run(coro):
+    """Run a coroutine to completion in a fresh event loop"""
+    return asyncio.run(coro)
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def collection(self, name):
+        return FakeQuery(self.db, f"{self.path}/{name}")
+
+    async def get(self, field_paths=None):
+        data = self.db.documents.get(self.path)
+        if data is not None and field_paths is not None:
+            data = {field: data[field] for field in field_paths if field in data}
+        return FakeSnapshot(self, data)
+
+    async def set(self, data):
+        self.db.documents[self.path] = copy.deepcopy(data)
+
+    async def update(self, data):
+        if self.path not in self.db.documents:
+            raise KeyError(f"No document to update: {self.path}")
+        document = self.db.documents[self.path]
+        for field, value in data.items():
+            if value is DELETE_FIELD:
+                document.pop(field, None)
+            else:
+                document[field] = copy.deepcopy(value)
+
+    async def delete(self):
+        self.db.documents.pop(self.path, None)
+
+
+class FakeQuery:
+    """A collection (or collection group) with the query methods the services use"""
+
+    def __init__(self, db, path, group=False, filters=(), order=None, fields=None):
+        self.db = db
+        self.path = path
+        self.group = group
+        self.filters = filters
+        self.order = order
+        self.fields = fields
+
+    def document(self, doc_id):
+        return FakeDocument(self.db, f"{self.path}/{doc_id}")
+
+    def where(self, field, op, value):
+        assert op == '==', op
+        return self._with(filters=(*self.filters, (field, value)))
+
+    def order_by(self, field):
+        return self._with(order=field)
+
+    def select(self, fields):
+        return self._with(fields=list(fields))
+
+    async def stream(self):
+        matches = []
+        for path, data in list(self.db.documents.items()):
+            parent = path.rsplit('/', 1)[0]
+            in_scope = parent.rsplit('/', 1)[-1] == self.path if self.group else parent == self.path
+            if in_scope and all(data.get(field) == value for field, value in self.filters):
+                matches.append((path, data))
+        if self.order:
+            matches.sort(key=lambda match: match[1][self.order])
+        for path, data in matches:
+            if self.fields is not None:
+                data = {field: data[field] for field in self.fields if field in data}
+            yield FakeSnapshot(FakeDocument(self.db, path), data)
+
+    def _with(self, **changes):
+        options = {'group': self.group, 'filters': self.filters, 'order': self.order, 'fields': self.fields, **changes}
+        return FakeQuery(self.db, self.path, **options)
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def set(self, reference, data):
+        self.writes.append(('set', reference, data))
+
+    def delete(self, reference):
+        self.writes.append(('delete', reference, None))
+
+    async def commit(self):
+        assert len(self.writes) <= 500, 'Firestore rejects batches of more than 500 writes'
+        self.db.commits.append([(op, reference.path) for op, reference, _ in self.writes])
+        for op, reference, data in self.writes:
+            await (reference.set(data) if op == 'set' else reference.delete())
+
+
+class FakeFirestore:
+    """In-memory stand-in for the async Firestore client: documents keyed by path, batches recorded"""
+
+    def __init__(self):
+        self.documents = {}
+        self.commits = []
+
+    def collection(self, name):
+        return FakeQuery(self, name)
+
+    def collection_group(self, name):
+        return FakeQuery(self, name, group=True)
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+class NoFirestore:
+    def __getattr__(self, name):
+        raise RuntimeError('This test reaches Firestore; use the firestore fixture')
+
+
+@pytest.fixture(autouse=True)
+def no_firestore(monkeypatch):
+    """Fail fast instead of waiting on the network when a test uses the real Firestore client"""
+    from services.firestore_service import firestore_service
+    monkeypatch.setattr(firestore_service, '_db', NoFirestore())
+
+
+@pytest.fixture
+def firestore(monkeypatch):
+    """Point firestore_service at an empty in-memory database (with an empty document cache)"""
+    from services.firestore_service import firestore_service
+
+    db = FakeFirestore()
+    monkeypatch.setattr(firestore_service, '_db', db)
+    for cache in (firestore_service._documents, firestore_service._owners, firestore_service._versions):
+        cache.clear()
+    yield db
+    for cache in (firestore_service._documents, firestore_service._owners, firestore_service._versions):
+        cache.clear()
@@ -0,0 +1,20 @@
+from fastapi.testclient import TestClient
+from main import app
+
+
+def test_operational_endpoints_are_disabled_without_an_admin_token(settings, monkeypatch):
+    monkeypatch.setattr(settings, 'admin_token', '')
+    monkeypatch.setattr(settings, 'debug', True)
+    client = TestClient(app)
+
+    for path in ('/metrics', '/stats', '/debug/traces'):
+        assert client.get(path).status_code == 404
+
+
+def test_admin_token_is_required_when_set(settings, monkeypatch):
+    monkeypatch.setattr(settings, 'admin_token', 'secret')
+    client = TestClient(app)
+
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
@@ -0,0 +1,58 @@
+import pytest
+from services.cache_service import CaptionPool, ImageCache
+
+
+def test_image_cache_key_ignores_case_and_whitespace():
+    assert ImageCache.make_key('A  red\nApple ', 'model') == ImageCache.make_key('a red apple', 'model')
+    assert ImageCache.make_key('a red apple', 'model') != ImageCache.make_key('a red apple', 'other-model')
+
+
+@pytest.fixture
+def pool(settings, monkeypatch):
+    monkeypatch.setattr(settings, 'caption_pool_size', 2)
+    monkeypatch.setattr(settings, 'caption_pool_max_uses', 2)
+    return CaptionPool()
+
+
+def caption(text):
+    return {'caption': text, 'hashtags': ['#tag']}
+
+
+def test_caption_pool_serves_round_robin_until_retired(pool):
+    pool.add('key', caption('one'))
+    pool.add('key', caption('two'))
+
+    served = [pool.take('key') for _ in range(5)]
+
+    assert [entry and entry['caption'] for entry in served] == ['one', 'two', 'one', 'two', None]
+    assert pool.stats()['retired'] == 2
+    assert (pool.hits, pool.misses) == (4, 1)
+
+
+def test_caption_pool_keeps_distinct_captions_up_to_its_size(pool):
+    pool.add('key', caption('one'))
+    pool.add('key', caption('one'))
+    assert pool.needs_refill('key')
+
+    pool.add('key', caption('two'), refill=True)
+    pool.add('key', caption('three'))
+
+    assert not pool.needs_refill('key')
+    assert {pool.take('key')['caption'], pool.take('key')['caption']} == {'one', 'two'}
+    assert pool.refills == 1
+
+
+def test_caption_pool_returns_copies(pool):
+    pool.add('key', caption('one'))
+    pool.take('key')['hashtags'].append('#changed')
+
+    assert pool.take('key')['hashtags'] == ['#tag']
+
+
+def test_caption_pool_drops_expired_captions(settings, monkeypatch):
+    monkeypatch.setattr(settings, 'caption_pool_ttl_seconds', 0)
+    pool = CaptionPool()
+    pool.add('key', caption('one'))
+
+    assert pool.take('key') is None
+    assert pool.needs_refill('key')
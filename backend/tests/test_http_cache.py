@@ -0,0 +1,36 @@
+import pytest
+from fastapi.testclient import TestClient
+
+HEADERS = {'X-User-ID': 'user-1'}
+
+
+@pytest.fixture
+def client(firestore):
+    from main import app
+
+    firestore.documents['themes/theme-1'] = {
+        'id': 'theme-1', 'user_id': 'user-1', 'brand_id': 'brand-1', 'name': 'Summer', 'posts_count': 0,
+        'mood': 'calm', 'colors': [], 'imagery': 'beach', 'tone': 'warm', 'caption_length': 'short',
+        'use_emojis': False, 'use_hashtags': True, 'updated_at': '2024-01-01T00:00:00'
+    }
+    return TestClient(app)
+
+
+def test_unchanged_theme_is_not_modified(client):
+    etag = client.get('/api/themes/theme-1', headers=HEADERS).headers['etag']
+
+    response = client.get('/api/themes/theme-1', headers={**HEADERS, 'If-None-Match': etag})
+
+    assert response.status_code == 304
+
+
+def test_theme_written_by_another_process_is_not_served_from_the_cache(client, firestore):
+    etag = client.get('/api/themes/theme-1', headers=HEADERS).headers['etag']
+    # e.g. worker.py finishing a posts job: the API's document cache does not see the write
+    firestore.documents['themes/theme-1'].update({'name': 'Autumn', 'updated_at': '2024-01-02T00:00:00'})
+
+    response = client.get('/api/themes/theme-1', headers={**HEADERS, 'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.json()['name'] == 'Autumn'
+    assert response.headers['etag'] != etag
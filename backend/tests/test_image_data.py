@@ -0,0 +1,67 @@
+import base64
+import json
+import os
+import pytest
+from services.image_data import GeneratedImage, InlineDataExtractor
+
+FIRST = os.urandom(3001)
+SECOND = bytes(range(256)) * 4
+
+
+def response_body(*images, escape_slashes=False):
+    parts = [{'text': 'Here you go'}]
+    parts += [{'inlineData': {'mimeType': 'image/png', 'data': base64.b64encode(image).decode()}} for image in images]
+    body = json.dumps({'candidates': [{'content': {'parts': parts}}], 'usageMetadata': {'totalTokenCount': 7}})
+    if escape_slashes:
+        body = body.replace('/', '\\/')
+    return body.encode()
+
+
+def extract(body, chunk_size):
+    extractor = InlineDataExtractor()
+    for start in range(0, len(body), chunk_size):
+        extractor.feed(body[start:start + chunk_size])
+    return extractor, extractor.finish()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 64, 1 << 20])
+def test_decodes_every_payload_whatever_the_chunking(chunk_size):
+    extractor, envelope = extract(response_body(FIRST, SECOND), chunk_size)
+
+    assert extractor.payloads == [FIRST, SECOND]
+    parts = envelope['candidates'][0]['content']['parts']
+    assert parts[0] == {'text': 'Here you go'}
+    assert [part['inlineData'] for part in parts[1:]] == [{'mimeType': 'image/png', 'data': ''}] * 2
+    assert envelope['usageMetadata'] == {'totalTokenCount': 7}
+
+
+def test_escaped_slashes_are_decoded():
+    extractor, envelope = extract(response_body(SECOND, escape_slashes=True), 5)
+
+    assert extractor.payloads == [SECOND]
+    assert envelope['candidates'][0]['content']['parts'][1]['inlineData']['mimeType'] == 'image/png'
+
+
+def test_missing_padding_is_tolerated():
+    extractor = InlineDataExtractor()
+    extractor.feed(b'{"data": "' + base64.b64encode(b'ab').rstrip(b'=') + b'"}')
+    extractor.finish()
+
+    assert extractor.payloads == [b'ab']
+
+
+def test_response_ending_inside_data_fails():
+    extractor = InlineDataExtractor()
+    extractor.feed(b'{"data": "QUJD')
+
+    with pytest.raises(ValueError):
+        extractor.finish()
+
+
+def test_generated_image_data_url_round_trip():
+    image = GeneratedImage(data=FIRST, mime_type='image/jpeg')
+    decoded = GeneratedImage.from_data_url(image.to_data_url())
+
+    assert decoded == image
+    assert decoded.extension in ('.jpg', '.jpeg')
+    assert GeneratedImage.from_data_url(base64.b64encode(SECOND).decode()).mime_type == 'image/png'
@@ -0,0 +1,298 @@
+import asyncio
+import pytest
+from conftest import run
+from services.job_queue import JobQueue, JobValidationError
+
+
+async def count_to(user_id, count):
+    for index in range(count):
+        yield {'type': 'post', 'index': index}
+
+
+async def resumable_count_to(user_id, count, completed=()):
+    done = {event['index'] for event in completed}
+    for index in range(count):
+        if index not in done:
+            yield {'type': 'post', 'index': index}
+
+
+async def wait_forever(user_id):
+    yield {'type': 'status', 'message': 'started'}
+    await asyncio.Event().wait()
+
+
+@pytest.fixture
+def queue(tmp_path, settings, monkeypatch):
+    monkeypatch.setattr(settings, 'job_poll_interval', 0.02)
+    queue = JobQueue(str(tmp_path / 'jobs.db'))
+    queue.register('count', count_to)
+    queue.register('resumable', resumable_count_to)
+    queue.register('forever', wait_forever)
+    return queue
+
+
+async def interrupted_job(path, kind, recorded):
+    """A job whose worker stopped heartbeating after recording `recorded` events"""
+    crashed = JobQueue(path)
+    crashed.register(kind, resumable_count_to if kind == 'resumable' else count_to)
+    job = await crashed.submit(kind, 'user-1', {'count': 4})
+    claimed, _ = await crashed._run(crashed._claim)
+    assert claimed.id == job.id
+    for seq in range(1, recorded + 1):
+        await crashed._run(crashed._append_event, job.id, seq, {'type': 'post', 'index': seq - 1})
+    crashed._conn.close()
+    return job
+
+
+def test_submit_dedupes_unfinished_jobs(queue):
+    async def scenario():
+        first = await queue.submit('count', 'user-1', {'count': 2})
+        again = await queue.submit('count', 'user-1', {'count': 2})
+        other_params = await queue.submit('count', 'user-1', {'count': 3})
+        other_user = await queue.submit('count', 'user-2', {'count': 2})
+        forced = await queue.submit('count', 'user-1', {'count': 2}, dedupe=False)
+        return first, again, other_params, other_user, forced
+
+    first, again, other_params, other_user, forced = run(scenario())
+    assert again.id == first.id
+    assert len({first.id, other_params.id, other_user.id, forced.id}) == 4
+
+
+def test_submit_after_finish_queues_a_new_job(queue):
+    async def scenario():
+        await queue.start(workers=1)
+        try:
+            first = await queue.submit('count', 'user-1', {'count': 1})
+            await queue.wait(first.id)
+            return first, await queue.submit('count', 'user-1', {'count': 1})
+        finally:
+            await queue.stop()
+
+    first, second = run(scenario())
+    assert second.id != first.id
+
+
+@pytest.mark.parametrize('kind, params', [
+    ('missing', {}),
+    ('count', {'limit': 2}),
+    ('resumable', {'count': 2, 'completed': []}),
+])
+def test_submit_rejects_invalid_jobs(queue, kind, params):
+    with pytest.raises(JobValidationError):
+        run(queue.submit(kind, 'user-1', params))
+
+
+def test_job_events_are_recorded_in_order(queue):
+    async def scenario():
+        await queue.start(workers=1)
+        try:
+            job = await queue.submit('count', 'user-1', {'count': 3})
+            return await queue.wait(job.id), await queue.events(job.id)
+        finally:
+            await queue.stop()
+
+    job, events = run(scenario())
+    assert job.status == 'complete'
+    assert events == [(seq + 1, {'type': 'post', 'index': seq}) for seq in range(3)]
+
+
+def test_cancel_queued_job(queue):
+    async def scenario():
+        job = await queue.submit('count', 'user-1', {'count': 3})
+        cancelled = await queue.cancel(job.id)
+        return cancelled, await queue.events(job.id)
+
+    job, events = run(scenario())
+    assert job.status == 'cancelled'
+    assert events == [(1, {'type': 'error', 'message': 'Job cancelled'})]
+
+
+def test_cancel_running_job(queue):
+    async def scenario():
+        await queue.start(workers=1)
+        try:
+            job = await queue.submit('forever', 'user-1', {})
+            async for seq, payload in queue.subscribe(job.id):
+                break
+            await queue.cancel(job.id)
+            return await asyncio.wait_for(queue.wait(job.id), timeout=5), await queue.events(job.id)
+        finally:
+            await queue.stop()
+
+    job, events = run(scenario())
+    assert job.status == 'cancelled'
+    assert events[-1] == (2, {'type': 'error', 'message': 'Job cancelled'})
+
+
+def test_expired_lease_is_reclaimed_and_resumed(queue, settings, monkeypatch):
+    monkeypatch.setattr(settings, 'job_lease_seconds', 0.2)
+
+    async def scenario():
+        job = await interrupted_job(queue.path, 'resumable', recorded=2)
+        await asyncio.sleep(0.3)
+        await queue.start(workers=1)
+        try:
+            return await asyncio.wait_for(queue.wait(job.id), timeout=5), await queue.events(job.id)
+        finally:
+            await queue.stop()
+
+    job, events = run(scenario())
+    assert job.status == 'complete'
+    assert job.attempts == 2
+    # Events of the first attempt are kept, and the resumed attempt does not repeat them
+    assert [payload['index'] for _, payload in events] == [0, 1, 2, 3]
+    assert [seq for seq, _ in events] == [1, 2, 3, 4]
+
+
+def test_job_out_of_attempts_fails_and_the_next_job_runs(queue, settings, monkeypatch):
+    monkeypatch.setattr(settings, 'job_lease_seconds', 0.2)
+    monkeypatch.setattr(settings, 'job_max_attempts', 1)
+
+    async def scenario():
+        stuck = await interrupted_job(queue.path, 'resumable', recorded=2)
+        waiting = await queue.submit('count', 'user-1', {'count': 1})
+        await asyncio.sleep(0.3)
+        await queue.start(workers=1)
+        try:
+            events = await asyncio.wait_for(_collect(queue.subscribe(stuck.id, after=2)), timeout=5)
+            return await queue.get(stuck.id), events, await asyncio.wait_for(queue.wait(waiting.id), timeout=5)
+        finally:
+            await queue.stop()
+
+    stuck, events, waiting = run(scenario())
+    assert stuck.status == 'error'
+    assert events == [(3, {'type': 'error', 'message': 'Worker stopped too many times'})]
+    assert waiting.status == 'complete'
+
+
+async def _collect(events):
+    return [event async for event in events]
+
+
+def test_live_lease_is_not_reclaimed(queue):
+    async def scenario():
+        job = await interrupted_job(queue.path, 'resumable', recorded=1)
+        return await queue._run(queue._claim), job
+
+    assert run(scenario())[0] == (None, [])
+
+
+def test_interrupted_job_without_resume_support_fails(queue, settings, monkeypatch):
+    monkeypatch.setattr(settings, 'job_lease_seconds', 0.2)
+
+    async def scenario():
+        job = await interrupted_job(queue.path, 'count', recorded=2)
+        await asyncio.sleep(0.3)
+        await queue.start(workers=1)
+        try:
+            return await asyncio.wait_for(queue.wait(job.id), timeout=5), await queue.events(job.id)
+        finally:
+            await queue.stop()
+
+    job, events = run(scenario())
+    assert job.status == 'error'
+    assert job.error == 'Job was interrupted and cannot be resumed'
+    assert [payload.get('index') for _, payload in events] == [0, 1, None]
+
+
+def test_subscribe_replays_events_after_last_event_id(queue):
+    async def scenario():
+        await queue.start(workers=1)
+        try:
+            job = await queue.submit('count', 'user-1', {'count': 4})
+            await queue.wait(job.id)
+            return [event async for event in queue.subscribe(job.id, after=2)]
+        finally:
+            await queue.stop()
+
+    assert run(scenario()) == [(3, {'type': 'post', 'index': 2}), (4, {'type': 'post', 'index': 3})]
+
+
+def test_job_event_stream_resumes_from_last_event_id_header(queue, monkeypatch):
+    from starlette.requests import Request
+    from routers import themes
+
+    monkeypatch.setattr(themes, 'job_queue', queue)
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def scenario():
+        await queue.start(workers=1)
+        try:
+            job = await queue.submit('count', 'user-1', {'count': 3})
+            await queue.wait(job.id)
+            request = Request({'type': 'http', 'method': 'GET', 'path': '/', 'headers': [], 'query_string': b''}, receive)
+            response = await themes.job_event_stream(request, 'count', 'user-1', {'count': 3}, f"{job.id}:1")
+            return job, [message async for message in response.body_iterator]
+        finally:
+            await queue.stop()
+
+    job, messages = run(scenario())
+    assert [message.splitlines()[0] for message in messages] == [f"id: {job.id}:2", f"id: {job.id}:3"]
+
+
+def test_last_event_id_of_a_job_with_other_params_starts_a_new_job(queue, monkeypatch):
+    from starlette.requests import Request
+    from routers import themes
+
+    monkeypatch.setattr(themes, 'job_queue', queue)
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def scenario():
+        await queue.start(workers=1)
+        try:
+            other = await queue.submit('count', 'user-1', {'count': 3})
+            await queue.wait(other.id)
+            request = Request({'type': 'http', 'method': 'GET', 'path': '/', 'headers': [], 'query_string': b''}, receive)
+            response = await themes.job_event_stream(request, 'count', 'user-1', {'count': 2}, f"{other.id}:1")
+            return other, [message async for message in response.body_iterator]
+        finally:
+            await queue.stop()
+
+    other, messages = run(scenario())
+    job_id = messages[0].splitlines()[0][len('id: '):].rpartition(':')[0]
+    assert job_id != other.id
+    assert [message.splitlines()[0] for message in messages] == [f"id: {job_id}:1", f"id: {job_id}:2"]
+
+
+def test_job_abandoned_by_its_client_is_cancelled(queue, settings, monkeypatch):
+    monkeypatch.setattr(settings, 'stream_disconnect_grace_seconds', 0.05)
+
+    async def scenario():
+        await queue.start(workers=1)
+        try:
+            job = await queue.submit('forever', 'user-1', {})
+            follower = queue.attach(job.id)
+            await asyncio.sleep(0.05)
+            queue.detach(job.id, follower, disconnected=True)
+            return await asyncio.wait_for(queue.wait(job.id), timeout=5), queue.abandoned
+        finally:
+            await queue.stop()
+
+    job, abandoned = run(scenario())
+    assert job.status == 'cancelled'
+    assert abandoned == 1
+
+
+def test_job_followed_from_another_process_is_kept(queue, settings, monkeypatch):
+    monkeypatch.setattr(settings, 'stream_disconnect_grace_seconds', 0.05)
+
+    async def scenario():
+        other = JobQueue(queue.path)
+        await queue.start(workers=1)
+        try:
+            job = await queue.submit('forever', 'user-1', {})
+            follower = queue.attach(job.id)
+            other.attach(job.id)
+            await asyncio.sleep(0.05)
+            queue.detach(job.id, follower, disconnected=True)
+            await asyncio.sleep(0.2)
+            return await queue.get(job.id)
+        finally:
+            await other.stop()
+            await queue.stop()
+
+    assert run(scenario()).status == 'running'
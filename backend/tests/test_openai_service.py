@@ -0,0 +1,51 @@
+import json
+from services.openai_service import JSONArrayStreamParser, brand_fingerprint
+
+THEMES = [
+    {'name': 'Brace {yourself}', 'tags': ['a', 'b]'], 'style': {'mood': 'calm'}},
+    {'name': 'Quote \\"this\\"', 'tags': [], 'style': {}},
+    {'name': 'Last', 'tags': ['z'], 'style': {'mood': 'bold'}},
+]
+
+
+def document():
+    return json.dumps({'intro': {'themes': 'not this one'}, 'themes': THEMES, 'extra': [{'ignored': True}]})
+
+
+def test_objects_are_returned_as_soon_as_they_close():
+    text, parser = document(), JSONArrayStreamParser('themes')
+    completed_at = []
+    for index, char in enumerate(text):
+        for obj in parser.feed(char):
+            completed_at.append((index, obj))
+
+    assert [obj for _, obj in completed_at] == THEMES
+    # Each object is emitted on its own closing brace, not at the end of the document
+    for index, obj in completed_at:
+        assert text[index] == '}'
+        assert text[:index + 1].endswith(json.dumps(obj))
+
+
+def test_any_chunking_yields_the_same_objects():
+    text = document()
+    for size in (2, 5, 17, len(text)):
+        parser = JSONArrayStreamParser('themes')
+        objects = []
+        for start in range(0, len(text), size):
+            objects += parser.feed(text[start:start + size])
+        assert objects == THEMES
+
+
+def test_array_key_split_across_chunks():
+    parser = JSONArrayStreamParser('themes')
+
+    assert parser.feed('{"the') == []
+    assert parser.feed('mes": [{"name": "a"}') == [{'name': 'a'}]
+    assert parser.feed(', {"name": "b"}]}') == [{'name': 'b'}]
+
+
+def test_brand_fingerprint_only_depends_on_prompt_fields():
+    brand = {'name': 'Tacit', 'description': 'Tea shop', 'updated_at': '2024-01-01'}
+
+    assert brand_fingerprint(brand) == brand_fingerprint({**brand, 'updated_at': '2025-01-01'})
+    assert brand_fingerprint(brand) != brand_fingerprint({**brand, 'description': 'Coffee shop'})
@@ -0,0 +1,175 @@
+import copy
+import pytest
+from conftest import run
+from services.post_service import post_service
+
+THEME = 'themes/theme-1'
+
+
+def make_posts(count):
+    return [
+        {'id': f"post-{index}", 'caption': f"Caption {index}", 'image_url': f"https://img/{index}.png", 'selected': index == 1}
+        for index in range(count)
+    ]
+
+
+@pytest.fixture
+def theme(firestore):
+    firestore.documents[THEME] = {'id': 'theme-1', 'user_id': 'user-1', 'updated_at': '2024-01-01T00:00:00'}
+    return firestore
+
+
+def stored_posts(db):
+    prefix = f"{THEME}/posts/"
+    posts = {path[len(prefix):]: data for path, data in db.documents.items() if path.startswith(prefix)}
+    return [posts[post_id] for post_id in sorted(posts, key=lambda post_id: posts[post_id]['position'])]
+
+
+def store(posts, stored=None):
+    return run(post_service.store_theme_posts('theme-1', 'user-1', copy.deepcopy(posts), stored=stored))
+
+
+def test_first_store_writes_every_post_with_bookkeeping_fields(theme):
+    posts = make_posts(3)
+    fields = store(posts)
+
+    assert theme.commits == [[('set', f"{THEME}/posts/post-{index}") for index in range(3)]]
+    assert stored_posts(theme)[2] == {**posts[2], 'theme_id': 'theme-1', 'user_id': 'user-1', 'position': 2}
+    assert fields['generated_posts'] == 3
+    assert fields['selected_posts'] == 1
+    assert fields['cover_image_url'] == 'https://img/1.png'
+    assert theme.documents[THEME]['updated_at'] != '2024-01-01T00:00:00'
+
+
+def test_unchanged_posts_are_not_written(theme):
+    posts = make_posts(3)
+    store(posts)
+    theme.commits.clear()
+    updated_at = theme.documents[THEME]['updated_at']
+
+    fields = store(posts, stored=posts)
+
+    assert theme.commits == []
+    assert 'updated_at' not in fields
+    assert theme.documents[THEME]['updated_at'] == updated_at
+
+
+def test_only_changed_added_and_removed_posts_are_written(theme):
+    before = make_posts(3)
+    store(before)
+    theme.commits.clear()
+
+    after = copy.deepcopy(before)
+    after[0]['caption'] = 'Edited'
+    del after[2]
+    after.append({'id': 'post-new', 'caption': 'New'})
+    store(after, stored=before)
+
+    assert sorted(theme.commits[0]) == sorted([
+        ('set', f"{THEME}/posts/post-0"),
+        ('set', f"{THEME}/posts/post-new"),
+        ('delete', f"{THEME}/posts/post-2"),
+    ])
+    assert [post['id'] for post in stored_posts(theme)] == ['post-0', 'post-1', 'post-new']
+
+
+def test_moved_posts_are_rewritten_with_their_new_position(theme):
+    before = make_posts(3)
+    store(before)
+    theme.commits.clear()
+
+    store([before[1], before[0], before[2]], stored=before)
+
+    assert sorted(theme.commits[0]) == [('set', f"{THEME}/posts/post-0"), ('set', f"{THEME}/posts/post-1")]
+    assert [post['id'] for post in stored_posts(theme)] == ['post-1', 'post-0', 'post-2']
+
+
+def test_without_stored_posts_only_ids_are_read_and_stale_posts_deleted(theme):
+    store(make_posts(3))
+    theme.commits.clear()
+
+    store(make_posts(2))
+
+    assert sorted(theme.commits[0]) == [
+        ('delete', f"{THEME}/posts/post-2"),
+        ('set', f"{THEME}/posts/post-0"),
+        ('set', f"{THEME}/posts/post-1"),
+    ]
+
+
+def test_posts_without_an_id_are_given_one(theme):
+    posts = [{'caption': 'Old post'}, {'caption': 'Other'}]
+    store(posts, stored=[])
+
+    ids = [post['id'] for post in stored_posts(theme)]
+    assert len(set(ids)) == 2 and all(ids)
+
+
+def test_embedded_posts_are_migrated(theme):
+    posts = make_posts(2)
+    theme.documents[THEME]['posts'] = copy.deepcopy(posts)
+
+    store(posts)
+
+    assert 'posts' not in theme.documents[THEME]
+    assert [post['id'] for post in stored_posts(theme)] == ['post-0', 'post-1']
+    assert run(post_service.attach_posts({'id': 'theme-1'}))['posts'] == [{**post, 'theme_id': 'theme-1'} for post in posts]
+
+
+def test_writes_are_split_into_batches_of_500(theme):
+    store(make_posts(501), stored=[])
+
+    assert [len(commit) for commit in theme.commits] == [500, 1]
+
+
+def test_put_post_replaces_the_post_at_its_position(theme):
+    posts = make_posts(2)
+    store(posts)
+    theme.commits.clear()
+
+    replacement = {'id': 'post-regenerated', 'caption': 'Again'}
+    run(post_service.put_post('theme-1', 'user-1', replacement, 1, replaces='post-1', theme_fields={'generated_posts': 2}))
+
+    assert theme.commits == [[('set', f"{THEME}/posts/post-regenerated"), ('delete', f"{THEME}/posts/post-1")]]
+    assert [post['id'] for post in stored_posts(theme)] == ['post-0', 'post-regenerated']
+    assert theme.documents[THEME]['generated_posts'] == 2
+
+
+def test_replace_image_url_patches_posts_across_themes(firestore):
+    from services.image_data import UploadedImage
+
+    for theme_id in ('theme-1', 'theme-2'):
+        firestore.documents[f"themes/{theme_id}"] = {'id': theme_id, 'user_id': 'user-1'}
+        run(post_service.store_theme_posts(theme_id, 'user-1', [{'id': f"{theme_id}-post", 'image_url': 'http://spool/1'}], stored=[]))
+
+    patched = run(post_service.replace_image_url('http://spool/1', UploadedImage(url='https://storage/1.png', thumbnail_url='https://storage/1_thumbnail.webp')))
+
+    assert patched == 2
+    for theme_id in ('theme-1', 'theme-2'):
+        post = firestore.documents[f"themes/{theme_id}/posts/{theme_id}-post"]
+        assert post['image_url'] == 'https://storage/1.png'
+        assert post['thumbnail_url'] == 'https://storage/1_thumbnail.webp'
+        assert firestore.documents[f"themes/{theme_id}"]['cover_image_url'] == 'https://storage/1.png'
+
+
+def test_put_theme_writes_only_the_edited_post(theme):
+    from fastapi.testclient import TestClient
+    from main import app
+
+    theme.documents[THEME].update({
+        'brand_id': 'brand-1', 'name': 'Summer', 'posts_count': 3, 'mood': 'calm', 'colors': [], 'imagery': 'beach',
+        'tone': 'warm', 'caption_length': 'short', 'use_emojis': False, 'use_hashtags': True
+    })
+    # Stored like generated posts: optional fields such as medium_url left out
+    store([{**post, 'theme_id': 'theme-1', 'hashtags': [], 'post_type': 'photo'} for post in make_posts(3)], stored=[])
+    theme.commits.clear()
+    client = TestClient(app)
+    headers = {'X-User-ID': 'user-1'}
+    posts = client.get('/api/themes/theme-1/posts', headers=headers).json()
+    posts[1]['caption'] = 'Edited'
+
+    response = client.put('/api/themes/theme-1', json={'posts': posts}, headers=headers)
+
+    assert response.status_code == 200
+    assert theme.commits == [[('set', f"{THEME}/posts/post-1")]]
+    assert stored_posts(theme)[1]['caption'] == 'Edited'
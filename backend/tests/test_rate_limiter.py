@@ -0,0 +1,182 @@
+import asyncio
+import time
+import pytest
+from conftest import run
+from services.rate_limiter import AdaptiveLimiter, ProviderHTTPError, parse_retry_after
+
+
+def limiter(**overrides):
+    options = {'requests_per_minute': 6000, 'max_concurrency': 4, 'cooldown_seconds': 60}
+    return AdaptiveLimiter('test/model', **{**options, **overrides})
+
+
+async def hold(limiter, release: asyncio.Event, status_code=200):
+    async with limiter.slot() as permit:
+        await release.wait()
+        permit.observe(status_code)
+
+
+def test_concurrency_is_capped_by_the_window():
+    async def scenario():
+        test_limiter, release = limiter(max_concurrency=2), asyncio.Event()
+        tasks = [asyncio.create_task(hold(test_limiter, release)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        waiting = test_limiter.in_flight
+        release.set()
+        await asyncio.gather(*tasks)
+        return waiting, test_limiter.stats()
+
+    waiting, stats = run(scenario())
+    assert waiting == 2
+    assert stats['in_flight'] == 0
+    assert stats['admitted'] == 3
+
+
+def test_throttling_halves_the_window_once_per_cooldown():
+    async def scenario():
+        test_limiter = limiter()
+        for _ in range(3):
+            async with test_limiter.slot() as permit:
+                permit.observe(429)
+        return test_limiter
+
+    test_limiter = run(scenario())
+    assert test_limiter.window == 2
+    assert test_limiter.throttled == 3
+
+
+def test_provider_error_counts_as_observed():
+    async def scenario():
+        test_limiter = limiter(cooldown_seconds=0)
+        for _ in range(2):
+            with pytest.raises(ProviderHTTPError):
+                async with test_limiter.slot():
+                    raise ProviderHTTPError('overloaded', 503)
+        return test_limiter
+
+    test_limiter = run(scenario())
+    assert test_limiter.window == 1
+    assert test_limiter.throttled == 2
+
+
+def test_successes_grow_the_window_back_to_its_maximum():
+    async def scenario():
+        test_limiter = limiter(cooldown_seconds=0)
+        async with test_limiter.slot() as permit:
+            permit.observe(429)
+        shrunk = test_limiter.window
+        for _ in range(20):
+            async with test_limiter.slot() as permit:
+                permit.observe(200)
+        return shrunk, test_limiter.window
+
+    shrunk, grown = run(scenario())
+    assert shrunk == 2
+    assert grown == 4
+
+
+def test_retry_after_pauses_new_requests():
+    async def scenario():
+        test_limiter = limiter()
+        async with test_limiter.slot() as permit:
+            permit.observe(429, '0.2')
+        started = time.monotonic()
+        async with test_limiter.slot():
+            pass
+        return time.monotonic() - started
+
+    assert run(scenario()) >= 0.15
+
+
+def test_token_bucket_caps_the_request_rate():
+    async def scenario():
+        test_limiter = limiter(requests_per_minute=600, burst=2)
+        started = time.monotonic()
+        for _ in range(3):
+            async with test_limiter.slot():
+                pass
+        return time.monotonic() - started
+
+    # Two requests fit in the burst; the third waits for a token (10 per second)
+    assert 0.05 <= run(scenario()) < 1
+
+
+def test_cancelled_caller_releases_its_slot():
+    async def scenario():
+        test_limiter, release = limiter(max_concurrency=1), asyncio.Event()
+        task = asyncio.create_task(hold(test_limiter, release))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        async with test_limiter.slot():
+            pass
+        return test_limiter.stats()
+
+    stats = run(scenario())
+    assert stats['cancelled'] == 1
+    assert stats['in_flight'] == 0
+
+
+@pytest.mark.parametrize('callbacks', range(6))
+def test_cancelled_waiter_is_never_admitted(callbacks):
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        test_limiter, admitted = limiter(requests_per_minute=60, max_concurrency=2, burst=1), []
+
+        async def wait_for_token():
+            async with test_limiter.slot():
+                admitted.append(asyncio.current_task().cancelling())
+
+        def cancel_after(remaining):
+            if remaining:
+                loop.call_soon(cancel_after, remaining - 1)
+            else:
+                waiter.cancel()
+
+        async with test_limiter.slot():
+            waiter = asyncio.create_task(wait_for_token())
+            await asyncio.sleep(0.01)
+            test_limiter._tokens = 1.0
+        # Cancel the waiter at each point between the release waking it and it taking the token
+        cancel_after(callbacks)
+        await asyncio.gather(waiter, return_exceptions=True)
+        return test_limiter, admitted, waiter
+
+    test_limiter, admitted, waiter = run(scenario())
+    # Either the cancel lands first and the waiter never gets a slot, or it had the slot first
+    assert waiter.cancelled() == (admitted == [])
+    assert admitted in ([], [0])
+    assert test_limiter.stats()['in_flight'] == 0
+
+
+def test_cancelling_a_caller_twice_does_not_leak_its_slot():
+    async def scenario():
+        test_limiter, release = limiter(max_concurrency=1), asyncio.Event()
+        holder = asyncio.create_task(hold(test_limiter, release))
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.create_task(hold(test_limiter, release)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        holder.cancel()
+        await asyncio.sleep(0)
+        holder.cancel()
+        await asyncio.gather(holder, return_exceptions=True)
+        release.set()
+        await asyncio.wait_for(asyncio.gather(*waiters), timeout=1)
+        return test_limiter.stats()
+
+    stats = run(scenario())
+    assert stats['in_flight'] == 0
+    assert stats['admitted'] == 3
+
+
+@pytest.mark.parametrize('value, expected', [
+    (None, None),
+    ('', None),
+    ('12', 12.0),
+    ('1.5', 1.5),
+    ('30s', 30.0),
+    ('soon', None),
+    ('Wed, 21 Oct 2015 07:28:00 GMT', 0.0),
+])
+def test_parse_retry_after(value, expected):
+    assert parse_retry_after(value) == expected
@@ -0,0 +1,125 @@
+import asyncio
+import pytest
+from conftest import run
+from services.rate_limiter import ProviderHTTPError
+from services.resilience import AttemptTimeout, ResilientCaller
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(settings, monkeypatch):
+    monkeypatch.setattr(settings, 'retry_base_delay', 0.01)
+    monkeypatch.setattr(settings, 'retry_max_delay', 0.02)
+    monkeypatch.setattr(settings, 'hedge_min_samples', 5)
+
+
+def caller(**overrides):
+    options = {'max_attempts': 3, 'attempt_timeout': 1.0, 'total_budget': 5.0}
+    return ResilientCaller('test', **{**options, **overrides})
+
+
+def scripted(*outcomes):
+    """Request factory whose n-th call sleeps outcomes[n][0] seconds, then raises or returns outcomes[n][1]"""
+    calls = []
+
+    async def request():
+        delay, result = outcomes[min(len(calls), len(outcomes) - 1)]
+        calls.append(result)
+        await asyncio.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return request, calls
+
+
+def test_retries_transient_errors():
+    request, calls = scripted((0, ProviderHTTPError('busy', 429)), (0, ProviderHTTPError('down', 503)), (0, 'ok'))
+    test_caller = caller()
+
+    assert run(test_caller.call(request)) == 'ok'
+    assert len(calls) == 3
+    assert test_caller.metrics['retries'] == 2
+
+
+def test_gives_up_after_max_attempts():
+    request, calls = scripted((0, ProviderHTTPError('down', 503)))
+    test_caller = caller()
+
+    with pytest.raises(ProviderHTTPError):
+        run(test_caller.call(request))
+    assert len(calls) == 3
+    assert test_caller.metrics['failures'] == 1
+
+
+def test_does_not_retry_client_errors():
+    request, calls = scripted((0, ProviderHTTPError('bad request', 400)))
+
+    with pytest.raises(ProviderHTTPError):
+        run(caller().call(request))
+    assert len(calls) == 1
+
+
+def test_retry_after_longer_than_the_budget_fails_fast():
+    request, calls = scripted((0, ProviderHTTPError('busy', 429, retry_after=60)))
+
+    with pytest.raises(ProviderHTTPError):
+        run(caller().call(request))
+    assert len(calls) == 1
+
+
+def test_slow_attempt_times_out_and_is_retried():
+    request, calls = scripted((1.0, 'slow'), (0, 'fast'))
+    test_caller = caller(attempt_timeout=0.05)
+
+    assert run(test_caller.call(request)) == 'fast'
+    assert test_caller.metrics['attempt_timeouts'] == 1
+
+
+def test_attempts_stop_at_the_total_budget():
+    request, calls = scripted((1.0, 'slow'))
+    test_caller = caller(max_attempts=10, attempt_timeout=0.05, total_budget=0.12)
+
+    with pytest.raises(AttemptTimeout):
+        run(test_caller.call(request))
+    assert len(calls) < 10
+
+
+def warm_up(test_caller, latency=0.001):
+    # Enough fast samples that the calls under test do not move the p95
+    for _ in range(100):
+        test_caller.latency.record(latency)
+
+
+def test_hedge_wins_over_a_slow_primary():
+    request, calls = scripted((1.0, 'primary'), (0, 'hedge'))
+    test_caller = caller(hedge=True)
+    warm_up(test_caller)
+
+    assert run(test_caller.call(request)) == 'hedge'
+    assert test_caller.metrics['hedges'] == 1
+    assert test_caller.metrics['hedge_wins'] == 1
+
+
+def test_no_hedging_before_enough_latency_samples():
+    request, calls = scripted((0.05, 'primary'), (0, 'hedge'))
+    test_caller = caller(hedge=True)
+
+    assert run(test_caller.call(request)) == 'primary'
+    assert test_caller.metrics['hedges'] == 0
+
+
+def test_hedges_are_capped_by_the_budget(settings, monkeypatch):
+    monkeypatch.setattr(settings, 'hedge_budget_ratio', 0.5)
+    test_caller = caller(hedge=True)
+    warm_up(test_caller, latency=0.01)
+
+    async def scenario():
+        for _ in range(4):
+            request, _ = scripted((0.05, 'primary'))
+            await test_caller.call(request)
+
+    run(scenario())
+    # 4 calls with a ratio of 0.5: 2 hedges at most, the other slow calls go unhedged
+    assert test_caller.metrics['hedges'] == 2
+    assert test_caller.metrics['hedges_skipped_budget'] == 2
+    assert test_caller.metrics['requests'] == 6
@@ -0,0 +1,166 @@
+import asyncio
+from conftest import run
+from services.single_flight import SingleFlight
+
+
+class Source:
+    """Underlying call that waits for `release`, counting starts and cancellations"""
+
+    def __init__(self):
+        self.started = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def call(self):
+        self.started += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return {'items': [self.started]}
+
+
+def test_concurrent_callers_share_one_call():
+    async def scenario():
+        flight, source = SingleFlight('test'), Source()
+        callers = [asyncio.create_task(flight.do('key', source.call)) for _ in range(3)]
+        await asyncio.sleep(0)
+        source.release.set()
+        return flight, source, await asyncio.gather(*callers)
+
+    flight, source, results = run(scenario())
+    assert source.started == 1
+    assert results == [{'items': [1]}] * 3
+    # Every caller gets its own copy
+    assert len({id(result) for result in results}) == 3
+    assert flight.stats() == {'calls': 1, 'coalesced': 2, 'abandoned': 0, 'in_flight': 0}
+
+
+def test_cancelling_one_caller_keeps_the_call_for_the_others():
+    async def scenario():
+        flight, source = SingleFlight('test'), Source()
+        first = asyncio.create_task(flight.do('key', source.call))
+        second = asyncio.create_task(flight.do('key', source.call))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        source.release.set()
+        return flight, source, first, await second
+
+    flight, source, first, result = run(scenario())
+    assert first.cancelled()
+    assert result == {'items': [1]}
+    assert source.cancelled == 0
+    assert flight.metrics['abandoned'] == 0
+
+
+def test_cancelling_the_last_caller_cancels_the_call():
+    async def scenario():
+        flight, source = SingleFlight('test'), Source()
+        caller = asyncio.create_task(flight.do('key', source.call))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.gather(caller, return_exceptions=True)
+        await asyncio.sleep(0)
+        cancelled = source.cancelled
+        # A new caller starts a new call instead of joining the cancelled one
+        source.release.set()
+        return flight, cancelled, await flight.do('key', source.call)
+
+    flight, cancelled, result = run(scenario())
+    assert cancelled == 1
+    assert result == {'items': [2]}
+    assert flight.metrics['abandoned'] == 1
+
+
+def test_errors_are_shared_and_not_cached():
+    async def scenario():
+        flight, attempts = SingleFlight('test'), []
+
+        async def failing():
+            attempts.append(1)
+            await asyncio.sleep(0.01)
+            raise ValueError('provider failed')
+
+        results = await asyncio.gather(flight.do('key', failing), flight.do('key', failing), return_exceptions=True)
+        await asyncio.gather(flight.do('key', failing), return_exceptions=True)
+        return results, len(attempts)
+
+    results, attempts = run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert attempts == 2
+
+
+async def produce(count, produced, gate):
+    # Only the first item is produced before the gate opens
+    for index in range(count):
+        if index:
+            await gate.wait()
+        produced.append(index)
+        yield {'index': index}
+
+
+def test_late_stream_subscriber_replays_earlier_items():
+    async def scenario():
+        flight, produced, gate = SingleFlight('test'), [], asyncio.Event()
+        first = flight.stream('key', lambda: produce(3, produced, gate))
+        items = [await first.__anext__()]
+
+        async def follow_late():
+            return [item async for item in flight.stream('key', lambda: produce(3, produced, gate))]
+
+        late = asyncio.create_task(follow_late())
+        await asyncio.sleep(0)
+        gate.set()
+        items += [item async for item in first]
+        return items, await late, produced
+
+    items, late, produced = run(scenario())
+    assert items == late == [{'index': 0}, {'index': 1}, {'index': 2}]
+    assert produced == [0, 1, 2]
+
+
+def test_stream_is_cancelled_once_every_subscriber_leaves():
+    async def scenario():
+        flight, produced, gate = SingleFlight('test'), [], asyncio.Event()
+        first = flight.stream('key', lambda: produce(100, produced, gate))
+        second = flight.stream('key', lambda: produce(100, produced, gate))
+        await first.__anext__()
+        await second.__anext__()
+        await first.aclose()
+        still_running = flight.stats()['in_flight']
+        await second.aclose()
+        await asyncio.sleep(0)
+        return flight, still_running, produced
+
+    flight, still_running, produced = run(scenario())
+    assert still_running == 1
+    assert flight.stats()['in_flight'] == 0
+    assert flight.metrics['abandoned'] == 1
+    assert produced == [0]
+
+
+def test_fresh_images_are_not_shared_with_requests_in_flight(monkeypatch):
+    from services.gemini_service import GeminiImageGenerator
+    from services.image_data import GeneratedImage
+
+    generator = GeminiImageGenerator()
+    source = Source()
+
+    async def generate(prompt, cache_key):
+        await source.call()
+        return GeneratedImage(data=bytes([source.started]), mime_type='image/png')
+
+    monkeypatch.setattr(generator, '_generate_uncached', generate)
+
+    async def scenario():
+        cached = asyncio.create_task(generator.generate_image('A beach at dawn'))
+        fresh = [asyncio.create_task(generator.generate_image('A beach at dawn', use_cache=False)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        source.release.set()
+        await asyncio.gather(cached, *fresh)
+
+    run(scenario())
+    assert source.started == 3
+    assert generator.image_flights.stats()['coalesced'] == 0
@@ -0,0 +1,58 @@
+import threading
+import pytest
+from conftest import run
+from services.image_data import GeneratedImage
+from services.image_derivatives import derivative_renderer
+from services.storage_service import ImageUploadError, storage_service
+
+IMAGE = GeneratedImage(data=b'\x89PNG fake image bytes', mime_type='image/png')
+
+
+class FakeBucket:
+    """Uploads that succeed except for the original, which fails once every derivative is stored"""
+
+    def __init__(self):
+        self.stored = set()
+        self.derivatives_stored = threading.Event()
+        self.emptied = threading.Event()
+
+    def upload_image(self, image, folder, filename, mime_type=None, cancelled=None):
+        path = f"{folder}/{filename}"
+        if filename.endswith('.webp'):
+            self.stored.add(path)
+            if len(self.stored) == 2:
+                self.derivatives_stored.set()
+            return f"https://storage/{path}"
+        self.derivatives_stored.wait(timeout=5)
+        raise ImageUploadError('Storage unavailable', image=image)
+
+    def delete_image(self, path):
+        self.stored.discard(path)
+        if not self.stored:
+            self.emptied.set()
+        return True
+
+
+@pytest.fixture
+def bucket(settings, monkeypatch):
+    bucket = FakeBucket()
+    monkeypatch.setattr(settings, 'image_derivatives', True)
+    monkeypatch.setattr(storage_service, 'upload_image', bucket.upload_image)
+    monkeypatch.setattr(storage_service, 'delete_image', bucket.delete_image)
+
+    async def render(image):
+        return {'thumbnail': image, 'medium': image}
+
+    monkeypatch.setattr(derivative_renderer, 'render', render)
+    return bucket
+
+
+def test_derivatives_are_deleted_when_the_original_upload_fails(bucket):
+    async def scenario():
+        with pytest.raises(ImageUploadError):
+            await storage_service.upload_with_derivatives_async(IMAGE, 'posts', '1.png')
+
+    run(scenario())
+    # Deletes run on the upload threads after the error is raised
+    assert bucket.emptied.wait(timeout=5)
+    assert bucket.stored == set()
@@ -0,0 +1,46 @@
+from services.ttl_cache import TTLCache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_entries=2, ttl_seconds=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.peek('a') == 1
+    assert cache.peek('b') is None
+    assert cache.peek('c') == 3
+    assert cache.evictions == 1
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(max_entries=10, ttl_seconds=60)
+    cache.set('fresh', 1)
+    cache.set('stale', 2, ttl_seconds=0)
+
+    assert cache.get('fresh') == 1
+    assert cache.get('stale') is None
+    assert cache.stats()['entries'] == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_ttl_cache_size_bound():
+    cache = TTLCache(max_entries=10, ttl_seconds=60, max_size=10, sizeof=len)
+    cache.set('a', 'xxxx')
+    cache.set('b', 'xxxx')
+    cache.set('c', 'xxxx')
+    cache.set('huge', 'x' * 11)
+
+    assert cache.peek('a') is None
+    assert cache.peek('huge') is None
+    assert cache.stats()['size'] == 8
+
+
+def test_ttl_cache_replacing_a_key_updates_its_size():
+    cache = TTLCache(max_entries=10, ttl_seconds=60, max_size=10, sizeof=len)
+    cache.set('a', 'xxxx')
+    cache.set('a', 'xx')
+    cache.delete('a')
+
+    assert cache.stats()['size'] == 0
@@ -0,0 +1,119 @@
+import os
+import pytest
+from fastapi.testclient import TestClient
+from conftest import run
+from services import upload_spool as upload_spool_module
+from services.image_data import GeneratedImage, UploadedImage
+from services.post_service import post_service
+from services.storage_service import ImageUploadError
+from services.upload_spool import UploadSpool
+
+IMAGE = GeneratedImage(data=b'\x89PNG fake image bytes', mime_type='image/png')
+UPLOADED = UploadedImage(url='https://storage/posts/1.png', thumbnail_url='https://storage/posts/1_thumbnail.webp')
+
+
+class FlakyStorage:
+    """Storage upload that fails `failures` times before it succeeds"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.uploads = []
+
+    async def upload_with_derivatives_async(self, image, folder, filename):
+        self.uploads.append((image.data, folder, filename))
+        if len(self.uploads) <= self.failures:
+            raise ImageUploadError('Storage unavailable')
+        return UPLOADED
+
+
+@pytest.fixture
+def spool(tmp_path, settings, monkeypatch):
+    monkeypatch.setattr(settings, 'upload_retry_base_delay', 0)
+    return UploadSpool(str(tmp_path / 'spool'))
+
+
+def use_storage(monkeypatch, failures):
+    storage = FlakyStorage(failures)
+    monkeypatch.setattr(upload_spool_module, 'storage_service', storage)
+    return storage
+
+
+def spool_id(url):
+    return url.rsplit('/', 1)[-1]
+
+
+def test_spooled_image_is_retried_until_uploaded(spool, firestore, monkeypatch):
+    storage = use_storage(monkeypatch, failures=2)
+    url = run(spool.spool(IMAGE, 'posts', '1.png'))
+    record_id = spool_id(url)
+    firestore.documents['themes/theme-1'] = {'id': 'theme-1', 'user_id': 'user-1'}
+    run(post_service.store_theme_posts('theme-1', 'user-1', [{'id': 'post-1', 'image_url': url}], stored=[]))
+
+    run(spool.retry_due())
+    run(spool.retry_due())
+    assert spool.read_record(record_id)['status'] == 'pending'
+    assert spool.read_record(record_id)['attempts'] == 2
+
+    run(spool.retry_due())
+
+    record = spool.read_record(record_id)
+    assert record['status'] == 'uploaded'
+    assert record['url'] == UPLOADED.url
+    assert not os.path.exists(spool.image_path(record_id))
+    assert storage.uploads == [(IMAGE.data, 'posts', '1.png')] * 3
+    assert spool.stats() == {'spooled': 1, 'uploaded': 1, 'retries_failed': 2, 'pending': 0}
+    post = firestore.documents['themes/theme-1/posts/post-1']
+    assert (post['image_url'], post['thumbnail_url']) == (UPLOADED.url, UPLOADED.thumbnail_url)
+
+
+def test_failed_retry_backs_off(spool, settings, monkeypatch):
+    use_storage(monkeypatch, failures=1)
+    url = run(spool.spool(IMAGE, 'posts', '1.png'))
+    monkeypatch.setattr(settings, 'upload_retry_base_delay', 30)
+
+    run(spool.retry_due())
+    run(spool.retry_due())
+
+    record = spool.read_record(spool_id(url))
+    assert record['attempts'] == 1
+    assert record['status'] == 'pending'
+
+
+def test_entry_locked_by_another_process_is_skipped(spool, firestore, monkeypatch):
+    storage = use_storage(monkeypatch, failures=0)
+    record_id = spool_id(run(spool.spool(IMAGE, 'posts', '1.png')))
+    assert spool._lock(record_id)
+
+    run(spool.retry_due())
+    assert storage.uploads == []
+
+    spool._unlock(record_id)
+    run(spool.retry_due())
+    assert spool.read_record(record_id)['status'] == 'uploaded'
+
+
+def test_unknown_or_malformed_ids_are_rejected(spool):
+    assert spool.read_record('0' * 32) is None
+    assert spool.read_record('../../etc/passwd') is None
+
+
+def test_temporary_url_serves_the_image_then_redirects(spool, firestore, monkeypatch):
+    from main import app
+    from routers import uploads
+
+    use_storage(monkeypatch, failures=0)
+    monkeypatch.setattr(uploads, 'upload_spool', spool)
+    client = TestClient(app)
+    path = f"/api/uploads/{spool_id(run(spool.spool(IMAGE, 'posts', '1.png')))}"
+
+    pending = client.get(path)
+    assert pending.status_code == 200
+    assert pending.content == IMAGE.data
+    assert pending.headers['content-type'] == 'image/png'
+
+    run(spool.retry_due())
+
+    uploaded = client.get(path, follow_redirects=False)
+    assert uploaded.status_code == 301
+    assert uploaded.headers['location'] == UPLOADED.url
+    assert client.get('/api/uploads/not-a-spool-id').status_code == 404
@@ -0,0 +1,41 @@
+"""
+Standalone generation worker.
+
+Runs the job queue's worker pool without the API, sharing the same SQLite queue
+file. Start the API with JOB_WORKERS=0 to make it submit-only and scale generation
+by running more of these:
+
+    python worker.py
+"""
+import asyncio
+
+async def main():
+    # Imported here, not at module level: derivative render processes are spawned and
+    # re-import this script, and must not load the app's services and Firebase
+    from config import get_settings
+    from services import generation_jobs  # registers the generation job handlers
+    from services.gemini_service import gemini_generator
+    from services.job_queue import job_queue
+    from services.storage_service import storage_service
+    from services.upload_spool import upload_spool
+    from services.tracing import tracer
+
+    settings = get_settings()
+    await gemini_generator.start()
+    await job_queue.start(max(1, settings.job_workers))
+    await upload_spool.start()
+    try:
+        # Workers run until the process is stopped
+        await asyncio.Event().wait()
+    finally:
+        await upload_spool.stop()
+        await job_queue.stop()
+        await gemini_generator.close()
+        storage_service.shutdown()
+        tracer.shutdown()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("Worker stopped")
@@ -51,6 +51,8 @@ export interface PostData {
   id: string;
   themeId: string;
   imageUrl: string;
+  thumbnailUrl?: string;
+  mediumUrl?: string;
   caption: string;
   hashtags: string[];
   postType: string;
@@ -415,7 +417,9 @@ export default function App() {
             captionLength: data.theme.caption_length,
             useEmojis: data.theme.use_emojis,
             useHashtags: data.theme.use_hashtags,
-            imageUrl: data.theme.image_url
+            imageUrl: data.theme.image_url,
+            thumbnailUrl: data.theme.thumbnail_url,
+            mediumUrl: data.theme.medium_url
           };
 
           setThemeOptions(prev => [...prev, themeOption]);
@@ -435,6 +439,11 @@ export default function App() {
       };
 
       eventSourceWithAuth.onerror = (error) => {
+        if (eventSourceWithAuth.readyState === EventSource.CONNECTING) {
+          // The browser reconnects with Last-Event-ID and the server resumes the stream
+          console.warn('SSE connection lost, reconnecting...');
+          return;
+        }
         console.error('SSE connection error:', error);
         setIsGenerating(false);
         eventSourceWithAuth.close();
@@ -507,7 +516,9 @@ export default function App() {
         tone: themeParams.tone,
         caption_length: themeParams.captionLength,
         use_emojis: themeParams.useEmojis.toString(),
-        use_hashtags: themeParams.useHashtags.toString()
+        use_hashtags: themeParams.useHashtags.toString(),
+        // The user asked for new variations, so skip the image cache
+        fresh: 'true'
       });
 
       // Connect to SSE endpoint for regenerating images
@@ -530,7 +541,9 @@ export default function App() {
             captionLength: data.theme.caption_length,
             useEmojis: data.theme.use_emojis,
             useHashtags: data.theme.use_hashtags,
-            imageUrl: data.theme.image_url
+            imageUrl: data.theme.image_url,
+            thumbnailUrl: data.theme.thumbnail_url,
+            mediumUrl: data.theme.medium_url
           };
 
           setThemeOptions(prev => [...prev, themeOption]);
@@ -549,6 +562,11 @@ export default function App() {
       };
 
       eventSourceWithAuth.onerror = (error) => {
+        if (eventSourceWithAuth.readyState === EventSource.CONNECTING) {
+          // The browser reconnects with Last-Event-ID and the server resumes the stream
+          console.warn('SSE connection lost, reconnecting...');
+          return;
+        }
         console.error('SSE connection error:', error);
         setIsGenerating(false);
         eventSourceWithAuth.close();
@@ -570,10 +588,14 @@ export default function App() {
       setIsGenerating(true);
       setGeneratingPosts([]);
 
+      // Posts stream in completion order; keep them in their theme position
+      const receivedPosts: (PostData | undefined)[] = [];
+
       // Connect to SSE endpoint for streaming posts
       const userId = localStorage.getItem('userId');
+      const brandId = themes.find(t => t.id === themeId)?.brandId || selectedBrandId || '';
       const eventSourceWithAuth = new EventSource(
-        `${API_BASE_URL}/api/themes/${themeId}/generate-posts-stream?user_id=${userId}`
+        `${API_BASE_URL}/api/themes/${themeId}/generate-posts-stream?user_id=${userId}&brand_id=${brandId}`
       );
 
       eventSourceWithAuth.onmessage = (event) => {
@@ -586,6 +608,8 @@ export default function App() {
             id: data.post.id,
             themeId: data.post.theme_id,
             imageUrl: data.post.image_url,
+            thumbnailUrl: data.post.thumbnail_url,
+            mediumUrl: data.post.medium_url,
             caption: data.post.caption,
             hashtags: data.post.hashtags,
             postType: data.post.post_type,
@@ -594,8 +618,12 @@ export default function App() {
             status: data.post.status,
           };
 
-          // Add to generating posts array (shown on right side)
-          setGeneratingPosts(prev => [...prev, newPost]);
+          receivedPosts[data.index - 1] = newPost;
+          const orderedPosts = receivedPosts.filter((p): p is PostData => !!p);
+          const orderedIds = new Set(orderedPosts.map(p => p.id));
+
+          // Update generating posts array (shown on right side)
+          setGeneratingPosts(orderedPosts);
 
           // Also update theme with new post
           setThemes(prevThemes =>
@@ -603,7 +631,7 @@ export default function App() {
               if (t.id === themeId) {
                 return {
                   ...t,
-                  posts: [...(t.posts || []), newPost]
+                  posts: [...(t.posts || []).filter(p => !orderedIds.has(p.id)), ...orderedPosts]
                 };
               }
               return t;
@@ -625,6 +653,11 @@ export default function App() {
       };
 
       eventSourceWithAuth.onerror = (error) => {
+        if (eventSourceWithAuth.readyState === EventSource.CONNECTING) {
+          // The browser reconnects with Last-Event-ID and the server resumes the stream
+          console.warn('SSE connection lost, reconnecting...');
+          return;
+        }
         console.error('SSE connection error:', error);
         setIsGenerating(false);
         eventSourceWithAuth.close();
@@ -165,7 +165,7 @@ function SavedPostGridItem({ post, onClick, onSchedule, onRemove }: {
       onMouseLeave={() => setIsHovered(false)}
     >
       <img
-        src={post.imageUrl}
+        src={post.thumbnailUrl || post.imageUrl}
         alt="Post"
         className="w-full h-full object-cover"
       />
@@ -15,6 +15,8 @@ interface ThemeOption {
   useEmojis: boolean;
   useHashtags: boolean;
   imageUrl: string;
+  thumbnailUrl?: string;
+  mediumUrl?: string;
 }
 
 interface ThemeProposalScreenProps {
@@ -403,7 +405,7 @@ export function ThemeProposalScreen({
                 <div className="relative">
                   {themeOptions.length > 0 && themeOptions[selectedThemeIndex] ? (
                     <img
-                      src={themeOptions[selectedThemeIndex].imageUrl}
+                      src={themeOptions[selectedThemeIndex].mediumUrl || themeOptions[selectedThemeIndex].imageUrl}
                       alt="Instagram post preview"
                       className="w-full aspect-square object-cover"
                     />
@@ -456,7 +458,7 @@ export function ThemeProposalScreen({
                         }}
                       >
                         <img
-                          src={theme.imageUrl}
+                          src={theme.thumbnailUrl || theme.imageUrl}
                           alt={theme.name}
                           className="w-full aspect-square object-cover"
                         />
@@ -11,6 +11,8 @@ interface ThemeOption {
   useEmojis: boolean;
   useHashtags: boolean;
   imageUrl: string;
+  thumbnailUrl?: string;
+  mediumUrl?: string;
 }
 
 interface ThemeSelectionScreenProps {
@@ -106,7 +108,7 @@ function ThemeCard({ theme, index, onSelect }: {
       {/* Image */}
       <div className="relative aspect-square rounded-lg overflow-hidden mb-4 border-2 border-gray-200 group-hover:border-indigo-500 transition-all group-hover:shadow-lg">
         <img
-          src={theme.imageUrl}
+          src={theme.thumbnailUrl || theme.imageUrl}
           alt={theme.name}
           className="w-full h-full object-cover"
         />